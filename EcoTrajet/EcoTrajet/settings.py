@@ -220,6 +220,15 @@ DEFAULT_FROM_EMAIL = os.getenv("DEFAULT_FROM_EMAIL", "noreply@ecotrajet.com")
 # Frontend URL
 FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:3000")
 
+# Index en mémoire des trajets programmés pour /api/trips/search/ (cf. api.trip_index)
+TRIP_COLUMN_INDEX = os.getenv("TRIP_COLUMN_INDEX", "False") == "True"
+
+# Durée pendant laquelle une réservation en attente bloque ses places (cf. api.booking)
+RESERVATION_HOLD_MINUTES = int(os.getenv("RESERVATION_HOLD_MINUTES", "15"))
+
+# Durée de conservation des réponses rejouées pour un même Idempotency-Key (cf. api.idempotency)
+IDEMPOTENCY_KEY_TTL_HOURS = int(os.getenv("IDEMPOTENCY_KEY_TTL_HOURS", "24"))
+
 # Rate limiting settings
 RATELIMIT_ENABLE = True
 RATELIMIT_USE_CACHE = 'default'
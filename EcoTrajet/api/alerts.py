@@ -0,0 +1,75 @@
+"""
+Saved search alerts: passengers are notified when a matching trip is posted.
+
+Each saved search is indexed as one SavedSearchKey row per day of its date
+window, keyed by (origin place, destination place, day) and carrying the
+price and seat criteria. Percolating a trip is then a single index range
+read on its own key, whatever the number of saved searches, followed by one
+bulk insert of TripAlert rows (the outbox read by ``send_trip_alerts``).
+"""
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+MAX_WINDOW_DAYS = 31
+
+
+def search_days(saved_search):
+    """Days of the date window of ``saved_search``."""
+    days = (saved_search.date_fin - saved_search.date_debut).days + 1
+    return [saved_search.date_debut + timedelta(days=n) for n in range(max(days, 0))]
+
+
+def index_saved_search(saved_search):
+    """Replace the index rows of ``saved_search`` with those of its current criteria."""
+    from .models import SavedSearchKey
+
+    SavedSearchKey.objects.filter(saved_search=saved_search).delete()
+    if not saved_search.active:
+        return
+    SavedSearchKey.objects.bulk_create([
+        SavedSearchKey(
+            saved_search=saved_search,
+            user_id=saved_search.user_id,
+            origine_place_id=saved_search.origine_place_id,
+            destination_place_id=saved_search.destination_place_id,
+            day=day,
+            prix_max=saved_search.prix_max,
+            places_min=saved_search.places_min,
+        )
+        for day in search_days(saved_search)
+    ])
+
+
+def trip_key(trip):
+    """(origin place id, destination place id, local departure day) of a trip."""
+    return trip.origine_place_id, trip.destination_place_id, timezone.localdate(trip.temps_depart)
+
+
+def percolate(trip):
+    """
+    Queue a TripAlert for every saved search matching ``trip``. Returns the
+    number of matching searches.
+    """
+    from .models import SavedSearchKey, TripAlert
+
+    origin, destination, day = trip_key(trip)
+    if trip.statut != 'SCHEDULED' or origin is None or destination is None or trip.places_dispo <= 0:
+        return 0
+    matches = list(
+        SavedSearchKey.objects.filter(
+            origine_place_id=origin, destination_place_id=destination, day=day,
+            places_min__lte=trip.places_dispo,
+        )
+        .filter(Q(prix_max__isnull=True) | Q(prix_max__gte=trip.prix))
+        .exclude(user_id=trip.conducteur_id)
+        .values_list('saved_search_id', 'user_id')
+    )
+    # Un trajet modifié peut être percolé plusieurs fois : une alerte par recherche au plus
+    TripAlert.objects.bulk_create(
+        [TripAlert(saved_search_id=search_id, user_id=user_id, trip_id=trip.pk) for search_id, user_id in matches],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+    return len(matches)
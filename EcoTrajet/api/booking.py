@@ -0,0 +1,498 @@
+"""
+Seat booking: the seats held by reservations are taken from and given back
+to ``Trip.places_dispo`` without ever reading the counter first.
+
+Taking seats is a single conditional UPDATE
+(``places_dispo = places_dispo - n WHERE places_dispo >= n``): the database
+serializes concurrent bookings on the trip row and a booking that would
+oversell matches no row, which is reported as ``SoldOut``. A reservation
+whose held seats change is locked first and must still have the version it
+was loaded with (cf. ``api.tracking``), so that two concurrent edits cannot
+count its seats twice. Every write of a trip or reservation row increments
+its version.
+Refusals happen before anything is written, so that the caller's
+transaction stays usable.
+
+Pending reservations hold their seats until ``expires_at``
+(``settings.RESERVATION_HOLD_MINUTES`` after the request); ``expire_holds``
+gives the seats of the expired ones back by batches, with a fixed number of
+set-based queries per batch.
+
+``book_group`` reserves seats on several trips at once, all or nothing: the
+trip rows are locked in id order, so that two groups sharing trips cannot
+deadlock, then written with one UPDATE and the reservations with one
+``bulk_create``.
+
+Seats given back go first to the waitlist of the trip: its head entries are
+turned into pending reservations in the transaction that frees the seats,
+by batches taking their seats with the conditional UPDATE of ``take_seats``.
+Every waiting entry has an increasing sequence number in the queue of its
+trip, given from the ``tail`` of the ``WaitlistQueue`` row of the trip,
+which is locked after the trip row like the seat changes. Entries leave the
+queue without renumbering the others: the numbers have gaps and the
+position of an entry is the count of the waiting entries up to its number,
+read on the (trip, seq) index of the waiting entries.
+
+``cancel_trips`` cancels trips with all their reservations and waitlist
+entries, and records the refund and notification jobs owed to their
+passengers, with set-based queries whose number does not depend on the
+number of trips or passengers.
+
+The search document and ``Trip.updated_at`` (the change feed of the
+in-process indexes) are written in the same transaction as the counter.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .alerts import percolate
+from .tracking import ConcurrentModification, next_version
+
+
+class SoldOut(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Plus assez de places disponibles sur ce trajet."
+    default_code = 'sold_out'
+
+
+class TripClosed(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Ce trajet n'est plus ouvert à la réservation."
+    default_code = 'trip_closed'
+
+
+class OwnTrip(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = "Le conducteur ne peut pas réserver son propre trajet."
+    default_code = 'own_trip'
+
+
+class ReservationChanged(ConcurrentModification):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "La réservation a été modifiée entre-temps, veuillez la recharger."
+    default_code = 'reservation_changed'
+
+
+HOLDING_STATUSES = ('PENDING', 'CONFIRMED')
+CANCELLABLE_STATUSES = ('SCHEDULED', 'IN_PROGRESS')
+MAX_GROUP_SIZE = 20
+MAX_CANCELLED_TRIPS = 100
+PROMOTION_BATCH = 50
+
+
+def held_seats(statut, place_reserv):
+    """Seats of the trip held by a reservation in this state."""
+    return place_reserv if statut in HOLDING_STATUSES else 0
+
+
+def hold_expiry():
+    """End of the hold of a reservation requested now."""
+    return timezone.now() + timedelta(minutes=settings.RESERVATION_HOLD_MINUTES)
+
+
+def take_seats(trip_id, seats, using=None):
+    """
+    Take ``seats`` seats of a scheduled trip. Returns False, without changing
+    anything, if the trip is not open or has fewer free seats.
+    """
+    from .models import Trip, TripSearchDocument
+
+    if seats <= 0:
+        return True
+    taken = Trip.objects.using(using).filter(
+        pk=trip_id, statut='SCHEDULED', places_dispo__gte=seats,
+    ).update(places_dispo=F('places_dispo') - seats, version=next_version(), updated_at=timezone.now())
+    if taken:
+        TripSearchDocument.objects.using(using).filter(trip_id=trip_id).update(
+            places_dispo=F('places_dispo') - seats,
+        )
+    return bool(taken)
+
+
+def refusal(trip_id, using=None):
+    """The exception explaining why seats of ``trip_id`` could not be taken."""
+    from .models import Trip
+
+    trip = Trip.objects.using(using).filter(pk=trip_id).values_list('statut', 'places_dispo').first()
+    if trip is None or trip[0] != 'SCHEDULED':
+        return TripClosed()
+    return SoldOut(f"Plus assez de places disponibles sur ce trajet ({trip[1]} restante(s)).")
+
+
+def release_seats(trip_id, seats, using=None):
+    """
+    Give ``seats`` seats back to a trip. Only a scheduled trip serves them to
+    its waitlist and saved searches.
+    """
+    from .models import Trip, TripSearchDocument
+
+    if seats <= 0:
+        return
+    trips = Trip.objects.using(using).filter(pk=trip_id)
+    seats_back = {'places_dispo': F('places_dispo') + seats, 'version': next_version(), 'updated_at': timezone.now()}
+    # Statut lu par l'UPDATE lui-même : une seule requête pour un trajet programmé
+    scheduled = trips.filter(statut='SCHEDULED').update(**seats_back)
+    if not scheduled:
+        trips.update(**seats_back)
+    TripSearchDocument.objects.using(using).filter(trip_id=trip_id).update(
+        places_dispo=F('places_dispo') + seats,
+    )
+    if scheduled:
+        promote_waitlist(trip_id, using)
+        # Des places libérées peuvent satisfaire des recherches enregistrées
+        transaction.on_commit(partial(_percolate, [trip_id], using), using=using)
+
+
+def _percolate(trip_ids, using=None):
+    from .models import Trip
+
+    for trip in Trip.objects.using(using).filter(pk__in=trip_ids, statut='SCHEDULED'):
+        percolate(trip)
+
+
+def lock_reservation(reservation, using=None):
+    """
+    Lock the row of ``reservation``. Returns False if it no longer has the
+    version of the instance.
+    """
+    from .models import Reservation
+
+    return bool(list(
+        Reservation.objects.using(using).select_for_update()
+        .filter(pk=reservation.pk, version=reservation.version)
+        .values_list('pk', flat=True)
+    ))
+
+
+def book_seats(reservation, using=None):
+    """
+    Move the seats held by ``reservation`` from its loaded state to its current
+    one. Called by ``Reservation.save`` inside its transaction; returns the
+    refusal (``SoldOut``, ``TripClosed`` or ``ReservationChanged``) to raise,
+    in which case nothing was written.
+    """
+    # État courant lu d'abord : un champ différé chargé ici devient aussi une valeur connue
+    current = (reservation.trip_id, reservation.statut, reservation.place_reserv)
+    booked = tuple(reservation.loaded(name) for name in ('trip_id', 'statut', 'place_reserv'))
+    old_trip_id, old_statut, old_seats = booked
+    old = 0 if reservation._state.adding else held_seats(old_statut, old_seats)
+    new = held_seats(reservation.statut, reservation.place_reserv)
+    if reservation.trip_id == old_trip_id or reservation._state.adding:
+        changes = [(reservation.trip_id, new - old)]
+    else:
+        changes = [(old_trip_id, -old), (reservation.trip_id, new)]
+    # Même sans mouvement de places (attente -> confirmée), la transition ne doit
+    # pas croiser celle de expire_holds
+    if not reservation._state.adding and current != booked:
+        if not lock_reservation(reservation, using):
+            return ReservationChanged()
+    if not any(delta for _, delta in changes):
+        return None
+    # Une seule prise de places, avant toute restitution : un refus n'a rien écrit
+    for trip_id, delta in changes:
+        if delta > 0 and not take_seats(trip_id, delta, using):
+            return refusal(trip_id, using)
+    for trip_id, delta in changes:
+        if delta < 0:
+            release_seats(trip_id, -delta, using)
+    # Le trajet éventuellement chargé avec la réservation reste à jour
+    trip = reservation._meta.get_field('trip').get_cached_value(reservation, None)
+    for trip_id, delta in changes:
+        if trip is not None and trip.pk == trip_id and delta:
+            trip.places_dispo -= delta
+            trip.version += 1
+            trip.remember_values(['places_dispo', 'version'])
+    return None
+
+
+def book_group(requests, statut='PENDING', using=None):
+    """
+    Reserve seats for several ``(passenger_id, trip_id, seats)`` requests, all
+    or nothing, with four queries whatever their number. Raises ``SoldOut`` or
+    ``TripClosed``, naming the first trip that cannot take its share, or
+    ``OwnTrip`` when a passenger drives the trip, without having written
+    anything. Returns the created reservations.
+    """
+    from .models import Reservation, Trip, TripSearchDocument
+
+    needed = defaultdict(int)
+    for _, trip_id, seats in requests:
+        needed[trip_id] += seats
+    with transaction.atomic(using=using):
+        # Verrous pris dans l'ordre des ids : deux groupes ne peuvent pas s'attendre mutuellement
+        locked = {
+            pk: (statut_trip, free, driver_id)
+            for pk, statut_trip, free, driver_id in Trip.objects.using(using).select_for_update()
+            .filter(pk__in=needed).order_by('pk').values_list('pk', 'statut', 'places_dispo', 'conducteur_id')
+        }
+        for passenger_id, trip_id, _ in requests:
+            if trip_id in locked and locked[trip_id][2] == passenger_id:
+                raise OwnTrip(f"Le conducteur du trajet #{trip_id} ne peut pas y réserver de place.")
+        for trip_id in sorted(needed):
+            if locked.get(trip_id, ('',))[0] != 'SCHEDULED':
+                raise TripClosed(f"Le trajet #{trip_id} n'est pas ouvert à la réservation.")
+            if locked[trip_id][1] < needed[trip_id]:
+                raise SoldOut(
+                    f"Plus assez de places disponibles sur le trajet #{trip_id} "
+                    f"({locked[trip_id][1]} restante(s))."
+                )
+        # Toujours conditionnelle : SQLite ne verrouille pas les lignes lues
+        taken = Trip.objects.using(using).filter(
+            pk__in=needed, statut='SCHEDULED', places_dispo__gte=_per_trip('pk', needed),
+        ).update(
+            places_dispo=F('places_dispo') - _per_trip('pk', needed), version=next_version(),
+            updated_at=timezone.now(),
+        )
+        if taken != len(needed):
+            raise SoldOut()
+        TripSearchDocument.objects.using(using).filter(trip_id__in=needed).update(
+            places_dispo=F('places_dispo') - _per_trip('trip_id', needed),
+        )
+        expires_at = hold_expiry() if statut == 'PENDING' else None
+        reservations = Reservation.objects.using(using).bulk_create([
+            Reservation(
+                passenger_id=passenger_id, trip_id=trip_id, place_reserv=seats,
+                statut=statut, expires_at=expires_at,
+            )
+            for passenger_id, trip_id, seats in requests
+        ])
+    # bulk_create ne passe pas par save() : valeurs en base connues pour les transitions suivantes
+    for reservation in reservations:
+        reservation.remember_values()
+    return reservations
+
+
+def delete_reservation(reservation, using=None):
+    """Delete ``reservation`` and give back the seats it held when deleted."""
+    from .models import Reservation
+
+    with transaction.atomic(using=using, savepoint=False):
+        current = (
+            Reservation.objects.using(using).select_for_update()
+            .filter(pk=reservation.pk).values_list('trip_id', 'statut', 'place_reserv').first()
+        )
+        if current is None:
+            return
+        reservation.delete(using=using)
+        release_seats(current[0], held_seats(*current[1:]), using)
+
+
+def cancel_trips(trip_ids, using=None):
+    """
+    Cancel the scheduled or in progress trips among ``trip_ids`` together with
+    their reservations and waitlist entries, in one transaction of at most
+    ten queries whatever the number of trips and passengers: lock the trips, their
+    holding reservations and their waiting entries, one UPDATE each of the
+    trips (held seats given back), their search documents, the reservations
+    and the waitlist entries, one DELETE each of their grid cells and their
+    waitlist queues, and one INSERT of the jobs: a notification for every
+    passenger, plus a refund for the confirmed reservations. Returns the
+    numbers of cancelled trips and reservations.
+    """
+    from .models import (
+        Reservation, ReservationJob, Trip, TripRouteCell, TripSearchDocument, WaitlistEntry, WaitlistQueue,
+    )
+
+    now = timezone.now()
+    with transaction.atomic(using=using, savepoint=False):
+        prices = dict(
+            Trip.objects.using(using).select_for_update()
+            .filter(pk__in=trip_ids, statut__in=CANCELLABLE_STATUSES).order_by('pk').values_list('pk', 'prix')
+        )
+        if not prices:
+            return 0, 0
+        held = list(
+            Reservation.objects.using(using).select_for_update()
+            .filter(trip_id__in=prices, statut__in=HOLDING_STATUSES)
+            .values_list('pk', 'trip_id', 'passenger_id', 'statut', 'place_reserv')
+        )
+        waiting = list(
+            WaitlistEntry.objects.using(using).select_for_update()
+            .filter(trip_id__in=prices, statut='WAITING').values_list('pk', 'trip_id', 'passenger_id')
+        )
+        freed = defaultdict(int)
+        for _, trip_id, _, _, seats in held:
+            freed[trip_id] += seats
+        # Places rendues : les compteurs restent égaux aux places non réservées
+        trip_seats = {'places_dispo': F('places_dispo') + _per_trip('pk', freed)} if freed else {}
+        document_seats = {'places_dispo': F('places_dispo') + _per_trip('trip_id', freed)} if freed else {}
+        Trip.objects.using(using).filter(pk__in=prices).update(
+            statut='CANCELLED', version=next_version(), updated_at=now, **trip_seats,
+        )
+        TripSearchDocument.objects.using(using).filter(trip_id__in=prices).update(
+            statut='CANCELLED', **document_seats,
+        )
+        # Seuls les trajets programmés sont présents dans la grille d'itinéraires
+        TripRouteCell.objects.using(using).filter(trip_id__in=prices).delete()
+        # File vidée : les trajets annulés n'acceptent plus d'inscriptions
+        WaitlistEntry.objects.using(using).filter(pk__in=[pk for pk, _, _ in waiting]).update(
+            statut='CANCELLED', seq=None, updated_at=now,
+        )
+        WaitlistQueue.objects.using(using).filter(trip_id__in=prices).delete()
+        Reservation.objects.using(using).filter(pk__in=[row[0] for row in held]).update(
+            statut='CANCELLED', version=next_version(), updated_at=now,
+        )
+        jobs = [
+            ReservationJob(kind='NOTIFICATION', trip_id=trip_id, passenger_id=passenger_id, reservation_id=pk)
+            for pk, trip_id, passenger_id, _, _ in held
+        ]
+        jobs += [
+            ReservationJob(
+                kind='REFUND', trip_id=trip_id, passenger_id=passenger_id, reservation_id=pk,
+                amount=prices[trip_id] * seats,
+            )
+            for pk, trip_id, passenger_id, statut, seats in held if statut == 'CONFIRMED'
+        ]
+        jobs += [
+            ReservationJob(kind='NOTIFICATION', trip_id=trip_id, passenger_id=passenger_id)
+            for _, trip_id, passenger_id in waiting
+        ]
+        ReservationJob.objects.using(using).bulk_create(jobs)
+    return len(prices), len(held)
+
+
+def _per_trip(column, seats_by_trip):
+    return Case(
+        *(When(**{column: trip_id}, then=Value(seats)) for trip_id, seats in seats_by_trip.items()),
+        output_field=IntegerField(),
+    )
+
+
+def expire_holds(batch_size=1000, now=None, using=None):
+    """
+    Expire the pending reservations whose hold ended and give their seats
+    back. Each batch is one transaction of five queries whatever its size:
+    lock the expired rows (skipping those being confirmed), mark them
+    expired, one UPDATE of the trips and one of their search documents
+    adding the seats freed per trip, then look up the trips with a waitlist,
+    whose queues are promoted. Returns the number of expired holds.
+    """
+    from .models import Reservation, Trip, TripSearchDocument, WaitlistEntry
+
+    now = now or timezone.now()
+    expired = 0
+    while True:
+        with transaction.atomic(using=using):
+            batch = list(
+                Reservation.objects.using(using)
+                .select_for_update(skip_locked=True)
+                .filter(statut='PENDING', expires_at__lte=now)
+                .order_by('expires_at')
+                .values_list('pk', 'trip_id', 'place_reserv')[:batch_size]
+            )
+            if not batch:
+                break
+            freed = defaultdict(int)
+            for _, trip_id, seats in batch:
+                freed[trip_id] += seats
+            Reservation.objects.using(using).filter(pk__in=[pk for pk, _, _ in batch]).update(
+                statut='EXPIRED', version=next_version(), updated_at=now,
+            )
+            Trip.objects.using(using).filter(pk__in=freed).update(
+                places_dispo=F('places_dispo') + _per_trip('pk', freed), version=next_version(), updated_at=now,
+            )
+            TripSearchDocument.objects.using(using).filter(trip_id__in=freed).update(
+                places_dispo=F('places_dispo') + _per_trip('trip_id', freed),
+            )
+            waiting = (
+                WaitlistEntry.objects.using(using)
+                .filter(trip_id__in=freed, statut='WAITING').values_list('trip_id', flat=True).distinct()
+            )
+            for trip_id in waiting:
+                promote_waitlist(trip_id, using)
+            transaction.on_commit(partial(_percolate, list(freed), using), using=using)
+        expired += len(batch)
+        if len(batch) < batch_size:
+            break
+    return expired
+
+
+def _locked_queue(trip_id, using=None, create=False):
+    """Waitlist queue of the trip, locked after the trip row (created if ``create``), or None."""
+    from .models import Trip, WaitlistQueue
+
+    list(Trip.objects.using(using).select_for_update().filter(pk=trip_id).values_list('pk', flat=True))
+    queue = WaitlistQueue.objects.using(using).select_for_update().filter(pk=trip_id).first()
+    if queue is None and create:
+        # Créée sous le verrou du trajet : pas de création concurrente
+        queue = WaitlistQueue.objects.using(using).create(trip_id=trip_id)
+    return queue
+
+
+def enqueue(entry, using=None):
+    """Give the new waiting ``entry`` the sequence number after the tail of its queue."""
+    queue = _locked_queue(entry.trip_id, using, create=True)
+    queue.tail += 1
+    queue.save(using=using, update_fields=['tail'])
+    entry.seq = queue.tail
+
+
+def leave_waitlist(entry, using=None):
+    """
+    Cancel the waiting ``entry``, leaving a gap in the numbers of its queue.
+    Returns False, without writing, if the entry is no longer waiting.
+    """
+    from .models import WaitlistEntry
+
+    now = timezone.now()
+    # Conditionnelle : une promotion concurrente verrouille les entrées qu'elle sert
+    left = WaitlistEntry.objects.using(using).filter(pk=entry.pk, statut='WAITING').update(
+        statut='CANCELLED', seq=None, updated_at=now,
+    )
+    if left:
+        entry.statut, entry.seq, entry.updated_at = 'CANCELLED', None, now
+    return bool(left)
+
+
+def promote_waitlist(trip_id, using=None):
+    """
+    Turn the head entries of the waitlist of ``trip_id`` into pending
+    reservations for as long as the trip has room for them, in the caller's
+    transaction. Only a scheduled trip promotes its queue, which is strictly
+    FIFO: an entry asking for more seats than are free blocks the ones behind it. Each batch of heads is one
+    locked read of the entries with the free seats of the trip, the seats
+    taken at once by the conditional UPDATE of ``take_seats``, one INSERT of
+    the reservations and one UPDATE of the entries. Returns the number of
+    seats taken.
+    """
+    from .models import Reservation, WaitlistEntry
+
+    taken = 0
+    while True:
+        heads = list(
+            WaitlistEntry.objects.using(using).select_for_update(of=('self',))
+            .filter(trip_id=trip_id, statut='WAITING', trip__statut='SCHEDULED')
+            .annotate(free=F('trip__places_dispo')).order_by('seq')[:PROMOTION_BATCH]
+        )
+        promoted, seats = [], 0
+        for entry in heads:
+            if seats + entry.place_reserv > entry.free:
+                break
+            promoted.append(entry)
+            seats += entry.place_reserv
+        if not promoted or not take_seats(trip_id, seats, using):
+            break
+        expires_at, now = hold_expiry(), timezone.now()
+        reservations = Reservation.objects.using(using).bulk_create([
+            Reservation(
+                passenger_id=entry.passenger_id, trip_id=trip_id, place_reserv=entry.place_reserv,
+                statut='PENDING', expires_at=expires_at,
+            )
+            for entry in promoted
+        ])
+        for entry, reservation in zip(promoted, reservations):
+            # bulk_create ne passe pas par save() (cf. book_group)
+            reservation.remember_values()
+            entry.statut, entry.seq, entry.reservation, entry.updated_at = 'PROMOTED', None, reservation, now
+        WaitlistEntry.objects.using(using).bulk_update(promoted, ['statut', 'seq', 'reservation', 'updated_at'])
+        taken += seats
+        if len(promoted) < PROMOTION_BATCH:
+            break
+    return taken
@@ -0,0 +1,170 @@
+"""
+Trip search documents: one denormalized row per trip with everything a
+search result card shows (driver name and rating, vehicle, free seats,
+price, places), so that a search is a single-table index scan.
+
+Documents are written in the same transaction as the change they reflect:
+``Trip.save``, ``Reservation.save`` (through the trip) and ``Rating.save``
+call these functions directly, deletions and ``Vehicule``/``User`` edits go
+through the receivers of ``api.signals``. ``rebuild_search_documents``
+rebuilds the whole table in parallel chunks.
+"""
+from decimal import Decimal
+
+from django.db.models import Case, DecimalField, IntegerField, Value, When
+
+# Champs recopiés tels quels du trajet
+TRIP_FIELDS = (
+    'conducteur_id', 'vehicule_id', 'communaute_id', 'origine', 'destination',
+    'origine_norm', 'destination_norm', 'origine_place_id', 'destination_place_id',
+    'temps_depart', 'temps_arrive', 'prix', 'places_dispo', 'statut',
+)
+
+
+def driver_display_name(prenom, nom):
+    """Public name of a driver: first name and initial of the last name."""
+    initial = f"{nom[:1]}." if nom else ''
+    return f"{prenom} {initial}".strip()
+
+
+def vehicle_label(vehicule):
+    if vehicule is None:
+        return ''
+    return f"{vehicule.make} {vehicule.model}"
+
+
+def driver_ratings(driver_ids):
+    """
+    {driver_id: (average, count)} of the ratings received, read by primary key
+    from the stats maintained with every rating change (cf. api.ratings).
+    """
+    from .models import UserRatingStats
+
+    rows = UserRatingStats.objects.filter(pk__in=driver_ids).values_list('pk', 'score_sum', 'rating_count')
+    return {user_id: (_rating(total / count if count else 0), count) for user_id, total, count in rows}
+
+
+def _rating(average):
+    return Decimal(str(round(average or 0, 2)))
+
+
+def driver_reputation(driver):
+    """Nightly reputation of ``driver`` (loaded with select_related), the prior mean if not computed yet."""
+    from .models import UserReputation
+
+    try:
+        return driver.reputation.score
+    except UserReputation.DoesNotExist:
+        return UserReputation(user=driver).score
+
+
+def build_documents(trips):
+    """Unsaved documents for ``trips`` (with conducteur, its reputation and vehicule loaded)."""
+    from .models import TripSearchDocument
+
+    ratings = driver_ratings({trip.conducteur_id for trip in trips})
+    documents = []
+    for trip in trips:
+        average, count = ratings.get(trip.conducteur_id, (Decimal('0'), 0))
+        documents.append(TripSearchDocument(
+            trip_id=trip.pk,
+            driver_name=driver_display_name(trip.conducteur.prenom, trip.conducteur.nom),
+            driver_rating=average,
+            driver_rating_count=count,
+            driver_reputation=driver_reputation(trip.conducteur),
+            vehicle_label=vehicle_label(trip.vehicule),
+            **{field: getattr(trip, field) for field in TRIP_FIELDS},
+        ))
+    return documents
+
+
+def refresh_documents(trips):
+    """
+    Rewrite the documents of the trips of the ``trips`` queryset: one read of
+    the trips with their driver and vehicle, one of the driver rating stats, one
+    upsert.
+    """
+    from .models import TripSearchDocument
+
+    documents = build_documents(list(trips.select_related('conducteur__reputation', 'vehicule').order_by()))
+    if documents:
+        TripSearchDocument.objects.bulk_create(
+            documents,
+            update_conflicts=True,
+            unique_fields=['trip'],
+            update_fields=[
+                field.name for field in TripSearchDocument._meta.concrete_fields
+                if not field.primary_key
+            ],
+        )
+    return len(documents)
+
+
+def sync_trip_document(trip, update_fields=None):
+    """
+    Bring the document of ``trip`` in line after ``trip.save()``: a single
+    UPDATE of the copied columns, unless the document is missing or the driver
+    or vehicle changed, in which case it is rebuilt.
+    """
+    from .models import Trip, TripSearchDocument
+
+    fields = TRIP_FIELDS
+    if update_fields is not None:
+        attnames = {Trip._meta.get_field(name).attname for name in update_fields}
+        fields = [field for field in TRIP_FIELDS if field in attnames]
+    relinked = {'conducteur_id', 'vehicule_id'} & set(fields) and (
+        (trip.conducteur_id, trip.vehicule_id) != (trip.loaded('conducteur_id'), trip.loaded('vehicule_id'))
+    )
+    if not relinked:
+        if not fields:
+            return
+        values = {field: getattr(trip, field) for field in fields}
+        if TripSearchDocument.objects.filter(trip_id=trip.pk).update(**values):
+            return
+    refresh_documents(Trip.objects.filter(pk=trip.pk))
+
+
+def refresh_driver_rating(driver_id):
+    """Copy the current rating of a driver to the documents of their trips."""
+    refresh_driver_ratings([driver_id])
+
+
+def refresh_driver_ratings(driver_ids):
+    """
+    Copy the current ratings of several drivers to the documents of their
+    trips: one read of their stats rows and one UPDATE, whatever their number.
+    """
+    from .models import TripSearchDocument
+
+    driver_ids = {driver_id for driver_id in driver_ids if driver_id is not None}
+    if not driver_ids:
+        return
+    ratings = driver_ratings(driver_ids)
+    per_driver = {driver_id: ratings.get(driver_id, (Decimal('0'), 0)) for driver_id in driver_ids}
+    TripSearchDocument.objects.filter(conducteur_id__in=driver_ids).update(
+        driver_rating=Case(
+            *(When(conducteur_id=driver_id, then=Value(average)) for driver_id, (average, _) in per_driver.items()),
+            output_field=DecimalField(max_digits=3, decimal_places=2),
+        ),
+        driver_rating_count=Case(
+            *(When(conducteur_id=driver_id, then=Value(count)) for driver_id, (_, count) in per_driver.items()),
+            output_field=IntegerField(),
+        ),
+    )
+
+
+def refresh_driver_name(user):
+    from .models import TripSearchDocument
+
+    TripSearchDocument.objects.filter(conducteur=user).update(
+        driver_name=driver_display_name(user.prenom, user.nom),
+    )
+
+
+def refresh_vehicle(vehicule, label=None):
+    from .models import TripSearchDocument
+
+    TripSearchDocument.objects.filter(vehicule=vehicule).update(
+        vehicle_label=vehicle_label(vehicule) if label is None else label,
+    )
+
@@ -0,0 +1,64 @@
+"""
+Facet counts of a trip search: price histogram, departure-hour buckets,
+free-seat buckets, community counts and vehicle sizes.
+
+Every count comes from a single aggregate query: the trips are grouped by
+community (a handful of rows) and each bucket is a conditional COUNT over
+the group, so the other facets are sums of the group rows.
+"""
+from django.db.models import Count, Q
+
+# Bornes [min, max) des tranches ; None : pas de borne supérieure
+PRICE_BUCKETS = ((0, 10), (10, 20), (20, 30), (30, 50), (50, None))
+HOUR_BUCKETS = ((0, 6), (6, 10), (10, 14), (14, 18), (18, 22), (22, 24))
+SEAT_BUCKETS = ((0, 1), (1, 2), (2, 3), (3, 4), (4, None))
+VEHICLE_SIZE_BUCKETS = ((1, 5), (5, 6), (6, 8), (8, None))
+
+
+def _range(field, low, high):
+    condition = Q(**{f'{field}__gte': low})
+    if high is not None:
+        condition &= Q(**{f'{field}__lt': high})
+    return condition
+
+
+FACETS = {
+    'price': ('prix', PRICE_BUCKETS),
+    'departure_hour': ('temps_depart__hour', HOUR_BUCKETS),
+    'free_seats': ('places_dispo', SEAT_BUCKETS),
+    'vehicle_size': ('vehicule__number_of_seats', VEHICLE_SIZE_BUCKETS),
+}
+
+
+def facet_counts(queryset):
+    """Facet counts of the trips of ``queryset``, in one query."""
+    aggregates = {
+        f'{facet}_{index}': Count('pk', filter=_range(field, low, high))
+        for facet, (field, buckets) in FACETS.items()
+        for index, (low, high) in enumerate(buckets)
+    }
+    aggregates['vehicle_size_unknown'] = Count('pk', filter=Q(vehicule__isnull=True))
+    rows = list(
+        queryset.order_by()
+        .values('communaute', 'communaute__name')
+        .annotate(total=Count('pk'), **aggregates)
+    )
+
+    def total(alias):
+        return sum(row[alias] for row in rows)
+
+    result = {'total': total('total')}
+    for facet, (_, buckets) in FACETS.items():
+        result[facet] = [
+            {'min': low, 'max': high, 'count': total(f'{facet}_{index}')}
+            for index, (low, high) in enumerate(buckets)
+        ]
+    result['vehicle_size'].append({'min': None, 'max': None, 'count': total('vehicle_size_unknown')})
+    result['communities'] = sorted(
+        (
+            {'id': row['communaute'], 'name': row['communaute__name'], 'count': row['total']}
+            for row in rows if row['communaute'] is not None
+        ),
+        key=lambda community: (-community['count'], community['name']),
+    )
+    return result
@@ -0,0 +1,153 @@
+"""
+Geohash helpers for radius searches without PostGIS.
+
+Coordinates are stored next to a precomputed geohash. A radius query first
+keeps the rows whose geohash falls in the 3x3 block of cells around the
+centre (one B-tree range per cell) and inside the bounding box of the circle
+(the block can be several times larger), then bounds their exact haversine
+distance in the same SQL query, so that no candidate leaves the database and
+pagination only reads its page.
+"""
+import math
+
+import numpy as np
+from django.db.models import Q
+from django.db.models.functions import Cos, Power, Radians, Sin
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_LENGTH = 9
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+
+
+def encode(lat, lon, precision=GEOHASH_LENGTH):
+    """Geohash of (lat, lon) with ``precision`` characters."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        interval, coordinate = (lon_range, lon) if even else (lat_range, lat)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+def cell_size_degrees(precision):
+    """(height, width) in degrees of a geohash cell."""
+    lon_bits = math.ceil(5 * precision / 2)
+    lat_bits = 5 * precision - lon_bits
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def precision_for_radius(radius_km, lat):
+    """Longest geohash whose cells are at least ``radius_km`` high and wide at ``lat``."""
+    cos_lat = max(math.cos(math.radians(lat)), 0.01)
+    for precision in range(GEOHASH_LENGTH, 0, -1):
+        height, width = cell_size_degrees(precision)
+        if min(height * KM_PER_DEGREE, width * KM_PER_DEGREE * cos_lat) >= radius_km:
+            return precision
+    return 1
+
+
+def covering_cells(lat, lon, radius_km):
+    """Geohash cells (centre and neighbours) covering the circle."""
+    precision = precision_for_radius(radius_km, lat)
+    height, width = cell_size_degrees(precision)
+    cells = set()
+    for d_lat in (-height, 0, height):
+        for d_lon in (-width, 0, width):
+            cell_lat = min(max(lat + d_lat, -90.0), 90.0 - 1e-9)
+            cell_lon = (lon + d_lon + 180.0) % 360.0 - 180.0
+            cells.add(encode(cell_lat, cell_lon, precision))
+    return sorted(cells)
+
+
+def _successor(prefix):
+    """Smallest string greater than every string starting with ``prefix``."""
+    chars = list(prefix)
+    while chars:
+        index = BASE32.index(chars[-1])
+        if index + 1 < len(BASE32):
+            chars[-1] = BASE32[index + 1]
+            return ''.join(chars)
+        chars.pop()
+    return None
+
+
+def geohash_prefilter(field, lat, lon, radius_km):
+    """Q object keeping rows whose ``field`` lies in a covering cell, as index ranges."""
+    condition = Q()
+    for cell in covering_cells(lat, lon, radius_km):
+        cell_range = Q(**{f'{field}__gte': cell})
+        upper = _successor(cell)
+        if upper is not None:
+            cell_range &= Q(**{f'{field}__lt': upper})
+        condition |= cell_range
+    return condition
+
+
+def bounding_box(prefix, lat, lon, radius_km):
+    """Q object keeping rows whose ``<prefix>_lat``/``<prefix>_lon`` lie in the bounding box of the circle."""
+    angle = radius_km / EARTH_RADIUS_KM
+    d_lat = math.degrees(angle)
+    box = Q(**{f'{prefix}_lat__gte': lat - d_lat, f'{prefix}_lat__lte': lat + d_lat})
+    cos_lat = math.cos(math.radians(lat))
+    if abs(lat) + d_lat >= 90 or math.sin(angle) >= cos_lat:
+        # Cercle autour d'un pôle : toutes les longitudes
+        return box
+    d_lon = math.degrees(math.asin(math.sin(angle) / cos_lat))
+    west, east = lon - d_lon, lon + d_lon
+    if west < -180:
+        return box & (Q(**{f'{prefix}_lon__gte': west + 360}) | Q(**{f'{prefix}_lon__lte': east}))
+    if east > 180:
+        return box & (Q(**{f'{prefix}_lon__gte': west}) | Q(**{f'{prefix}_lon__lte': east - 360}))
+    return box & Q(**{f'{prefix}_lon__gte': west, f'{prefix}_lon__lte': east})
+
+
+def haversine_km(lat, lon, lats, lons):
+    """Great-circle distances in km from (lat, lon) to each point of the arrays."""
+    lat1, lon1 = math.radians(lat), math.radians(lon)
+    lats, lons = np.radians(np.asarray(lats, dtype=float)), np.radians(np.asarray(lons, dtype=float))
+    a = (
+        np.sin((lats - lat1) / 2) ** 2
+        + math.cos(lat1) * np.cos(lats) * np.sin((lons - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def haversine_term(prefix, lat, lon):
+    """
+    SQL expression of the haversine term ``a`` between (lat, lon) and the
+    ``<prefix>_lat``/``<prefix>_lon`` columns: the distance is
+    ``2 R asin(sqrt(a))``, increasing with ``a``.
+    """
+    lat1, lon1 = math.radians(lat), math.radians(lon)
+    lats, lons = Radians(f'{prefix}_lat'), Radians(f'{prefix}_lon')
+    return (
+        Power(Sin((lats - lat1) / 2.0), 2)
+        + math.cos(lat1) * Cos(lats) * Power(Sin((lons - lon1) / 2.0), 2)
+    )
+
+
+def within_radius(queryset, prefix, lat, lon, radius_km):
+    """
+    Restrict ``queryset`` to rows whose ``<prefix>_lat``/``<prefix>_lon`` lie
+    within ``radius_km`` of (lat, lon): index ranges of the covering cells,
+    bounding box, then the haversine bound, all in the query itself.
+    """
+    alias = f'{prefix}_haversine'
+    # d <= r  <=>  a <= sin²(r / 2R)
+    bound = math.sin(min(radius_km / (2 * EARTH_RADIUS_KM), math.pi / 2)) ** 2
+    return queryset.filter(
+        geohash_prefilter(f'{prefix}_geohash', lat, lon, radius_km),
+        bounding_box(prefix, lat, lon, radius_km),
+    ).alias(**{alias: haversine_term(prefix, lat, lon)}).filter(**{f'{alias}__lte': bound})
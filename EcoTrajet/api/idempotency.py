@@ -0,0 +1,79 @@
+"""
+Idempotency-Key support for creation endpoints.
+
+A POST carrying an ``Idempotency-Key`` header first inserts an
+IdempotencyKey row, unique per (user, endpoint, key), in the transaction
+that creates the object and then stores the response. A concurrent or later
+duplicate fails that insert, without any explicit lock: it then replays the
+stored status and body, or gets a 422 if the key was used for a different
+request body. A request that fails rolls its key back, so that the client
+can retry it. Keys are kept ``settings.IDEMPOTENCY_KEY_TTL_HOURS`` hours
+(``purge_idempotency_keys`` deletes the expired ones).
+"""
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+def request_fingerprint(request):
+    """SHA-256 of the parsed request body."""
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    payload = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class IdempotentCreateMixin:
+    """Replay the response of a create request retried with the same Idempotency-Key."""
+
+    def create(self, request, *args, **kwargs):
+        from .models import IdempotencyKey
+
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if key is None or not request.user.is_authenticated:
+            return super().create(request, *args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise ValidationError({IDEMPOTENCY_HEADER: f"Clé de 1 à {MAX_KEY_LENGTH} caractères attendue"})
+        scope = {'user': request.user, 'endpoint': request.path, 'key': key}
+        fingerprint = request_fingerprint(request)
+        now = timezone.now()
+        claim = {'fingerprint': fingerprint, 'expires_at': now + timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)}
+
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    record = IdempotencyKey.objects.create(**scope, **claim)
+            except IntegrityError:
+                # Doublon : la première requête a validé sa réponse (PostgreSQL fait
+                # attendre cette insertion jusqu'à la fin de sa transaction)
+                record = IdempotencyKey.objects.get(**scope)
+                # Clé expirée pas encore purgée : reprise par une mise à jour conditionnelle
+                reclaimed = IdempotencyKey.objects.filter(pk=record.pk, expires_at__lte=now).update(
+                    **claim, status_code=None, response_body=None, created_at=now,
+                )
+                if not reclaimed:
+                    return self.replay(record, fingerprint)
+            response = super().create(request, *args, **kwargs)
+            record.status_code = response.status_code
+            record.response_body = response.data
+            record.save(update_fields=['status_code', 'response_body'])
+        return response
+
+    def replay(self, record, fingerprint):
+        if record.fingerprint != fingerprint:
+            return Response(
+                {'detail': "Cette clé d'idempotence a déjà servi pour une autre requête."},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        return Response(record.response_body, status=record.status_code, headers={'Idempotent-Replayed': 'true'})
@@ -0,0 +1,174 @@
+"""
+Multi-leg journey planner over scheduled trips (Connection Scan Algorithm).
+
+Every bookable trip is one connection (departure, arrival, from stop, to
+stop). Each worker keeps them in a list sorted by departure time. A query
+scans that list once from ``depart_after`` and keeps, for every stop and
+number of legs, the earliest arrival found so far (bounded-transfer CSA).
+
+The timetable is not rebuilt per request: before each query it reads the
+trips modified since its last synchronisation (indexed on
+``Trip.updated_at``) and patches itself. A full reload happens every
+``full_reload_seconds`` to drop trips that were hard-deleted.
+"""
+import threading
+import time
+from bisect import bisect_left, insort
+from datetime import timedelta
+
+from django.utils import timezone
+
+# Marge de relecture : une transaction validée tardivement peut porter un
+# updated_at antérieur à la dernière synchronisation
+SYNC_OVERLAP = timedelta(seconds=30)
+
+
+def stop_key(place_id, normalized):
+    """Stop identifier: the canonical place when known, the normalized text otherwise."""
+    if place_id is not None:
+        return f'p{place_id}'
+    return f't{normalized}'
+
+
+class Timetable:
+    """In-memory connections of the bookable trips, sorted by departure."""
+
+    fields = (
+        'id', 'temps_depart', 'temps_arrive', 'origine_place_id', 'origine_norm',
+        'destination_place_id', 'destination_norm', 'places_dispo', 'statut',
+    )
+    full_reload_seconds = 600
+    history = timedelta(days=1)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._connections = []  # [(depart, arrive, from_stop, to_stop, trip_id, seats)] trié
+        self._by_trip = {}      # trip_id -> connexion
+        self._synced_at = None
+        self._reloaded_at = 0.0
+
+    def __len__(self):
+        return len(self._connections)
+
+    # Synchronisation
+
+    def _queryset(self):
+        from .models import Trip
+
+        return Trip.objects.order_by()
+
+    def _connection(self, row):
+        (trip_id, depart, arrive, from_place, from_norm, to_place, to_norm, seats, statut) = row
+        if statut != 'SCHEDULED' or seats <= 0 or depart < timezone.now() - self.history:
+            return None
+        origin, destination = stop_key(from_place, from_norm), stop_key(to_place, to_norm)
+        if origin == destination:
+            return None
+        return (depart.timestamp(), arrive.timestamp(), origin, destination, trip_id, seats)
+
+    def reload(self):
+        """Load every bookable trip."""
+        started = timezone.now()
+        rows = self._queryset().filter(
+            statut='SCHEDULED', places_dispo__gt=0, temps_depart__gte=started - self.history,
+        ).values_list(*self.fields)
+        connections = [c for c in map(self._connection, rows.iterator(chunk_size=5000)) if c]
+        connections.sort()
+        with self._lock:
+            self._connections = connections
+            self._by_trip = {c[4]: c for c in connections}
+            self._synced_at = started
+            self._reloaded_at = time.monotonic()
+
+    def sync(self):
+        """Apply the trips changed since the last synchronisation."""
+        if self._synced_at is None or time.monotonic() - self._reloaded_at > self.full_reload_seconds:
+            self.reload()
+            return
+        started = timezone.now()
+        rows = self._queryset().filter(
+            updated_at__gte=self._synced_at - SYNC_OVERLAP
+        ).values_list(*self.fields)
+        with self._lock:
+            for row in rows:
+                self._apply(row[0], self._connection(row))
+            self._synced_at = started
+
+    def discard(self, trip_id):
+        """Drop a trip immediately (e.g. after a hard delete in this worker)."""
+        with self._lock:
+            self._apply(trip_id, None)
+
+    def invalidate(self):
+        with self._lock:
+            self._synced_at = None
+
+    def _apply(self, trip_id, connection):
+        previous = self._by_trip.pop(trip_id, None)
+        if previous is not None and previous == connection:
+            # Relu dans la marge de synchronisation sans changement
+            self._by_trip[trip_id] = previous
+            return
+        if previous is not None:
+            position = bisect_left(self._connections, previous)
+            if position < len(self._connections) and self._connections[position] == previous:
+                del self._connections[position]
+        if connection is not None:
+            insort(self._connections, connection)
+            self._by_trip[trip_id] = connection
+
+    # Recherche
+
+    def plan(self, origin, destination, depart_after, seats=1, max_legs=3,
+             min_transfer=timedelta(minutes=15), horizon=timedelta(hours=24)):
+        """
+        Pareto-optimal journeys from ``origin`` to ``destination`` (stop keys):
+        the earliest arrival with one leg, then with two legs if it arrives
+        earlier, and so on. Each journey is a list of trip ids.
+        """
+        self.sync()
+        start = depart_after.timestamp()
+        end = start + horizon.total_seconds()
+        transfer = min_transfer.total_seconds()
+        # best[k][stop] = (arrivée, index de connexion, étape précédente)
+        best = [dict() for _ in range(max_legs + 1)]
+        direct_arrival = float('inf')
+
+        with self._lock:
+            connections = self._connections
+            for index in range(bisect_left(connections, (start,)), len(connections)):
+                depart, arrive, from_stop, to_stop, _, available = connections[index]
+                if depart > end or depart >= direct_arrival:
+                    break
+                if available < seats or from_stop == destination or to_stop == origin:
+                    continue
+                for legs in range(max_legs, 0, -1):
+                    if legs == 1:
+                        if from_stop != origin:
+                            continue
+                        previous = None
+                    else:
+                        previous = best[legs - 1].get(from_stop)
+                        if previous is None or previous[0] + transfer > depart:
+                            continue
+                    current = best[legs].get(to_stop)
+                    if current is None or arrive < current[0]:
+                        best[legs][to_stop] = (arrive, index, previous)
+                        if legs == 1 and to_stop == destination:
+                            direct_arrival = min(direct_arrival, arrive)
+
+            journeys, earliest = [], float('inf')
+            for legs in range(1, max_legs + 1):
+                entry = best[legs].get(destination)
+                if entry is None or entry[0] >= earliest:
+                    continue
+                earliest = entry[0]
+                trip_ids = []
+                while entry is not None:
+                    trip_ids.append(connections[entry[1]][4])
+                    entry = entry[2]
+                journeys.append(trip_ids[::-1])
+        return journeys
+
+
+timetable = Timetable()
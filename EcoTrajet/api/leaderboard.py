@@ -0,0 +1,229 @@
+"""
+Driver leaderboards, global and per community, ranked by the Bayesian
+average of the scores drivers received for their trips:
+
+    (PRIOR_WEIGHT * PRIOR_MEAN + score_sum) / (PRIOR_WEIGHT + rating_count)
+
+so that a driver rated 5 once does not outrank a driver rated 4.8 fifty
+times. The prior is fixed: the score of a driver only depends on their own
+ratings, and a new rating moves a single row.
+
+Each ``Leaderboard`` keeps one ``DriverRank`` row per rated driver. A
+rating only locks and updates the rows of its driver (totals and score, one
+per board): concurrent ratings of different drivers never wait for each
+other and no other row is written, except the size of the board when a
+driver enters or leaves it. Reads rank from the current scores, in the
+order (score desc, rating_count desc, driver asc) of the
+(leaderboard, -score, -rating_count, driver) index: the top N is the first
+N entries of the board on that index, without sort, and the rank of a
+driver one index-only count of the entries before theirs, next to the size
+kept on the board. The ``rank`` column is only a cache, renumbered off the
+write path by the periodic ``rank_leaderboards`` job (e.g. for exports),
+which only writes the ranks that changed and repairs the sizes.
+
+Only ratings given to the driver of the trip count. ``rebuild_leaderboards``
+recomputes the boards from the ratings, e.g. after trips moved to another
+community.
+"""
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+PRIOR_MEAN = 3.5
+PRIOR_WEIGHT = 5
+MAX_TOP_DRIVERS = 100
+CHUNK_SIZE = 5000
+RANK_ORDER = ('-score', '-rating_count', 'driver_id')
+
+
+def bayesian_score(score_sum, rating_count):
+    return round((PRIOR_WEIGHT * PRIOR_MEAN + score_sum) / (PRIOR_WEIGHT + rating_count), 6)
+
+
+def _sort_key(score, rating_count, driver_id):
+    return (-score, -rating_count, driver_id)
+
+
+def leaderboard_deltas(changes, using=None):
+    """
+    ``{communaute_id: {driver_id: [count, score_sum]}}`` deltas of
+    ``(rated_user_id, trip_id, score, delta)`` rating changes, ``None``
+    being the global board. One query for the trips of the ratings.
+    """
+    from .models import Trip
+
+    changes = [change for change in changes if change[3]]
+    trips = {
+        trip_id: (driver_id, communaute_id)
+        for trip_id, driver_id, communaute_id in Trip.objects.using(using).filter(
+            pk__in={trip_id for _, trip_id, _, _ in changes}
+        ).values_list('pk', 'conducteur_id', 'communaute_id')
+    } if changes else {}
+    deltas = defaultdict(lambda: defaultdict(lambda: [0, 0]))
+    for rated_user_id, trip_id, score, delta in changes:
+        driver_id, communaute_id = trips.get(trip_id, (None, None))
+        if driver_id is None or driver_id != rated_user_id:
+            continue
+        for board in {None, communaute_id}:
+            deltas[board][driver_id][0] += delta
+            deltas[board][driver_id][1] += score * delta
+    return deltas
+
+
+def leaderboard(communaute_id, using=None):
+    """Board of the community (``None``: the global one), created if needed. Never locked."""
+    from .models import Leaderboard
+
+    boards = Leaderboard.objects.using(using)
+    board = boards.filter(communaute_id=communaute_id).first()
+    if board is not None:
+        return board
+    try:
+        with transaction.atomic(using=using):
+            return boards.create(communaute_id=communaute_id)
+    except IntegrityError:
+        # Créé entre-temps par une note concurrente
+        return boards.get(communaute_id=communaute_id)
+
+
+def _apply(board, drivers, using):
+    """
+    Add the ``{driver_id: (count, score_sum)}`` deltas to the rows of the
+    drivers in ``board``, locking only these rows (in driver order), and
+    create the missing ones without rank. The size of the board follows
+    the rows created and deleted.
+    """
+    from .models import DriverRank, Leaderboard
+
+    ranks = DriverRank.objects.using(using).filter(leaderboard=board)
+    rows = {
+        row.driver_id: row
+        for row in ranks.select_for_update().filter(driver_id__in=drivers).order_by('driver_id')
+    }
+    created = [
+        DriverRank(leaderboard=board, driver_id=driver_id, score=bayesian_score(total, count),
+                   rating_count=count, score_sum=total)
+        for driver_id, (count, total) in sorted(drivers.items())
+        # Conducteur absent du classement (cf. rebuild_leaderboards)
+        if driver_id not in rows and count > 0
+    ]
+    if created:
+        try:
+            with transaction.atomic(using=using):
+                DriverRank.objects.using(using).bulk_create(created)
+        except IntegrityError:
+            # Ligne créée entre-temps par une note concurrente : elle est verrouillée au second passage
+            return _apply(board, drivers, using)
+    now = timezone.now()
+    changed, removed = [], []
+    for driver_id, row in rows.items():
+        count, total = drivers[driver_id]
+        row.rating_count += count
+        row.score_sum += total
+        if row.rating_count <= 0:
+            removed.append(row.pk)
+            continue
+        row.score, row.updated_at = bayesian_score(row.score_sum, row.rating_count), now
+        changed.append(row)
+    if removed:
+        ranks.filter(pk__in=removed).delete()
+    if changed:
+        DriverRank.objects.using(using).bulk_update(changed, ['score', 'rating_count', 'score_sum', 'updated_at'])
+    if len(created) != len(removed):
+        Leaderboard.objects.using(using).filter(pk=board.pk).update(size=F('size') + len(created) - len(removed))
+
+
+def record_leaderboards(changes, using=None):
+    """
+    Apply ``(rated_user_id, trip_id, score, delta)`` rating changes to the
+    rows of the drivers in the global board and in the boards of the
+    communities of the trips. Ranks are left to ``rank_leaderboards``.
+    """
+    deltas = leaderboard_deltas(changes, using)
+    with transaction.atomic(using=using, savepoint=False):
+        # Ordre fixe des verrous entre transactions concurrentes
+        for communaute_id in sorted(deltas, key=lambda board: board or 0):
+            drivers = {driver_id: delta for driver_id, delta in deltas[communaute_id].items() if any(delta)}
+            if drivers:
+                _apply(leaderboard(communaute_id, using), drivers, using)
+
+
+def rank_leaderboards(chunk_size=CHUNK_SIZE, using=None):
+    """
+    Renumber the ranks and the size of every board from the current scores
+    of its rows, streamed in rank order on the score index. Only the ranks
+    that changed are written, by chunks. Ratings given meanwhile are not
+    blocked: they are ranked by the next run. Returns ``(boards, changed)``.
+    """
+    from .models import DriverRank, Leaderboard
+
+    board_ids = list(Leaderboard.objects.using(using).values_list('pk', flat=True))
+    changed = 0
+    for board_id in board_ids:
+        rows = DriverRank.objects.using(using).filter(leaderboard_id=board_id).order_by(
+            *RANK_ORDER
+        ).values_list('pk', 'rank').iterator(chunk_size=chunk_size)
+        moved, size = [], 0
+        for size, (pk, rank) in enumerate(rows, start=1):
+            if rank != size:
+                moved.append(DriverRank(pk=pk, rank=size))
+        for start in range(0, len(moved), chunk_size):
+            DriverRank.objects.using(using).bulk_update(moved[start:start + chunk_size], ['rank'])
+        Leaderboard.objects.using(using).filter(pk=board_id).exclude(size=size).update(size=size)
+        changed += len(moved)
+    return len(board_ids), changed
+
+
+def top_ranks(ranks, limit):
+    """First ``limit`` rows of the ``ranks`` of a board, ranked from their current scores."""
+    rows = list(ranks.order_by(*RANK_ORDER)[:limit])
+    for rank, row in enumerate(rows, start=1):
+        row.rank = rank
+    return rows
+
+
+def current_rank(row, using=None):
+    """
+    ``(rank, size)`` of the ``DriverRank`` row in its board from the current
+    scores: one count of the index entries before the row, and the size kept
+    on the board (``row.leaderboard``, to select with the row).
+    """
+    from .models import DriverRank
+
+    ahead = (
+        Q(score__gt=row.score)
+        | Q(score=row.score, rating_count__gt=row.rating_count)
+        | Q(score=row.score, rating_count=row.rating_count, driver_id__lt=row.driver_id)
+    )
+    count = DriverRank.objects.using(using).filter(Q(leaderboard_id=row.leaderboard_id) & ahead).count()
+    return count + 1, row.leaderboard.size
+
+
+def leaderboard_totals(ratings):
+    """
+    ``{communaute_id: {driver_id: (rating_count, score_sum)}}`` of the
+    ``ratings`` queryset given to the drivers of their trips, ``None``
+    being the global board: two GROUP BY queries.
+    """
+    ratings = ratings.order_by().filter(rated_user=F('trip__conducteur'))
+    totals = defaultdict(dict)
+    for row in ratings.values('rated_user').annotate(count=Count('pk'), total=Sum('score')):
+        totals[None][row['rated_user']] = (row['count'], row['total'])
+    per_community = ratings.filter(trip__communaute__isnull=False).values('trip__communaute', 'rated_user')
+    for row in per_community.annotate(count=Count('pk'), total=Sum('score')):
+        totals[row['trip__communaute']][row['rated_user']] = (row['count'], row['total'])
+    return totals
+
+
+def ranked(drivers):
+    """``[(rank, driver_id, score, rating_count, score_sum)]`` of ``{driver_id: (rating_count, score_sum)}``."""
+    rows = sorted(
+        ((bayesian_score(total, count), count, driver_id, total) for driver_id, (count, total) in drivers.items()),
+        key=lambda row: _sort_key(*row[:3]),
+    )
+    return [
+        (rank, driver_id, score, count, total)
+        for rank, (score, count, driver_id, total) in enumerate(rows, start=1)
+    ]
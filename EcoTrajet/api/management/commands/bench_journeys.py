@@ -0,0 +1,100 @@
+"""
+Benchmark of the journey planner on a synthetic timetable.
+
+Usage:
+    python manage.py bench_journeys --trips 100000
+
+The synthetic trips are written inside a transaction that is rolled back at
+the end.
+"""
+import random
+import statistics
+import time as timer
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from api.journeys import Timetable, stop_key
+from api.management.commands.bench_trip_search import CITIES, _Rollback
+from api.models import Trip
+from api.utils import normalize_place
+from user_management.models import User
+
+
+class Command(BaseCommand):
+    help = "Mesure la latence du calculateur d'itinéraires multi-trajets"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--trips', type=int, default=100_000)
+        parser.add_argument('--days', type=int, default=7)
+        parser.add_argument('--queries', type=int, default=200)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise _Rollback()
+        except _Rollback:
+            self.stdout.write("Données de benchmark annulées (rollback).")
+
+    def run(self, options):
+        rng = random.Random(7)
+        driver, _ = User.objects.get_or_create(
+            email='bench-driver@ecotrajet.local',
+            defaults={'nom': 'Bench', 'prenom': 'Driver', 'role': 'conducteur'},
+        )
+        start = timezone.now() + timedelta(hours=1)
+        minutes = options['days'] * 24 * 60
+        batch = []
+        for _ in range(options['trips']):
+            origine, destination = rng.sample(CITIES, 2)
+            depart = start + timedelta(minutes=rng.randrange(minutes))
+            batch.append(Trip(
+                conducteur=driver, origine=origine, destination=destination,
+                origine_norm=normalize_place(origine), destination_norm=normalize_place(destination),
+                temps_depart=depart, temps_arrive=depart + timedelta(minutes=rng.randint(45, 360)),
+                prix=Decimal('20.00'), places_dispo=rng.randint(0, 4),
+            ))
+        Trip.objects.bulk_create(batch, batch_size=10_000)
+        # Régime établi : aucune écriture récente dans la marge de synchronisation
+        Trip.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+
+        timetable = Timetable()
+        began = timer.perf_counter()
+        timetable.reload()
+        self.stdout.write(
+            f"Chargement de {len(timetable)} connexions réservables : "
+            f"{(timer.perf_counter() - began) * 1000:.0f}ms"
+        )
+
+        timings, found = [], 0
+        for _ in range(options['queries']):
+            origin, destination = rng.sample(CITIES, 2)
+            depart_after = start + timedelta(minutes=rng.randrange(minutes // 2))
+            began = timer.perf_counter()
+            journeys = timetable.plan(
+                stop_key(None, normalize_place(origin)),
+                stop_key(None, normalize_place(destination)),
+                depart_after,
+            )
+            timings.append((timer.perf_counter() - began) * 1000)
+            found += bool(journeys)
+        timings.sort()
+        self.stdout.write(
+            f"plan() sur {options['queries']} requêtes : médiane={statistics.median(timings):.2f}ms "
+            f"p95={timings[int(len(timings) * 0.95) - 1]:.2f}ms max={timings[-1]:.2f}ms "
+            f"({found} avec au moins un itinéraire)"
+        )
+
+        # Coût de la synchronisation incrémentale après 100 modifications
+        changed = list(Trip.objects.order_by('?').values_list('id', flat=True)[:100])
+        Trip.objects.filter(id__in=changed).update(statut='CANCELLED', updated_at=timezone.now())
+        began = timer.perf_counter()
+        timetable.sync()
+        self.stdout.write(
+            f"sync() après 100 trajets annulés : {(timer.perf_counter() - began) * 1000:.2f}ms, "
+            f"{len(timetable)} connexions"
+        )
@@ -0,0 +1,120 @@
+"""
+Benchmark of the in-process columnar trip index.
+
+Usage:
+    python manage.py bench_trip_index --trips 500000
+
+The synthetic trips are written inside a transaction that is rolled back at
+the end.
+"""
+import random
+import statistics
+import time as timer
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from api.management.commands.bench_trip_search import CITIES, _Rollback
+from api.models import Community, Place, Trip
+from api.trip_index import HydratedIds, TripColumnIndex
+from user_management.models import User
+
+
+class Command(BaseCommand):
+    help = "Mesure le filtrage vectorisé de l'index de trajets en mémoire"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--trips', type=int, default=500_000)
+        parser.add_argument('--days', type=int, default=30)
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise _Rollback()
+        except _Rollback:
+            self.stdout.write("Données de benchmark annulées (rollback).")
+
+    def run(self, options):
+        rng = random.Random(8)
+        driver, _ = User.objects.get_or_create(
+            email='bench-driver@ecotrajet.local',
+            defaults={'nom': 'Bench', 'prenom': 'Driver', 'role': 'conducteur'},
+        )
+        places = [Place.objects.create(name=f"{city} (bench)") for city in CITIES]
+        communities = [Community.objects.create(name=f"Bench {n}", admin=driver) for n in range(5)]
+        start = timezone.now() + timedelta(hours=1)
+        minutes = options['days'] * 24 * 60
+        batch = []
+        for _ in range(options['trips']):
+            origine, destination = rng.sample(places, 2)
+            depart = start + timedelta(minutes=rng.randrange(minutes))
+            batch.append(Trip(
+                conducteur=driver, origine=origine.name, destination=destination.name,
+                origine_place=origine, destination_place=destination,
+                communaute=rng.choice(communities) if rng.random() < 0.2 else None,
+                temps_depart=depart, temps_arrive=depart + timedelta(hours=3),
+                prix=Decimal(rng.randint(500, 6000)) / 100, places_dispo=rng.randint(0, 4),
+            ))
+        Trip.objects.bulk_create(batch, batch_size=10_000)
+        Trip.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+
+        index = TripColumnIndex()
+        index.refresh_seconds = 3600
+        began = timer.perf_counter()
+        index.reload()
+        stats = index.stats()
+        self.stdout.write(
+            f"Chargement de {stats['trips']} trajets : {(timer.perf_counter() - began) * 1000:.0f}ms, "
+            f"{stats['memory_bytes'] / 2 ** 20:.1f} Mio"
+        )
+
+        def pair():
+            origin, destination = rng.sample(places, 2)
+            return {'origin': origin.pk, 'destination': destination.pk}
+
+        cases = [
+            ("fenêtre seule (30 jours)", lambda: {}),
+            ("lieux", pair),
+            ("lieux + places + prix", lambda: {**pair(), 'min_seats': 2, 'max_price': Decimal('30')}),
+            ("places + prix + communauté", lambda: {
+                'min_seats': 1, 'max_price': Decimal('40'), 'community': rng.choice(communities).pk,
+            }),
+            ("journée + lieu de départ", lambda: {
+                'origin': rng.choice(places).pk, 'before': start + timedelta(days=rng.randint(1, 29)),
+            }),
+        ]
+        for label, criteria in cases:
+            timings, matches = [], 0
+            for _ in range(options['repeat']):
+                kwargs = criteria()
+                before = kwargs.pop('before', None)
+                after = before - timedelta(days=1) if before else start
+                began = timer.perf_counter()
+                ids = index.search(after, before, **kwargs)
+                timings.append((timer.perf_counter() - began) * 1000)
+                matches += len(ids)
+            timings.sort()
+            self.stdout.write(
+                f"{label:28} médiane={statistics.median(timings):.3f}ms "
+                f"p95={timings[int(len(timings) * 0.95) - 1]:.3f}ms "
+                f"({matches // options['repeat']} résultats en moyenne)"
+            )
+
+        ids = index.search(start, **pair())
+        began = timer.perf_counter()
+        page = HydratedIds(ids, Trip)[:20]
+        self.stdout.write(f"Chargement ORM d'une page de {len(page)} trajets : {(timer.perf_counter() - began) * 1000:.2f}ms")
+
+        changed = list(Trip.objects.order_by('?').values_list('id', flat=True)[:100])
+        Trip.objects.filter(id__in=changed).update(places_dispo=0, updated_at=timezone.now())
+        began = timer.perf_counter()
+        index.sync()
+        self.stdout.write(
+            f"Rafraîchissement après 100 modifications : {(timer.perf_counter() - began) * 1000:.1f}ms, "
+            f"{len(index)} trajets"
+        )
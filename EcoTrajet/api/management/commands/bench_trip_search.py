@@ -0,0 +1,146 @@
+"""
+Benchmark of the /api/trips/ search filters on a large synthetic table.
+
+Usage:
+    python manage.py bench_trip_search --trips 1000000
+
+The synthetic trips are written inside a transaction that is rolled back at
+the end, unless --keep is given. They are linked to the Place of their cities,
+as the view resolves known place names to a place filter (cf. 0005_place);
+missing places are created for the run.
+"""
+import random
+import statistics
+import time as timer
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.utils import timezone
+
+from api.models import Place, Trip
+from api.places import place_index
+from api.utils import normalize_place
+from api.views import TripListView
+from user_management.models import User
+
+CITIES = [
+    'Paris', 'Lyon', 'Marseille', 'Toulouse', 'Nice', 'Nantes', 'Strasbourg',
+    'Montpellier', 'Bordeaux', 'Lille', 'Rennes', 'Reims', 'Le Havre',
+    'Saint-Étienne', 'Toulon', 'Grenoble', 'Dijon', 'Angers', 'Nîmes',
+    'Villeurbanne', 'Clermont-Ferrand', 'Le Mans', 'Aix-en-Provence', 'Brest',
+    'Tours', 'Amiens', 'Limoges', 'Annecy', 'Perpignan', 'Besançon', 'Metz',
+    'Orléans', 'Rouen', 'Mulhouse', 'Caen', 'Nancy', 'Argenteuil', 'Roubaix',
+    'Tourcoing', 'Avignon', 'Poitiers', 'Pau', 'La Rochelle', 'Calais',
+    'Cannes', 'Béziers', 'Colmar', 'Bourges', 'Valence', 'Quimper',
+]
+
+
+class Command(BaseCommand):
+    help = "Mesure la latence de la recherche de trajets sur un grand volume"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--trips', type=int, default=1_000_000)
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--keep', action='store_true', help="Conserver les trajets générés")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                if not options['keep']:
+                    raise _Rollback()
+        except _Rollback:
+            self.stdout.write("Données de benchmark annulées (rollback).")
+
+    def run(self, options):
+        driver, _ = User.objects.get_or_create(
+            email='bench-driver@ecotrajet.local',
+            defaults={'nom': 'Bench', 'prenom': 'Driver', 'role': 'conducteur'},
+        )
+        started = timer.perf_counter()
+        self.populate(driver, options['trips'], options['batch_size'])
+        self.stdout.write(
+            f"{options['trips']} trajets insérés en {timer.perf_counter() - started:.1f}s"
+        )
+        # Statistiques à jour pour que le planificateur choisisse le bon index
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {Trip._meta.db_table}')
+
+        day = (timezone.localdate() + timedelta(days=30)).isoformat()
+        scenarios = {
+            'route + date': {'origin': 'paris', 'destination': 'LYON', 'departure_time': day},
+            'route + date + seats + price': {
+                'origin': 'Saint-Etienne', 'destination': 'grenoble', 'departure_time': day,
+                'min_seats': '2', 'max_price': '30', 'status': 'SCHEDULED',
+            },
+            'route only': {'origin': 'Nantes', 'destination': 'Rennes', 'status': 'SCHEDULED'},
+            'status + date': {'status': 'SCHEDULED', 'departure_time': day},
+        }
+        factory = RequestFactory()
+        view = TripListView.as_view()
+        for label, params in scenarios.items():
+            timings = []
+            for _ in range(options['repeat']):
+                request = factory.get('/api/trips/', params)
+                began = timer.perf_counter()
+                response = view(request)
+                response.render()
+                timings.append((timer.perf_counter() - began) * 1000)
+            self.stdout.write(
+                f"{label:32} count={response.data['count']:>6} "
+                f"median={statistics.median(timings):7.2f}ms max={max(timings):7.2f}ms"
+            )
+            self.explain(params)
+
+    def places(self):
+        """Place id of each city, as resolved by the view (created if unknown)."""
+        places = {}
+        for city in CITIES:
+            place_id = place_index.resolve(city)
+            if place_id is None:
+                place_id = Place.objects.create(name=city).pk
+            places[city] = place_id
+        return places
+
+    def populate(self, driver, total, batch_size):
+        rng = random.Random(42)
+        now = timezone.now()
+        places = self.places()
+        created = 0
+        while created < total:
+            batch = []
+            for _ in range(min(batch_size, total - created)):
+                origine, destination = rng.sample(CITIES, 2)
+                depart = now + timedelta(minutes=rng.randrange(-60 * 24 * 30, 60 * 24 * 180))
+                batch.append(Trip(
+                    conducteur=driver,
+                    origine=origine,
+                    destination=destination,
+                    origine_norm=normalize_place(origine),
+                    destination_norm=normalize_place(destination),
+                    origine_place_id=places[origine],
+                    destination_place_id=places[destination],
+                    temps_depart=depart,
+                    temps_arrive=depart + timedelta(hours=rng.randint(1, 8)),
+                    prix=Decimal(rng.randint(500, 6000)) / 100,
+                    places_dispo=rng.randint(0, 4),
+                    statut=rng.choice(['SCHEDULED'] * 8 + ['COMPLETED', 'CANCELLED']),
+                ))
+            Trip.objects.bulk_create(batch)
+            created += len(batch)
+
+    def explain(self, params):
+        request = RequestFactory().get('/api/trips/', params)
+        view = TripListView(request=request, format_kwarg=None, kwargs={})
+        view.request = view.initialize_request(request)
+        queryset = view.get_queryset()[:25]
+        for line in queryset.explain().splitlines():
+            self.stdout.write(f"    {line}")
+
+
+class _Rollback(Exception):
+    pass
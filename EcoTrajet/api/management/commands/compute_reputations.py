@@ -0,0 +1,34 @@
+"""
+Recompute the reputation score of every user (nightly job).
+
+Usage:
+    python manage.py compute_reputations --chunk-size 5000
+
+The ratings and the confirmed or cancelled reservations are streamed by
+chunks into NumPy arrays and every score is computed in vectorized form
+(cf. api.reputation). The scores are then written by chunks of users, each
+with one upsert of the reputations and one UPDATE of the search documents
+of their trips.
+"""
+import time as timer
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.reputation import CHUNK_SIZE, compute_reputations, store_reputations
+
+
+class Command(BaseCommand):
+    help = "Recalcule la réputation des utilisateurs à partir des notes et des annulations"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        started = timer.perf_counter()
+        now = timezone.now()
+        reputations = compute_reputations(options['chunk_size'], now)
+        written, removed = store_reputations(*reputations, now, options['chunk_size'])
+        self.stdout.write(
+            f"{written} réputations calculées, {removed} supprimées en {timer.perf_counter() - started:.1f} s"
+        )
@@ -0,0 +1,34 @@
+"""
+Give back the seats held by expired pending reservations.
+
+Usage:
+    python manage.py expire_holds --batch-size 1000
+    python manage.py expire_holds --every 30
+
+Without --every, a single sweep is made (for cron); with it, the command
+sweeps every N seconds until interrupted.
+"""
+import time as timer
+
+from django.core.management.base import BaseCommand
+
+from api.booking import expire_holds
+
+
+class Command(BaseCommand):
+    help = "Libère les places des réservations en attente expirées"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--every', type=float, default=None, help="Intervalle entre deux passages (secondes)")
+
+    def handle(self, *args, **options):
+        while True:
+            started = timer.perf_counter()
+            expired = expire_holds(batch_size=options['batch_size'])
+            self.stdout.write(
+                f"{expired} réservations expirées en {(timer.perf_counter() - started) * 1000:.0f} ms"
+            )
+            if options['every'] is None:
+                break
+            timer.sleep(options['every'])
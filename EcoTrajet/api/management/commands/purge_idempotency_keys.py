@@ -0,0 +1,19 @@
+"""
+Delete the expired Idempotency-Key responses.
+
+Usage:
+    python manage.py purge_idempotency_keys
+"""
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = "Supprime les clés d'idempotence expirées"
+
+    def handle(self, *args, **options):
+        # Aucune relation vers ce modèle : un seul DELETE sur idempotency_key_expiry_idx
+        deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+        self.stdout.write(f"{deleted} clés d'idempotence supprimées")
@@ -0,0 +1,33 @@
+"""
+Renumber the cached ranks of the driver leaderboards from the current scores
+(periodic job, e.g. every few minutes). The endpoints rank from the scores
+themselves and do not depend on it.
+
+Usage:
+    python manage.py rank_leaderboards --chunk-size 5000
+
+Ratings only update the totals and the score of their driver (cf.
+api.leaderboard). The rows of each board are streamed in rank order on the
+ranking index and only the ranks that changed are written, by chunks; the
+size of the board, kept by the ratings, is repaired if it drifted. The boards are not locked: ratings given meanwhile are
+ranked by the next run.
+"""
+import time as timer
+
+from django.core.management.base import BaseCommand
+
+from api.leaderboard import CHUNK_SIZE, rank_leaderboards
+
+
+class Command(BaseCommand):
+    help = "Renumérote les classements des conducteurs à partir de leurs moyennes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        started = timer.perf_counter()
+        boards, changed = rank_leaderboards(options['chunk_size'])
+        self.stdout.write(
+            f"{boards} classements renumérotés, {changed} rangs modifiés en {timer.perf_counter() - started:.1f} s"
+        )
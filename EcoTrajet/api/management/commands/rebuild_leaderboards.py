@@ -0,0 +1,44 @@
+"""
+Rebuild the driver leaderboards (global and per community) from the ratings.
+
+Usage:
+    python manage.py rebuild_leaderboards
+
+In one transaction, the ratings given to the drivers of their trips are
+aggregated with two GROUP BY queries, then the ranks of each board are
+replaced with one DELETE and one bulk INSERT. Boards of communities no
+longer rated are emptied. The totals are maintained by every rating and the
+ranks by the periodic ``rank_leaderboards`` job (cf. api.leaderboard): this
+command reconciles them, e.g. after trips moved to another community.
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.leaderboard import leaderboard, leaderboard_totals, ranked
+from api.models import DriverRank, Leaderboard, Rating
+
+
+class Command(BaseCommand):
+    help = "Recalcule les classements des conducteurs à partir des notes"
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        boards = {board.communaute_id: board for board in Leaderboard.objects.all()}
+        totals = leaderboard_totals(Rating.objects.all())
+        ranked_drivers = 0
+        for communaute_id in {*boards, *totals}:
+            drivers = totals.get(communaute_id, {})
+            board = boards.get(communaute_id) or leaderboard(communaute_id)
+            board.ranks.all().delete()
+            DriverRank.objects.bulk_create(
+                [
+                    DriverRank(leaderboard=board, driver_id=driver_id, rank=rank, score=score,
+                               rating_count=count, score_sum=total)
+                    for rank, driver_id, score, count, total in ranked(drivers)
+                ],
+                batch_size=1000,
+            )
+            board.size = len(drivers)
+            board.save(update_fields=['size'])
+            ranked_drivers += len(drivers)
+        self.stdout.write(f"{len({*boards, *totals})} classements recalculés, {ranked_drivers} rangs")
@@ -0,0 +1,50 @@
+"""
+Rebuild the per-user rating statistics (UserRatingStats) from the ratings.
+
+Usage:
+    python manage.py rebuild_rating_stats --chunk-size 1000
+
+Users are read in id order by chunks. For each chunk, in one transaction:
+the existing stats rows are locked (so that ratings given meanwhile wait
+and apply their increment on top of the rebuilt row), the ratings of the
+chunk are aggregated with one GROUP BY, the rows are written with one
+upsert and the rows of users no longer rated are deleted. The stats are
+maintained incrementally (cf. api.ratings): this command reconciles them
+should they ever drift, e.g. after ratings were changed with raw SQL.
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.models import Rating, UserRatingStats
+from api.ratings import SCORES, aggregate_ratings, score_column
+from user_management.models import User
+
+STATS_FIELDS = ['rating_count', 'score_sum', *(score_column(score) for score in SCORES), 'updated_at']
+
+
+class Command(BaseCommand):
+    help = "Recalcule les statistiques d'évaluation des utilisateurs à partir des notes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        written = removed = 0
+        last_id = 0
+        while True:
+            user_ids = list(
+                User.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:options['chunk_size']]
+            )
+            if not user_ids:
+                break
+            last_id = user_ids[-1]
+            with transaction.atomic():
+                list(UserRatingStats.objects.select_for_update().filter(user__in=user_ids).values_list('pk'))
+                rows = aggregate_ratings(Rating.objects.filter(rated_user__in=user_ids))
+                UserRatingStats.objects.bulk_create(
+                    [UserRatingStats(user_id=user_id, **row) for user_id, row in rows.items()],
+                    update_conflicts=True, unique_fields=['user'], update_fields=STATS_FIELDS,
+                )
+                removed += UserRatingStats.objects.filter(user__in=user_ids).exclude(user__in=list(rows)).delete()[0]
+            written += len(rows)
+        self.stdout.write(f"{written} statistiques d'évaluation recalculées, {removed} supprimées")
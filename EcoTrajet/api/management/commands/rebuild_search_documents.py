@@ -0,0 +1,64 @@
+"""
+Rebuild the TripSearchDocument table from the trips.
+
+Usage:
+    python manage.py rebuild_search_documents --workers 4 --chunk-size 5000
+
+Trip ids are split into contiguous ranges, rebuilt concurrently by a pool
+of workers (one database connection each). Every chunk is one read of the
+trips with their driver and vehicle, one of the driver rating stats and one
+upsert, in its own transaction.
+"""
+import time as timer
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections, transaction
+from django.db.models import Max, Min
+
+from api.documents import refresh_documents
+from api.models import Trip
+
+
+class Command(BaseCommand):
+    help = "Reconstruit les documents de recherche de trajets par blocs parallèles"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        bounds = Trip.objects.aggregate(first=Min('pk'), last=Max('pk'))
+        if bounds['first'] is None:
+            self.stdout.write("Aucun trajet.")
+            return
+        size = options['chunk_size']
+        ranges = [(start, start + size) for start in range(bounds['first'], bounds['last'] + 1, size)]
+
+        workers = options['workers']
+        if connection.vendor == 'sqlite':
+            # Un seul écrivain à la fois sous SQLite
+            workers = 1
+        began = timer.perf_counter()
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                written = sum(pool.map(self.rebuild_range, ranges))
+        else:
+            written = sum(map(self._rebuild, ranges))
+        self.stdout.write(
+            f"{written} documents reconstruits en {len(ranges)} blocs "
+            f"({timer.perf_counter() - began:.1f}s)"
+        )
+
+    def rebuild_range(self, bounds):
+        try:
+            return self._rebuild(bounds)
+        finally:
+            # Chaque thread ouvre sa propre connexion
+            connections.close_all()
+
+    @staticmethod
+    def _rebuild(bounds):
+        start, end = bounds
+        with transaction.atomic():
+            return refresh_documents(Trip.objects.filter(pk__gte=start, pk__lt=end))
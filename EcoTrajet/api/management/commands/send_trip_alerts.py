@@ -0,0 +1,65 @@
+"""
+Send the queued TripAlert notifications by email.
+
+Usage:
+    python manage.py send_trip_alerts --batch-size 500
+
+Pending alerts are read in id order by batches (trip_alert_pending_idx),
+grouped into one email per passenger, then marked as sent with a single
+UPDATE per batch. Index rows of saved searches for past days are purged.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.mail import send_mass_mail
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.models import SavedSearchKey, TripAlert
+
+
+class Command(BaseCommand):
+    help = "Envoie les alertes de nouveaux trajets en attente"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        sent = 0
+        last_id = 0
+        while True:
+            alerts = list(
+                TripAlert.objects.filter(sent_at__isnull=True, id__gt=last_id)
+                .select_related('user', 'trip')
+                .order_by('id')[:options['batch_size']]
+            )
+            if not alerts:
+                break
+            last_id = alerts[-1].id
+            by_user = defaultdict(list)
+            for alert in alerts:
+                by_user[alert.user].append(alert.trip)
+            send_mass_mail(
+                [self.message(user, trips) for user, trips in by_user.items()],
+                fail_silently=False,
+            )
+            TripAlert.objects.filter(id__in=[alert.id for alert in alerts]).update(sent_at=timezone.now())
+            sent += len(alerts)
+
+        purged, _ = SavedSearchKey.objects.filter(day__lt=timezone.localdate()).delete()
+        self.stdout.write(f"{sent} alertes envoyées, {purged} clés de recherche expirées supprimées")
+
+    @staticmethod
+    def message(user, trips):
+        lines = [
+            f"- {trip.origine} → {trip.destination}, "
+            f"{timezone.localtime(trip.temps_depart):%d/%m/%Y %H:%M}, {trip.prix} €"
+            for trip in trips
+        ]
+        body = (
+            f"Bonjour {user.prenom},\n\n"
+            "De nouveaux trajets correspondent à vos recherches enregistrées :\n"
+            + "\n".join(lines)
+            + f"\n\n{settings.FRONTEND_URL}\n"
+        )
+        return ("Nouveaux trajets EcoTrajet", body, settings.DEFAULT_FROM_EMAIL, [user.email])
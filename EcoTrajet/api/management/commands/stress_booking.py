@@ -0,0 +1,170 @@
+"""
+Concurrent booking stress test of the seat booking service (api.booking).
+
+Usage:
+    python manage.py stress_booking --threads 16 --trips 5 --seats 40 --attempts 2000
+
+Every thread books random seats (1 or 2) on random trips until its share of
+the attempts is spent, each booking in its own transaction. A booking
+refused on a lock or serialization conflict (SQLite write lock, PostgreSQL
+serialization failure or deadlock) is retried up to ``MAX_ATTEMPTS`` times
+with an exponential backoff, then counted as failed; any other database
+error stops the thread and fails the command. The seat counters are then
+checked against the confirmed reservations: the command fails if any trip
+was oversold. Bookings per second are reported.
+
+The data is committed (the threads need to see each other's writes) and
+deleted at the end, unless --keep is given.
+"""
+import random
+import threading
+import time as timer
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.db.models import Sum
+from django.utils import timezone
+
+from api.booking import SoldOut
+from api.models import Reservation, Trip, TripSearchDocument
+from user_management.models import User
+
+EMAIL_DOMAIN = 'stress.ecotrajet.local'
+MAX_ATTEMPTS = 5
+BACKOFF_SECONDS = 0.002
+# PostgreSQL : échec de sérialisation, interblocage, verrou non obtenu
+RETRYABLE_SQLSTATES = {'40001', '40P01', '55P03'}
+
+
+def retryable(error):
+    """Whether the ``OperationalError`` is a lock or serialization conflict, worth replaying."""
+    cause = error.__cause__
+    sqlstate = getattr(cause, 'sqlstate', None) or getattr(cause, 'pgcode', None)
+    if sqlstate is not None:
+        return sqlstate in RETRYABLE_SQLSTATES
+    return 'locked' in str(error)
+
+
+class Command(BaseCommand):
+    help = "Réservations concurrentes : vérifie l'absence de surréservation et mesure le débit"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--trips', type=int, default=5)
+        parser.add_argument('--seats', type=int, default=40, help="Places par trajet")
+        parser.add_argument('--attempts', type=int, default=2000, help="Tentatives de réservation au total")
+        parser.add_argument('--keep', action='store_true', help="Conserver les données générées")
+
+    def handle(self, *args, **options):
+        passengers, trips = self.populate(options)
+        try:
+            results, elapsed = self.run(passengers, trips, options)
+            self.verify(trips, options['seats'], results, elapsed)
+        finally:
+            if not options['keep']:
+                Trip.objects.filter(pk__in=trips).delete()
+                User.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}').delete()
+
+    def populate(self, options):
+        User.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}').delete()
+        driver = User.objects.create(
+            email=f'driver@{EMAIL_DOMAIN}', nom='Stress', prenom='Driver', role='conducteur',
+        )
+        User.objects.bulk_create([
+            User(email=f'passenger{n}@{EMAIL_DOMAIN}', nom='Stress', prenom=f'P{n}', role='passager')
+            for n in range(options['threads'])
+        ])
+        passengers = list(User.objects.filter(email__startswith='passenger', email__endswith=f'@{EMAIL_DOMAIN}'))
+        depart = timezone.now() + timedelta(days=7)
+        trips = [
+            Trip.objects.create(
+                conducteur=driver, origine='Paris', destination='Lyon',
+                temps_depart=depart, temps_arrive=depart + timedelta(hours=4),
+                prix=Decimal('20.00'), places_dispo=options['seats'],
+            ).pk
+            for _ in range(options['trips'])
+        ]
+        return passengers, trips
+
+    def run(self, passengers, trips, options):
+        results = Counter()
+        errors = []
+        lock = threading.Lock()
+        start = threading.Barrier(options['threads'])
+        share = options['attempts'] // options['threads']
+
+        def worker(passenger, seed):
+            rng = random.Random(seed)
+            local = Counter()
+            try:
+                start.wait()
+                for _ in range(share):
+                    trip, seats = rng.choice(trips), rng.choice((1, 2))
+                    for attempt in range(MAX_ATTEMPTS):
+                        try:
+                            # Réservation confirmée : places prises par Reservation.save (cf. api.booking)
+                            Reservation.objects.create(
+                                passenger=passenger, trip_id=trip, place_reserv=seats, statut='CONFIRMED',
+                            )
+                            local['booked'] += 1
+                        except SoldOut:
+                            local['sold_out'] += 1
+                        except OperationalError as error:
+                            if not retryable(error):
+                                raise
+                            if attempt + 1 < MAX_ATTEMPTS:
+                                # Verrou ou conflit : rejouée après une attente exponentielle avec gigue
+                                local['retries'] += 1
+                                timer.sleep(BACKOFF_SECONDS * 2 ** attempt * (1 + rng.random()))
+                                continue
+                            local['failed'] += 1
+                        break
+            except Exception as error:
+                with lock:
+                    errors.append(f"{type(error).__name__}: {error}")
+            finally:
+                connection.close()
+                with lock:
+                    results.update(local)
+
+        threads = [
+            threading.Thread(target=worker, args=(passengers[n], n)) for n in range(options['threads'])
+        ]
+        began = timer.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise CommandError(f"{len(errors)} fils interrompus, dont : {errors[0]}")
+        return results, timer.perf_counter() - began
+
+    def verify(self, trips, seats, results, elapsed):
+        booked = dict(
+            Reservation.objects.filter(trip__in=trips, statut='CONFIRMED')
+            .values_list('trip').annotate(seats=Sum('place_reserv'))
+        )
+        counters = dict(Trip.objects.filter(pk__in=trips).values_list('pk', 'places_dispo'))
+        documents = dict(TripSearchDocument.objects.filter(trip__in=trips).values_list('trip', 'places_dispo'))
+        oversold = [
+            trip for trip in trips
+            if counters[trip] < 0 or counters[trip] + booked.get(trip, 0) != seats
+            or documents.get(trip) != counters[trip]
+        ]
+        self.stdout.write(
+            f"{results['booked']} réservations, {results['sold_out']} refus (complet), "
+            f"{results['retries']} reprises sur verrou, {results['failed']} abandons après {MAX_ATTEMPTS} "
+            f"tentatives en {elapsed:.2f}s : "
+            f"{(results['booked'] + results['sold_out']) / elapsed:.0f} tentatives/s, "
+            f"{results['booked'] / elapsed:.0f} réservations/s"
+        )
+        self.stdout.write(
+            f"Places restantes : {sorted(counters.values())}, réservées : "
+            f"{sum(booked.values())}/{seats * len(trips)}"
+        )
+        if oversold:
+            raise CommandError(f"Compteurs de places incohérents pour les trajets {oversold}")
+        self.stdout.write("Aucune surréservation.")
@@ -0,0 +1,62 @@
+"""
+Passenger manifest of a trip, streamed as CSV or JSON.
+
+The reservations and their passengers are read with one joined query
+(``values_list`` over the passenger columns, no model instances) and
+streamed by chunks of ``CHUNK_SIZE`` rows, so that the memory used does not
+grow with the number of passengers of large community or event trips.
+"""
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+CHUNK_SIZE = 2000
+
+# Colonnes du manifeste et chemins correspondants depuis Reservation
+COLUMNS = (
+    ('reservation', 'id'),
+    ('statut', 'statut'),
+    ('place_reserv', 'place_reserv'),
+    ('created_at', 'created_at'),
+    ('passenger', 'passenger_id'),
+    ('prenom', 'passenger__prenom'),
+    ('nom', 'passenger__nom'),
+    ('email', 'passenger__email'),
+    ('telephone', 'passenger__telephone'),
+)
+FORMATS = {'csv': 'text/csv; charset=utf-8', 'json': 'application/json'}
+
+
+def manifest_rows(reservations):
+    """Rows of the manifest of the ``reservations`` queryset, in its order."""
+    return reservations.values_list(*(path for _, path in COLUMNS)).iterator(chunk_size=CHUNK_SIZE)
+
+
+class _Echo:
+    """File-like object handing back what csv.writer writes."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow([name for name, _ in COLUMNS])
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def stream_json(rows):
+    names = [name for name, _ in COLUMNS]
+    separator = '['
+    for row in rows:
+        yield separator + json.dumps(dict(zip(names, row)), cls=DjangoJSONEncoder)
+        separator = ',\n'
+    yield ']\n' if separator != '[' else '[]\n'
+
+
+def stream_manifest(reservations, fmt):
+    """Chunks of the manifest of ``reservations`` in format ``fmt`` (one of FORMATS)."""
+    rows = manifest_rows(reservations)
+    return stream_csv(rows) if fmt == 'csv' else stream_json(rows)
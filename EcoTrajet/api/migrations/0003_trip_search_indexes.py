@@ -0,0 +1,61 @@
+# Generated by Django 5.2.3 on 2026-10-17 03:53
+
+import unicodedata
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Copie figée de api.utils : la migration ne doit pas dépendre du code courant
+def normalize_place(value):
+    if not value:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', value)
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return ' '.join(stripped.casefold().split())
+
+
+def fill_normalized_places(apps, schema_editor):
+    Trip = apps.get_model('api', 'Trip')
+    trips = Trip.objects.only('id', 'origine', 'destination')
+    batch = []
+    for trip in trips.iterator(chunk_size=2000):
+        trip.origine_norm = normalize_place(trip.origine)
+        trip.destination_norm = normalize_place(trip.destination)
+        batch.append(trip)
+        if len(batch) >= 2000:
+            Trip.objects.bulk_update(batch, ['origine_norm', 'destination_norm'])
+            batch = []
+    if batch:
+        Trip.objects.bulk_update(batch, ['origine_norm', 'destination_norm'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_initial'),
+        ('user_management', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trip',
+            name='destination_norm',
+            field=models.CharField(blank=True, editable=False, help_text="Lieu d'arrivée normalisé pour la recherche", max_length=100),
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='origine_norm',
+            field=models.CharField(blank=True, editable=False, help_text='Lieu de départ normalisé pour la recherche', max_length=100),
+        ),
+        migrations.RunPython(fill_normalized_places, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['statut', 'temps_depart'], name='trip_statut_depart_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['origine_norm', 'destination_norm', 'temps_depart'], name='trip_route_depart_idx'),
+        ),
+    ]
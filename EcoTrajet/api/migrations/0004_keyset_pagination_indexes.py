@@ -0,0 +1,28 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_trip_search_indexes'),
+        ('user_management', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='rating',
+            index=models.Index(fields=['created_at', 'idRate'], name='rating_created_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['passenger', 'created_at', 'id'], name='resa_passenger_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['temps_depart', 'id'], name='trip_depart_keyset_idx'),
+        ),
+    ]
@@ -0,0 +1,106 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils.text import slugify
+
+
+def create_trigram_extension(apps, schema_editor):
+    # Extension pg_trgm, uniquement sous PostgreSQL ; conservée au retour arrière
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+
+def create_trigram_index(apps, schema_editor):
+    # Index GIN trigramme pour la recherche floue, uniquement sous PostgreSQL
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS api_place_slug_trgm_idx '
+            'ON api_place USING gin (slug gin_trgm_ops)'
+        )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS api_place_slug_trgm_idx')
+
+
+def create_places_from_trips(apps, schema_editor):
+    # Un lieu par nom déjà saisi (forme normalisée remplie par 0003), nommé
+    # d'après la première saisie rencontrée, puis rattachement des trajets
+    Trip = apps.get_model('api', 'Trip')
+    Place = apps.get_model('api', 'Place')
+    names, forms = {}, {}
+    for prefix in ('origine', 'destination'):
+        rows = Trip.objects.exclude(**{f'{prefix}_norm': ''}).order_by().values_list(f'{prefix}_norm', prefix)
+        for norm, text in rows.distinct().iterator():
+            slug = slugify(norm)
+            if slug:
+                names.setdefault(slug, ' '.join(text.split()))
+                forms.setdefault(slug, set()).add(norm)
+    Place.objects.bulk_create([Place(name=name, slug=slug) for slug, name in names.items()], batch_size=1000)
+    for slug, place_id in Place.objects.values_list('slug', 'id').iterator():
+        for prefix in ('origine', 'destination'):
+            Trip.objects.filter(**{f'{prefix}_norm__in': forms[slug]}).update(**{f'{prefix}_place': place_id})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_keyset_pagination_indexes'),
+        ('user_management', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Place',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Nom canonique du lieu', max_length=100)),
+                ('slug', models.SlugField(help_text='Nom sans accents ni majuscules, utilisé pour la recherche', max_length=100, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'lieu',
+                'verbose_name_plural': 'lieux',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PlaceAlias',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Nom alternatif', max_length=100)),
+                ('slug', models.SlugField(help_text='Alias sans accents ni majuscules', max_length=100, unique=True)),
+            ],
+            options={
+                'verbose_name': 'alias de lieu',
+                'verbose_name_plural': 'alias de lieux',
+            },
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='destination_place',
+            field=models.ForeignKey(blank=True, help_text="Lieu canonique d'arrivée (déduit de destination si absent)", null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='arriving_trips', to='api.place'),
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='origine_place',
+            field=models.ForeignKey(blank=True, help_text='Lieu canonique de départ (déduit de origine si absent)', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='departing_trips', to='api.place'),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['origine_place', 'destination_place', 'temps_depart'], name='trip_place_depart_idx'),
+        ),
+        migrations.AddField(
+            model_name='placealias',
+            name='place',
+            field=models.ForeignKey(help_text='Lieu canonique', on_delete=django.db.models.deletion.CASCADE, related_name='aliases', to='api.place'),
+        ),
+        migrations.RunPython(create_places_from_trips, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_extension, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:06
+
+import django.core.validators
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_place'),
+        ('user_management', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trip',
+            name='destination_geohash',
+            field=models.CharField(blank=True, editable=False, help_text="Geohash du lieu d'arrivée", max_length=12),
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='destination_lat',
+            field=models.FloatField(blank=True, help_text="Latitude du lieu d'arrivée", null=True, validators=[django.core.validators.MinValueValidator(-90), django.core.validators.MaxValueValidator(90)]),
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='destination_lon',
+            field=models.FloatField(blank=True, help_text="Longitude du lieu d'arrivée", null=True, validators=[django.core.validators.MinValueValidator(-180), django.core.validators.MaxValueValidator(180)]),
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='origine_geohash',
+            field=models.CharField(blank=True, editable=False, help_text='Geohash du lieu de départ', max_length=12),
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='origine_lat',
+            field=models.FloatField(blank=True, help_text='Latitude du lieu de départ', null=True, validators=[django.core.validators.MinValueValidator(-90), django.core.validators.MaxValueValidator(90)]),
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='origine_lon',
+            field=models.FloatField(blank=True, help_text='Longitude du lieu de départ', null=True, validators=[django.core.validators.MinValueValidator(-180), django.core.validators.MaxValueValidator(180)]),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['origine_geohash'], name='trip_origine_geohash_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['destination_geohash'], name='trip_dest_geohash_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_trip_geohash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trip',
+            name='route_polyline',
+            field=models.TextField(blank=True, help_text='Itinéraire encodé (format polyline), indexé pour la recherche par corridor'),
+        ),
+        migrations.CreateModel(
+            name='TripRouteCell',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cell', models.CharField(help_text='Cellule geohash de la grille', max_length=12)),
+                ('first_position', models.PositiveIntegerField(help_text="Premier point de l'itinéraire dans la cellule")),
+                ('last_position', models.PositiveIntegerField(help_text="Dernier point de l'itinéraire dans la cellule")),
+                ('trip', models.ForeignKey(help_text="Trajet dont l'itinéraire traverse la cellule", on_delete=django.db.models.deletion.CASCADE, related_name='route_cells', to='api.trip')),
+            ],
+            options={
+                'verbose_name': "cellule d'itinéraire",
+                'verbose_name_plural': "cellules d'itinéraire",
+                'indexes': [models.Index(fields=['cell', 'trip'], name='route_cell_trip_idx')],
+                'unique_together': {('trip', 'cell')},
+            },
+        ),
+    ]
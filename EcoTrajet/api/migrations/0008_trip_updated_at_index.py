@@ -0,0 +1,20 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_trip_route_corridor'),
+        ('user_management', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['updated_at'], name='trip_updated_at_idx'),
+        ),
+    ]
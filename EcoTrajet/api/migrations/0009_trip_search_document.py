@@ -0,0 +1,92 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:16
+
+import django.db.models.deletion
+from django.conf import settings
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Avg, Count
+
+# Copie figée de api.documents : la migration ne doit pas dépendre du code courant
+TRIP_FIELDS = (
+    'conducteur_id', 'vehicule_id', 'communaute_id', 'origine', 'destination', 'origine_norm',
+    'destination_norm', 'origine_place_id', 'destination_place_id', 'temps_depart', 'temps_arrive',
+    'prix', 'places_dispo', 'statut',
+)
+
+
+def driver_display_name(prenom, nom):
+    initial = f"{nom[:1]}." if nom else ''
+    return f"{prenom} {initial}".strip()
+
+
+def fill_search_documents(apps, schema_editor):
+    Trip = apps.get_model('api', 'Trip')
+    Rating = apps.get_model('api', 'Rating')
+    TripSearchDocument = apps.get_model('api', 'TripSearchDocument')
+    ratings = {
+        user_id: (Decimal(str(round(average, 2))), count)
+        for user_id, average, count in Rating.objects.order_by().values('rated_user')
+        .annotate(average=Avg('score'), count=Count('idRate'))
+        .values_list('rated_user', 'average', 'count')
+    }
+    trips = Trip.objects.select_related('conducteur', 'vehicule').order_by('pk')
+    batch = []
+    for trip in trips.iterator(chunk_size=2000):
+        average, count = ratings.get(trip.conducteur_id, (Decimal('0'), 0))
+        batch.append(TripSearchDocument(
+            trip_id=trip.pk,
+            driver_name=driver_display_name(trip.conducteur.prenom, trip.conducteur.nom),
+            driver_rating=average,
+            driver_rating_count=count,
+            vehicle_label=f"{trip.vehicule.make} {trip.vehicule.model}" if trip.vehicule else '',
+            **{field: getattr(trip, field) for field in TRIP_FIELDS},
+        ))
+        if len(batch) >= 2000:
+            TripSearchDocument.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        TripSearchDocument.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_trip_updated_at_index'),
+        ('user_management', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TripSearchDocument',
+            fields=[
+                ('trip', models.OneToOneField(help_text='Trajet décrit par le document', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='api.trip')),
+                ('origine', models.CharField(help_text='Lieu de départ', max_length=100)),
+                ('destination', models.CharField(help_text="Lieu d'arrivée", max_length=100)),
+                ('origine_norm', models.CharField(blank=True, help_text='Lieu de départ normalisé', max_length=100)),
+                ('destination_norm', models.CharField(blank=True, help_text="Lieu d'arrivée normalisé", max_length=100)),
+                ('temps_depart', models.DateTimeField(help_text='Date et heure de départ')),
+                ('temps_arrive', models.DateTimeField(help_text="Date et heure d'arrivée estimée")),
+                ('prix', models.DecimalField(decimal_places=2, help_text='Prix par passager', max_digits=6)),
+                ('places_dispo', models.PositiveIntegerField(help_text='Places libres')),
+                ('statut', models.CharField(choices=[('SCHEDULED', 'Programmé'), ('IN_PROGRESS', 'En cours'), ('COMPLETED', 'Terminé'), ('CANCELLED', 'Annulé')], help_text='État du trajet', max_length=15)),
+                ('driver_name', models.CharField(help_text='Nom affiché du conducteur', max_length=110)),
+                ('driver_rating', models.DecimalField(decimal_places=2, default=0, help_text='Note moyenne reçue par le conducteur', max_digits=3)),
+                ('driver_rating_count', models.PositiveIntegerField(default=0, help_text='Nombre de notes du conducteur')),
+                ('vehicle_label', models.CharField(blank=True, help_text='Marque et modèle du véhicule', max_length=101)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('communaute', models.ForeignKey(help_text='Communauté liée au trajet', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.community')),
+                ('conducteur', models.ForeignKey(help_text='Conducteur du trajet', on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('destination_place', models.ForeignKey(help_text="Lieu canonique d'arrivée", null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.place')),
+                ('origine_place', models.ForeignKey(help_text='Lieu canonique de départ', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.place')),
+                ('vehicule', models.ForeignKey(help_text='Véhicule du trajet', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='user_management.vehicule')),
+            ],
+            options={
+                'verbose_name': 'document de recherche',
+                'verbose_name_plural': 'documents de recherche',
+                'indexes': [models.Index(fields=['statut', 'origine_place', 'destination_place', 'temps_depart', 'trip'], name='tripdoc_place_depart_idx'), models.Index(fields=['statut', 'origine_norm', 'destination_norm', 'temps_depart', 'trip'], name='tripdoc_route_depart_idx'), models.Index(fields=['statut', 'temps_depart', 'trip'], name='tripdoc_statut_depart_idx')],
+            },
+        ),
+        migrations.RunPython(fill_search_documents, migrations.RunPython.noop),
+    ]
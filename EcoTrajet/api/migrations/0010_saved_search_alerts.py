@@ -0,0 +1,71 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_trip_search_document'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SavedSearch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_debut', models.DateField(help_text='Premier jour de départ accepté')),
+                ('date_fin', models.DateField(help_text='Dernier jour de départ accepté')),
+                ('prix_max', models.DecimalField(blank=True, decimal_places=2, help_text='Prix maximum par passager (optionnel)', max_digits=6, null=True)),
+                ('places_min', models.PositiveIntegerField(default=1, help_text='Nombre minimum de places libres')),
+                ('active', models.BooleanField(default=True, help_text='Alertes activées')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('destination_place', models.ForeignKey(help_text="Lieu d'arrivée recherché", on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.place')),
+                ('origine_place', models.ForeignKey(help_text='Lieu de départ recherché', on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.place')),
+                ('user', models.ForeignKey(help_text='Passager à prévenir', on_delete=django.db.models.deletion.CASCADE, related_name='saved_searches', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'recherche enregistrée',
+                'verbose_name_plural': 'recherches enregistrées',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SavedSearchKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(help_text='Jour de départ recherché')),
+                ('prix_max', models.DecimalField(blank=True, decimal_places=2, max_digits=6, null=True)),
+                ('places_min', models.PositiveIntegerField(default=1)),
+                ('destination_place', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.place')),
+                ('origine_place', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.place')),
+                ('saved_search', models.ForeignKey(help_text='Recherche indexée', on_delete=django.db.models.deletion.CASCADE, related_name='keys', to='api.savedsearch')),
+                ('user', models.ForeignKey(help_text='Passager à prévenir', on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'clé de recherche enregistrée',
+                'verbose_name_plural': 'clés de recherches enregistrées',
+                'indexes': [models.Index(fields=['origine_place', 'destination_place', 'day'], name='saved_search_key_idx'), models.Index(fields=['day'], name='saved_search_key_day_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='TripAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, help_text="Date d'envoi de la notification", null=True)),
+                ('saved_search', models.ForeignKey(help_text='Recherche correspondante', on_delete=django.db.models.deletion.CASCADE, related_name='alerts', to='api.savedsearch')),
+                ('trip', models.ForeignKey(help_text='Trajet correspondant', on_delete=django.db.models.deletion.CASCADE, related_name='alerts', to='api.trip')),
+                ('user', models.ForeignKey(help_text='Passager à prévenir', on_delete=django.db.models.deletion.CASCADE, related_name='trip_alerts', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'alerte de trajet',
+                'verbose_name_plural': 'alertes de trajet',
+                'indexes': [models.Index(fields=['sent_at', 'id'], name='trip_alert_pending_idx')],
+                'unique_together': {('saved_search', 'trip')},
+            },
+        ),
+    ]
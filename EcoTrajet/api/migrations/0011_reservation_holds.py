@@ -0,0 +1,56 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:38
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+from django.utils import timezone
+
+
+def hold_pending_seats(apps, schema_editor):
+    """
+    Pending reservations did not hold seats until now: take them in request
+    order where the trip still has them, otherwise expire the request.
+    """
+    Reservation = apps.get_model('api', 'Reservation')
+    Trip = apps.get_model('api', 'Trip')
+    TripSearchDocument = apps.get_model('api', 'TripSearchDocument')
+    now = timezone.now()
+    expires_at = now + timedelta(minutes=settings.RESERVATION_HOLD_MINUTES)
+    pending = Reservation.objects.filter(statut='PENDING').order_by('created_at', 'id')
+    for pk, trip_id, seats in pending.values_list('pk', 'trip_id', 'place_reserv').iterator():
+        taken = Trip.objects.filter(pk=trip_id, statut='SCHEDULED', places_dispo__gte=seats).update(
+            places_dispo=F('places_dispo') - seats, updated_at=now,
+        )
+        if taken:
+            TripSearchDocument.objects.filter(trip_id=trip_id).update(places_dispo=F('places_dispo') - seats)
+            Reservation.objects.filter(pk=pk).update(expires_at=expires_at)
+        else:
+            Reservation.objects.filter(pk=pk).update(statut='EXPIRED', expires_at=now)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_saved_search_alerts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reservation',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, help_text="Fin du blocage des places d'une réservation en attente", null=True),
+        ),
+        migrations.AlterField(
+            model_name='reservation',
+            name='statut',
+            field=models.CharField(choices=[('PENDING', 'En attente'), ('CONFIRMED', 'Confirmé'), ('CANCELLED', 'Annulé'), ('EXPIRED', 'Expiré')], default='PENDING', help_text='État de la réservation', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['statut', 'expires_at'], name='resa_hold_expiry_idx'),
+        ),
+        migrations.RunPython(hold_pending_seats, migrations.RunPython.noop),
+    ]
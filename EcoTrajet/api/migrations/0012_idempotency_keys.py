@@ -0,0 +1,37 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:41
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_reservation_holds'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('endpoint', models.CharField(help_text='Chemin de la requête', max_length=200)),
+                ('key', models.CharField(help_text="Valeur de l'en-tête Idempotency-Key", max_length=255)),
+                ('fingerprint', models.CharField(help_text='Empreinte SHA-256 du corps de la requête', max_length=64)),
+                ('status_code', models.PositiveSmallIntegerField(null=True)),
+                ('response_body', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(help_text='Date à partir de laquelle la clé peut être réutilisée')),
+                ('user', models.ForeignKey(help_text='Auteur de la requête', on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': "clé d'idempotence",
+                'verbose_name_plural': "clés d'idempotence",
+                'indexes': [models.Index(fields=['expires_at'], name='idempotency_key_expiry_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'endpoint', 'key'), name='idempotency_key_unique')],
+            },
+        ),
+    ]
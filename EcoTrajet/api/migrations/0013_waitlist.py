@@ -0,0 +1,37 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:47
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_idempotency_keys'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WaitlistEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('place_reserv', models.PositiveIntegerField(default=1, help_text='Nombre de places demandées', validators=[django.core.validators.MinValueValidator(1)])),
+                ('statut', models.CharField(choices=[('WAITING', "En file d'attente"), ('PROMOTED', 'Promu'), ('CANCELLED', 'Annulé')], default='WAITING', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('passenger', models.ForeignKey(help_text='Passager en attente', on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to=settings.AUTH_USER_MODEL)),
+                ('reservation', models.ForeignKey(blank=True, help_text='Réservation créée lors de la promotion', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.reservation')),
+                ('trip', models.ForeignKey(help_text='Trajet attendu', on_delete=django.db.models.deletion.CASCADE, related_name='waitlist', to='api.trip')),
+            ],
+            options={
+                'verbose_name': "inscription en liste d'attente",
+                'verbose_name_plural': "inscriptions en liste d'attente",
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['trip', 'statut', 'id'], name='waitlist_queue_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('statut', 'WAITING')), fields=('trip', 'passenger'), name='waitlist_single_entry')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_waitlist'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reservation',
+            name='version',
+            field=models.PositiveIntegerField(default=1, help_text='Incrémentée à chaque modification (contrôle de concurrence optimiste)'),
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='version',
+            field=models.PositiveIntegerField(default=1, help_text='Incrémentée à chaque modification (contrôle de concurrence optimiste)'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.3 on 2026-10-17 05:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_versions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReservationJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('REFUND', 'Remboursement'), ('NOTIFICATION', 'Notification')], max_length=15)),
+                ('amount', models.DecimalField(blank=True, decimal_places=2, help_text='Montant à rembourser', max_digits=8, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, help_text='Date de traitement', null=True)),
+                ('passenger', models.ForeignKey(help_text='Passager à rembourser ou à prévenir', on_delete=django.db.models.deletion.CASCADE, related_name='reservation_jobs', to=settings.AUTH_USER_MODEL)),
+                ('reservation', models.ForeignKey(blank=True, help_text="Réservation annulée (vide pour une inscription en liste d'attente)", null=True, on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='api.reservation')),
+                ('trip', models.ForeignKey(help_text='Trajet annulé', on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='api.trip')),
+            ],
+            options={
+                'verbose_name': 'tâche de réservation',
+                'verbose_name_plural': 'tâches de réservation',
+                'indexes': [models.Index(fields=['processed_at', 'id'], name='reservation_job_pending_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.3 on 2026-10-17 05:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_reservation_jobs'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['trip', 'created_at', 'id'], name='resa_trip_keyset_idx'),
+        ),
+    ]
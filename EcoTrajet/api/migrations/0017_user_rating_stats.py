@@ -0,0 +1,50 @@
+# Generated by Django 5.2.3 on 2026-10-17 05:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def build_stats(apps, schema_editor):
+    """Stats of the users already rated, from their ratings (one GROUP BY query)."""
+    Rating = apps.get_model('api', 'Rating')
+    UserRatingStats = apps.get_model('api', 'UserRatingStats')
+    rows = Rating.objects.order_by().values('rated_user').annotate(
+        rating_count=Count('pk'),
+        score_sum=Sum('score'),
+        **{f'score_{score}': Count('pk', filter=Q(score=score)) for score in range(1, 6)},
+    )
+    UserRatingStats.objects.bulk_create(
+        [UserRatingStats(user_id=row.pop('rated_user'), **row) for row in rows],
+        batch_size=1000,
+    )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_reservation_trip_keyset'),
+        ('user_management', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserRatingStats',
+            fields=[
+                ('user', models.OneToOneField(help_text='Utilisateur évalué', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('rating_count', models.PositiveIntegerField(default=0, help_text='Nombre de notes reçues')),
+                ('score_sum', models.PositiveIntegerField(default=0, help_text='Somme des notes reçues')),
+                ('score_1', models.PositiveIntegerField(default=0, help_text='Nombre de notes de 1')),
+                ('score_2', models.PositiveIntegerField(default=0, help_text='Nombre de notes de 2')),
+                ('score_3', models.PositiveIntegerField(default=0, help_text='Nombre de notes de 3')),
+                ('score_4', models.PositiveIntegerField(default=0, help_text='Nombre de notes de 4')),
+                ('score_5', models.PositiveIntegerField(default=0, help_text='Nombre de notes de 5')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': "statistiques d'évaluation",
+                'verbose_name_plural': "statistiques d'évaluation",
+            },
+        ),
+        migrations.RunPython(build_stats, migrations.RunPython.noop),
+    ]
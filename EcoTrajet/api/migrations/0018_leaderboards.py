@@ -0,0 +1,117 @@
+# Generated by Django 5.2.3 on 2026-10-17 05:18
+
+from collections import defaultdict
+
+import django.db.models.deletion
+import django.db.models.functions.comparison
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+
+# Copie figée de api.leaderboard : la migration ne doit pas dépendre du code courant
+PRIOR_MEAN = 3.5
+PRIOR_WEIGHT = 5
+
+
+def bayesian_score(score_sum, rating_count):
+    return round((PRIOR_WEIGHT * PRIOR_MEAN + score_sum) / (PRIOR_WEIGHT + rating_count), 6)
+
+
+def leaderboard_totals(Rating):
+    """
+    ``{communaute_id: {driver_id: (rating_count, score_sum)}}`` of the ratings
+    given to the drivers of their trips, ``None`` being the global board.
+    """
+    ratings = Rating.objects.order_by().filter(rated_user=F('trip__conducteur'))
+    totals = defaultdict(dict)
+    for row in ratings.values('rated_user').annotate(count=Count('pk'), total=Sum('score')):
+        totals[None][row['rated_user']] = (row['count'], row['total'])
+    per_community = ratings.filter(trip__communaute__isnull=False).values('trip__communaute', 'rated_user')
+    for row in per_community.annotate(count=Count('pk'), total=Sum('score')):
+        totals[row['trip__communaute']][row['rated_user']] = (row['count'], row['total'])
+    return totals
+
+
+def ranked(drivers):
+    """``[(rank, driver_id, score, rating_count, score_sum)]`` of ``{driver_id: (rating_count, score_sum)}``."""
+    rows = sorted(
+        ((bayesian_score(total, count), count, driver_id, total) for driver_id, (count, total) in drivers.items()),
+        key=lambda row: (-row[0], -row[1], row[2]),
+    )
+    return [
+        (rank, driver_id, score, count, total)
+        for rank, (score, count, driver_id, total) in enumerate(rows, start=1)
+    ]
+
+
+def build_leaderboards(apps, schema_editor):
+    """Global and community boards of the drivers already rated."""
+    Rating = apps.get_model('api', 'Rating')
+    Leaderboard = apps.get_model('api', 'Leaderboard')
+    DriverRank = apps.get_model('api', 'DriverRank')
+    for communaute_id, drivers in leaderboard_totals(Rating).items():
+        board = Leaderboard.objects.create(communaute_id=communaute_id, size=len(drivers))
+        DriverRank.objects.bulk_create(
+            [
+                DriverRank(leaderboard=board, driver_id=driver_id, rank=rank, score=score,
+                           rating_count=count, score_sum=total)
+                for rank, driver_id, score, count, total in ranked(drivers)
+            ],
+            batch_size=1000,
+        )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_user_rating_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Leaderboard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('size', models.PositiveIntegerField(default=0, help_text='Nombre de conducteurs classés')),
+                ('communaute', models.OneToOneField(blank=True, help_text='Communauté classée (aucune : classement global)', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard', to='api.community')),
+            ],
+            options={
+                'verbose_name': 'classement',
+                'verbose_name_plural': 'classements',
+            },
+        ),
+        migrations.CreateModel(
+            name='DriverRank',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveIntegerField(help_text='Rang dans le classement, à partir de 1')),
+                ('score', models.FloatField(help_text='Moyenne bayésienne des notes reçues')),
+                ('rating_count', models.PositiveIntegerField(default=0, help_text='Nombre de notes reçues')),
+                ('score_sum', models.PositiveIntegerField(default=0, help_text='Somme des notes reçues')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('driver', models.ForeignKey(help_text='Conducteur classé', on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard_ranks', to=settings.AUTH_USER_MODEL)),
+                ('leaderboard', models.ForeignKey(help_text='Classement', on_delete=django.db.models.deletion.CASCADE, related_name='ranks', to='api.leaderboard')),
+            ],
+            options={
+                'verbose_name': 'rang de conducteur',
+                'verbose_name_plural': 'rangs de conducteurs',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='leaderboard',
+            constraint=models.UniqueConstraint(django.db.models.functions.comparison.Coalesce('communaute', models.Value(0)), name='leaderboard_scope_unique'),
+        ),
+        migrations.AddIndex(
+            model_name='driverrank',
+            index=models.Index(fields=['leaderboard', 'rank'], name='driver_rank_top_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='driverrank',
+            index=models.Index(fields=['leaderboard', 'score', 'rating_count'], name='driver_rank_score_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='driverrank',
+            constraint=models.UniqueConstraint(fields=('leaderboard', 'driver'), name='driver_rank_unique'),
+        ),
+        migrations.RunPython(build_leaderboards, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.3 on 2026-10-17 05:23
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_leaderboards'),
+        ('user_management', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserReputation',
+            fields=[
+                ('user', models.OneToOneField(help_text='Utilisateur', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='reputation', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('score', models.FloatField(default=3.5, help_text='Score de réputation')),
+                ('rating_weight', models.FloatField(default=0, help_text='Volume pondéré des notes reçues (confiance)')),
+                ('cancellation_rate', models.FloatField(default=0, help_text='Part pondérée des réservations annulées')),
+                ('computed_at', models.DateTimeField(help_text='Date du calcul')),
+            ],
+            options={
+                'verbose_name': 'réputation',
+                'verbose_name_plural': 'réputations',
+            },
+        ),
+        migrations.AddField(
+            model_name='tripsearchdocument',
+            name='driver_reputation',
+            field=models.FloatField(default=3.5, help_text='Réputation du conducteur, recalculée chaque nuit'),
+        ),
+    ]
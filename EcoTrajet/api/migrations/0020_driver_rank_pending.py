@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-17 05:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_user_reputation'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='driverrank',
+            name='rank',
+            field=models.PositiveIntegerField(blank=True, help_text='Rang dans le classement, à partir de 1 (aucun : pas encore renuméroté)', null=True),
+        ),
+    ]
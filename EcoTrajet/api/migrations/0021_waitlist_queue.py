@@ -0,0 +1,57 @@
+# Generated by Django 5.2.3 on 2026-10-17 06:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def number_queues(apps, schema_editor):
+    """Sequence numbers of the entries already waiting, in id order, and the ends of their queues."""
+    WaitlistEntry = apps.get_model('api', 'WaitlistEntry')
+    WaitlistQueue = apps.get_model('api', 'WaitlistQueue')
+    tails = {}
+    entries = []
+    for entry in WaitlistEntry.objects.filter(statut='WAITING').order_by('id').only('pk', 'trip_id'):
+        tails[entry.trip_id] = entry.seq = tails.get(entry.trip_id, 0) + 1
+        entries.append(entry)
+    WaitlistEntry.objects.bulk_update(entries, ['seq'], batch_size=1000)
+    WaitlistQueue.objects.bulk_create(
+        [WaitlistQueue(trip_id=trip_id, tail=tail) for trip_id, tail in tails.items()], batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_driver_rank_pending'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WaitlistQueue',
+            fields=[
+                ('trip', models.OneToOneField(help_text='Trajet attendu', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='waitlist_queue', serialize=False, to='api.trip')),
+                ('head', models.PositiveIntegerField(default=0, help_text='Numéro de la dernière inscription sortie en tête')),
+                ('tail', models.PositiveIntegerField(default=0, help_text='Numéro de la dernière inscription entrée')),
+            ],
+            options={
+                'verbose_name': "file d'attente",
+                'verbose_name_plural': "files d'attente",
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name='waitlistentry',
+            name='waitlist_queue_idx',
+        ),
+        migrations.AddField(
+            model_name='waitlistentry',
+            name='seq',
+            field=models.PositiveIntegerField(blank=True, help_text='Numéro dans la file du trajet (aucun : sortie de la file)', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='waitlistentry',
+            index=models.Index(condition=models.Q(('statut', 'WAITING')), fields=['trip', 'seq'], name='waitlist_seq_idx'),
+        ),
+        migrations.RunPython(number_queues, migrations.RunPython.noop),
+    ]
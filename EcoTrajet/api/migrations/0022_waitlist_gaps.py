@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-17 06:33
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_waitlist_queue'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='waitlistqueue',
+            name='head',
+        ),
+    ]
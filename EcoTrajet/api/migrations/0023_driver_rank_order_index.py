@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-17 06:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0022_waitlist_gaps'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='driverrank',
+            name='driver_rank_score_idx',
+        ),
+        migrations.AddIndex(
+            model_name='driverrank',
+            index=models.Index(fields=['leaderboard', '-score', '-rating_count', 'driver'], name='driver_rank_order_idx'),
+        ),
+    ]
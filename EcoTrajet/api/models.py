@@ -1,8 +1,23 @@
-from django.db import models
+from django.db import models, transaction
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
 from user_management.models import User
+from django.db.models import Q, Value
+from django.db.models.functions import Coalesce
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.text import slugify
+from functools import partial
+from .alerts import MAX_WINDOW_DAYS, index_saved_search, percolate
+from .booking import book_seats, cancel_trips, enqueue, hold_expiry, promote_waitlist
+from .documents import refresh_documents, refresh_driver_ratings, sync_trip_document
+from .geo import encode as geohash_encode
+from .leaderboard import PRIOR_MEAN, record_leaderboards
+from .routes import index_trip_route
+from .ratings import SCORES, record_ratings, score_column
+from .tracking import LoadedValuesModel, TrackedModel, next_version
+from .utils import normalize_place
 import uuid
 
 class Community(models.Model):
@@ -31,7 +46,86 @@ class Community(models.Model):
         return self.name
 
 
-class Trip(models.Model):
+class PlaceManager(models.Manager):
+    """
+    Custom manager for Place model resolving free text to a canonical place.
+    """
+    def resolve(self, text):
+        """Retourne le lieu dont le nom ou un alias correspond au texte, sinon None"""
+        slug = slugify(normalize_place(text))
+        if not slug:
+            return None
+        return self.filter(Q(slug=slug) | Q(aliases__slug=slug)).distinct().first()
+
+
+class Place(models.Model):
+    """
+    Canonical place (city, station, ...) that trips depart from or arrive at.
+    """
+    name = models.CharField(max_length=100, help_text="Nom canonique du lieu")
+    slug = models.SlugField(
+        max_length=100,
+        unique=True,
+        help_text="Nom sans accents ni majuscules, utilisé pour la recherche"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = PlaceManager()
+
+    class Meta:
+        verbose_name = 'lieu'
+        verbose_name_plural = 'lieux'
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+    def save(self, *args, **kwargs):
+        if not self.slug:
+            self.slug = slugify(normalize_place(self.name))
+        super().save(*args, **kwargs)
+
+    def link_trips(self, names):
+        """Rattache au lieu les trajets existants saisis sous l'un de ces noms"""
+        forms = {normalize_place(name) for name in names} - {''}
+        now = timezone.now()
+        for model, extra in ((Trip, {'version': next_version(), 'updated_at': now}), (TripSearchDocument, {})):
+            model.objects.filter(origine_place__isnull=True, origine_norm__in=forms).update(
+                origine_place=self, **extra
+            )
+            model.objects.filter(destination_place__isnull=True, destination_norm__in=forms).update(
+                destination_place=self, **extra
+            )
+
+
+class PlaceAlias(models.Model):
+    """
+    Alternative name of a place ("Paris Gare de Lyon" for Paris, ...).
+    """
+    place = models.ForeignKey(
+        Place,
+        on_delete=models.CASCADE,
+        related_name='aliases',
+        help_text="Lieu canonique"
+    )
+    name = models.CharField(max_length=100, help_text="Nom alternatif")
+    slug = models.SlugField(max_length=100, unique=True, help_text="Alias sans accents ni majuscules")
+
+    class Meta:
+        verbose_name = 'alias de lieu'
+        verbose_name_plural = 'alias de lieux'
+
+    def __str__(self):
+        return f"{self.name} → {self.place}"
+
+    def save(self, *args, **kwargs):
+        if not self.slug:
+            self.slug = slugify(normalize_place(self.name))
+        super().save(*args, **kwargs)
+
+
+class Trip(TrackedModel):
     """
     Trip model for storing information about rides offered by drivers.
     """
@@ -67,6 +161,76 @@ class Trip(models.Model):
     temps_arrive = models.DateTimeField(help_text="Date et heure d'arrivée estimée")
     origine = models.CharField(max_length=100, help_text="Lieu de départ")
     destination = models.CharField(max_length=100, help_text="Lieu d'arrivée")
+    origine_place = models.ForeignKey(
+        Place,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='departing_trips',
+        help_text="Lieu canonique de départ (déduit de origine si absent)"
+    )
+    destination_place = models.ForeignKey(
+        Place,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='arriving_trips',
+        help_text="Lieu canonique d'arrivée (déduit de destination si absent)"
+    )
+    # Coordonnées et geohash précalculé pour la recherche par rayon
+    origine_lat = models.FloatField(
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(-90), MaxValueValidator(90)],
+        help_text="Latitude du lieu de départ"
+    )
+    origine_lon = models.FloatField(
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(-180), MaxValueValidator(180)],
+        help_text="Longitude du lieu de départ"
+    )
+    origine_geohash = models.CharField(
+        max_length=12,
+        blank=True,
+        editable=False,
+        help_text="Geohash du lieu de départ"
+    )
+    destination_lat = models.FloatField(
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(-90), MaxValueValidator(90)],
+        help_text="Latitude du lieu d'arrivée"
+    )
+    destination_lon = models.FloatField(
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(-180), MaxValueValidator(180)],
+        help_text="Longitude du lieu d'arrivée"
+    )
+    destination_geohash = models.CharField(
+        max_length=12,
+        blank=True,
+        editable=False,
+        help_text="Geohash du lieu d'arrivée"
+    )
+    route_polyline = models.TextField(
+        blank=True,
+        help_text="Itinéraire encodé (format polyline), indexé pour la recherche par corridor"
+    )
+    # Formes normalisées (minuscules, sans accents) utilisées par la recherche
+    origine_norm = models.CharField(
+        max_length=100,
+        blank=True,
+        editable=False,
+        help_text="Lieu de départ normalisé pour la recherche"
+    )
+    destination_norm = models.CharField(
+        max_length=100,
+        blank=True,
+        editable=False,
+        help_text="Lieu d'arrivée normalisé pour la recherche"
+    )
     prix = models.DecimalField(
         max_digits=6, 
         decimal_places=2,
@@ -86,6 +250,23 @@ class Trip(models.Model):
         verbose_name = 'trajet'
         verbose_name_plural = 'trajets'
         ordering = ['-temps_depart']
+        # Index pour la recherche de trajets
+        indexes = [
+            models.Index(fields=['statut', 'temps_depart'], name='trip_statut_depart_idx'),
+            models.Index(
+                fields=['origine_norm', 'destination_norm', 'temps_depart'],
+                name='trip_route_depart_idx'
+            ),
+            models.Index(fields=['temps_depart', 'id'], name='trip_depart_keyset_idx'),
+            models.Index(
+                fields=['origine_place', 'destination_place', 'temps_depart'],
+                name='trip_place_depart_idx'
+            ),
+            models.Index(fields=['origine_geohash'], name='trip_origine_geohash_idx'),
+            models.Index(fields=['destination_geohash'], name='trip_dest_geohash_idx'),
+            # Flux de modifications lu par les index en mémoire (cf. api.journeys)
+            models.Index(fields=['updated_at'], name='trip_updated_at_idx'),
+        ]
 
     def __str__(self):
         return f"{self.origine} → {self.destination} ({self.temps_depart.strftime('%d/%m/%Y %H:%M')}) - {self.conducteur.email}"
@@ -100,15 +281,210 @@ class Trip(models.Model):
         if self.temps_arrive <= self.temps_depart:
             raise ValidationError("L'heure d'arrivée doit être après l'heure de départ !")
 
+    # Critères confrontés aux recherches enregistrées (cf. api.alerts)
+    PERCOLATION_FIELDS = (
+        'origine_place_id', 'destination_place_id', 'temps_depart', 'statut', 'prix', 'places_dispo',
+    )
+
+    def _needs_percolation(self):
+        if self._state.adding:
+            return True
+        previous = tuple(self.loaded(name) for name in self.PERCOLATION_FIELDS)
+        current = tuple(getattr(self, name) for name in self.PERCOLATION_FIELDS)
+        if previous[:4] != current[:4]:
+            return True
+        # Seules une baisse de prix ou une hausse des places libres créent de nouvelles correspondances
+        (old_price, old_seats), (price, seats) = previous[4:], current[4:]
+        return (
+            None not in (old_price, price) and price < old_price
+            or None not in (old_seats, seats) and seats > old_seats
+        )
+
+    def save(self, *args, **kwargs):
+        # Seuls les trajets programmés sont présents dans la grille (cf. TripRouteCell)
+        reindex_route = self._state.adding or (
+            (self.route_polyline, self.statut == 'SCHEDULED')
+            != (self.loaded('route_polyline'), self.loaded('statut') == 'SCHEDULED')
+        )
+        percolate_trip = self._needs_percolation()
+        origine_norm = normalize_place(self.origine)
+        destination_norm = normalize_place(self.destination)
+        # Lieux canoniques : résolus à la création s'ils sont absents, puis quand le
+        # texte est modifié (les trajets existants sont rattachés par Place.link_trips)
+        adding = self._state.adding
+        if (adding and self.origine_place_id is None) or (not adding and origine_norm != self.origine_norm):
+            self.origine_place = Place.objects.resolve(self.origine)
+        if (adding and self.destination_place_id is None) or (
+            not adding and destination_norm != self.destination_norm
+        ):
+            self.destination_place = Place.objects.resolve(self.destination)
+        self.origine_norm = origine_norm
+        self.destination_norm = destination_norm
+        self.origine_geohash = self._geohash(self.origine_lat, self.origine_lon)
+        self.destination_geohash = self._geohash(self.destination_lat, self.destination_lon)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            for prefix in ('origine', 'destination'):
+                if prefix in update_fields:
+                    update_fields.update({f'{prefix}_norm', f'{prefix}_place'})
+                if {f'{prefix}_lat', f'{prefix}_lon'} & update_fields:
+                    update_fields.add(f'{prefix}_geohash')
+            kwargs['update_fields'] = update_fields
+            reindex_route = reindex_route and bool({'route_polyline', 'statut'} & update_fields)
+        # Le trajet, sa grille d'itinéraire et son document de recherche sont
+        # écrits dans la même transaction
+        with transaction.atomic(using=kwargs.get('using'), savepoint=False):
+            super().save(*args, **kwargs)
+            if reindex_route:
+                index_trip_route(self)
+            if adding:
+                refresh_documents(Trip.objects.filter(pk=self.pk))
+            else:
+                sync_trip_document(self, update_fields)
+            # Places ajoutées par le conducteur : servies d'abord à la liste d'attente
+            seats_added = not adding and self.places_dispo > (self.loaded('places_dispo') or 0)
+            if seats_added and promote_waitlist(self.pk, kwargs.get('using')):
+                # Places et version modifiées en base par les promotions
+                self.refresh_from_db(using=kwargs.get('using'), fields=['places_dispo', 'version'])
+            if percolate_trip:
+                # Alertes mises en file une fois le trajet validé, hors de sa transaction
+                transaction.on_commit(partial(percolate, self), using=kwargs.get('using'))
+        self.remember_values(kwargs.get('update_fields'))
+
+    @staticmethod
+    def _geohash(lat, lon):
+        if lat is None or lon is None:
+            return ''
+        return geohash_encode(lat, lon)
+
     def is_fully_booked(self):
         return self.places_dispo == 0
 
     def cancel(self):
-        self.statut = 'CANCELLED'
-        self.save()
+        """Cancel the trip with its reservations and waitlist (cf. api.booking.cancel_trips)."""
+        cancel_trips([self.pk], using=self._state.db)
+        self.refresh_from_db(fields=['statut', 'places_dispo', 'version', 'updated_at'])
+
+
+class TripRouteCell(models.Model):
+    """
+    Grid index of trip routes: one row per (trip, geohash cell) crossed, with
+    the first and last positions of the route inside the cell.
+    """
+    trip = models.ForeignKey(
+        Trip,
+        on_delete=models.CASCADE,
+        related_name='route_cells',
+        help_text="Trajet dont l'itinéraire traverse la cellule"
+    )
+    cell = models.CharField(max_length=12, help_text="Cellule geohash de la grille")
+    first_position = models.PositiveIntegerField(help_text="Premier point de l'itinéraire dans la cellule")
+    last_position = models.PositiveIntegerField(help_text="Dernier point de l'itinéraire dans la cellule")
+
+    class Meta:
+        verbose_name = "cellule d'itinéraire"
+        verbose_name_plural = "cellules d'itinéraire"
+        unique_together = ['trip', 'cell']
+        indexes = [
+            models.Index(fields=['cell', 'trip'], name='route_cell_trip_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.cell} → trajet #{self.trip_id}"
+
+
+class TripSearchDocument(models.Model):
+    """
+    Denormalized copy of a trip and of everything its search result shows,
+    kept up to date on write (cf. api.documents) so that searching reads a
+    single table.
+    """
+    trip = models.OneToOneField(
+        Trip,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='search_document',
+        help_text="Trajet décrit par le document"
+    )
+    conducteur = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        help_text="Conducteur du trajet"
+    )
+    vehicule = models.ForeignKey(
+        'user_management.Vehicule',
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='+',
+        help_text="Véhicule du trajet"
+    )
+    communaute = models.ForeignKey(
+        Community,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='+',
+        help_text="Communauté liée au trajet"
+    )
+    origine = models.CharField(max_length=100, help_text="Lieu de départ")
+    destination = models.CharField(max_length=100, help_text="Lieu d'arrivée")
+    origine_norm = models.CharField(max_length=100, blank=True, help_text="Lieu de départ normalisé")
+    destination_norm = models.CharField(max_length=100, blank=True, help_text="Lieu d'arrivée normalisé")
+    origine_place = models.ForeignKey(
+        Place,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='+',
+        help_text="Lieu canonique de départ"
+    )
+    destination_place = models.ForeignKey(
+        Place,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='+',
+        help_text="Lieu canonique d'arrivée"
+    )
+    temps_depart = models.DateTimeField(help_text="Date et heure de départ")
+    temps_arrive = models.DateTimeField(help_text="Date et heure d'arrivée estimée")
+    prix = models.DecimalField(max_digits=6, decimal_places=2, help_text="Prix par passager")
+    places_dispo = models.PositiveIntegerField(help_text="Places libres")
+    statut = models.CharField(max_length=15, choices=Trip.STATUS_CHOICES, help_text="État du trajet")
+    driver_name = models.CharField(max_length=110, help_text="Nom affiché du conducteur")
+    driver_rating = models.DecimalField(
+        max_digits=3,
+        decimal_places=2,
+        default=0,
+        help_text="Note moyenne reçue par le conducteur"
+    )
+    driver_rating_count = models.PositiveIntegerField(default=0, help_text="Nombre de notes du conducteur")
+    driver_reputation = models.FloatField(
+        default=PRIOR_MEAN,
+        help_text="Réputation du conducteur, recalculée chaque nuit"
+    )
+    vehicle_label = models.CharField(max_length=101, blank=True, help_text="Marque et modèle du véhicule")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'document de recherche'
+        verbose_name_plural = 'documents de recherche'
+        indexes = [
+            models.Index(
+                fields=['statut', 'origine_place', 'destination_place', 'temps_depart', 'trip'],
+                name='tripdoc_place_depart_idx'
+            ),
+            models.Index(
+                fields=['statut', 'origine_norm', 'destination_norm', 'temps_depart', 'trip'],
+                name='tripdoc_route_depart_idx'
+            ),
+            models.Index(fields=['statut', 'temps_depart', 'trip'], name='tripdoc_statut_depart_idx'),
+        ]
+
+    def __str__(self):
+        return f"Document du trajet #{self.trip_id}"
 
 
-class Reservation(models.Model):
+class Reservation(TrackedModel):
     """
     Reservation model for booking seats on trips.
     """
@@ -116,6 +492,7 @@ class Reservation(models.Model):
         ('PENDING', 'En attente'),
         ('CONFIRMED', 'Confirmé'),
         ('CANCELLED', 'Annulé'),
+        ('EXPIRED', 'Expiré'),
     ]
 
     passenger = models.ForeignKey(
@@ -140,6 +517,11 @@ class Reservation(models.Model):
         default='PENDING',
         help_text="État de la réservation"
     )
+    expires_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Fin du blocage des places d'une réservation en attente"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -147,6 +529,11 @@ class Reservation(models.Model):
         verbose_name = 'réservation'
         verbose_name_plural = 'réservations'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['passenger', 'created_at', 'id'], name='resa_passenger_keyset_idx'),
+            models.Index(fields=['trip', 'created_at', 'id'], name='resa_trip_keyset_idx'),
+            models.Index(fields=['statut', 'expires_at'], name='resa_hold_expiry_idx'),
+        ]
 
     def __str__(self):
         return f"Reservation #{self.id}: {self.passenger.nom} {self.passenger.prenom} → {self.trip} (Status: {self.statut})"
@@ -159,80 +546,178 @@ class Reservation(models.Model):
             raise ValidationError("Le nombre de places réservées dépasse les places disponibles !")
         if self.place_reserv <= 0:
             raise ValidationError("Le nombre de places réservées doit être positif !")
-        
+
     def save(self, *args, **kwargs):
-        if self.statut == 'CONFIRMED' and self.pk:  # Only if status changed to CONFIRMED
-            try:
-                old_reservation = Reservation.objects.get(pk=self.pk)
-                if old_reservation.statut != 'CONFIRMED':
-                    self.trip.places_dispo -= self.place_reserv
-                    self.trip.save()
-            except Reservation.DoesNotExist:
-                # First save, directly reduce places
-                self.trip.places_dispo -= self.place_reserv
-                self.trip.save()
-        super().save(*args, **kwargs)
+        # Une demande en attente bloque ses places jusqu'à expires_at (cf. api.booking.expire_holds)
+        held_again = not self._state.adding and self.loaded('statut') != 'PENDING'
+        if self.statut == 'PENDING' and (self.expires_at is None or held_again):
+            self.expires_at = hold_expiry()
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'expires_at'}
+        # La réservation, les places du trajet et son document de recherche changent ensemble
+        with transaction.atomic(using=kwargs.get('using'), savepoint=False):
+            refused = book_seats(self, kwargs.get('using'))
+            if refused is None:
+                super().save(*args, **kwargs)
+        # Refus levé hors du bloc : rien n'a été écrit, la transaction appelante reste utilisable
+        if refused is not None:
+            raise refused
+        # État dont les places sont décomptées dans trip.places_dispo (cf. api.booking)
+        self.remember_values(kwargs.get('update_fields'))
 
 
-#Modèle pour les évaluations après trajets
-class Rating(models.Model):
+
+class WaitlistEntry(models.Model):
     """
-    Rating model for user reviews after trips.
+    Passenger waiting for seats on a full trip. Waiting entries are served in
+    the order of their sequence number in the queue of the trip, indexed with
+    the trip, so that the head and the position of an entry are index reads
+    (cf. api.booking and ``WaitlistQueue``). The numbers have gaps where
+    entries left.
     """
-    idRate = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    reviewer = models.ForeignKey(
-        User,
+    STATUS_CHOICES = [
+        ('WAITING', "En file d'attente"),
+        ('PROMOTED', 'Promu'),
+        ('CANCELLED', 'Annulé'),
+    ]
+
+    trip = models.ForeignKey(
+        Trip,
         on_delete=models.CASCADE,
-        related_name='given_ratings',
-        help_text="Utilisateur qui donne la note"
+        related_name='waitlist',
+        help_text="Trajet attendu"
     )
-    rated_user = models.ForeignKey(
+    passenger = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
-        related_name='received_ratings',
-        help_text="Utilisateur qui reçoit la note"
+        related_name='waitlist_entries',
+        help_text="Passager en attente"
     )
-    trip = models.ForeignKey(
-        Trip,
-        on_delete=models.CASCADE,
-        related_name='ratings',
-        help_text="Trajet concerné par l'évaluation"
+    place_reserv = models.PositiveIntegerField(
+        default=1,
+        validators=[MinValueValidator(1)],
+        help_text="Nombre de places demandées"
     )
-    score = models.PositiveIntegerField(
-        validators=[MinValueValidator(1), MaxValueValidator(5)],
-        help_text="Note de 1 à 5 étoiles"
+    statut = models.CharField(max_length=10, choices=STATUS_CHOICES, default='WAITING')
+    reservation = models.ForeignKey(
+        Reservation,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        help_text="Réservation créée lors de la promotion"
     )
-    commentaires = models.TextField(
+    seq = models.PositiveIntegerField(
+        null=True,
         blank=True,
-        help_text="Commentaire optionnel"
+        help_text="Numéro dans la file du trajet (aucun : sortie de la file)"
     )
     created_at = models.DateTimeField(auto_now_add=True)
-    
+    updated_at = models.DateTimeField(auto_now=True)
+
     class Meta:
-        db_table = 'rating'
-        verbose_name = 'évaluation'
-        verbose_name_plural = 'évaluations'
-        # Contrainte pour éviter les doublons
-        unique_together = ['reviewer', 'rated_user', 'trip']
-        # Index pour les requêtes fréquentes
+        verbose_name = "inscription en liste d'attente"
+        verbose_name_plural = "inscriptions en liste d'attente"
+        ordering = ['id']
         indexes = [
-            models.Index(fields=['rated_user', 'score']),
-            models.Index(fields=['trip']),
+            models.Index(fields=['trip', 'seq'], condition=Q(statut='WAITING'), name='waitlist_seq_idx'),
         ]
-        
+        constraints = [
+            models.UniqueConstraint(
+                fields=['trip', 'passenger'],
+                condition=Q(statut='WAITING'),
+                name='waitlist_single_entry',
+            ),
+        ]
+
     def __str__(self):
-        return f"Note {self.score}/5 - {self.reviewer} -> {self.rated_user}"
-    
-    def clean(self):
-        # Validation
-        # Un utilisateur ne peut pas se noter lui-même
-        if self.reviewer == self.rated_user:
-            raise ValidationError("Un utilisateur ne peut pas s'auto-évaluer")
-        
+        return f"Attente #{self.id}: {self.passenger_id} → trajet #{self.trip_id} ({self.statut})"
+
     def save(self, *args, **kwargs):
-        self.clean()
-        super().save(*args, **kwargs)
+        # Numéro attribué à l'inscription, dans la transaction de son insertion
+        with transaction.atomic(using=kwargs.get('using'), savepoint=False):
+            if self._state.adding and self.statut == 'WAITING' and self.seq is None:
+                enqueue(self, kwargs.get('using'))
+            super().save(*args, **kwargs)
+
+    def queue_position(self):
+        """1-based position in the queue of a waiting entry, else None."""
+        if self.statut != 'WAITING':
+            return None
+        # Intervalle de l'index (trip, seq) des inscriptions en attente
+        return WaitlistEntry.objects.filter(trip_id=self.trip_id, statut='WAITING', seq__lte=self.seq).count()
+
 
+class WaitlistQueue(models.Model):
+    """
+    Tail of the waitlist of a trip: the sequence number given to the last
+    entry that joined (cf. api.booking). The row is locked after the trip row
+    whenever an entry joins, and deleted when the trip is cancelled.
+    """
+    trip = models.OneToOneField(
+        Trip,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='waitlist_queue',
+        help_text="Trajet attendu"
+    )
+    tail = models.PositiveIntegerField(default=0, help_text="Numéro de la dernière inscription entrée")
+
+    class Meta:
+        verbose_name = "file d'attente"
+        verbose_name_plural = "files d'attente"
+
+    def __str__(self):
+        return f"File du trajet #{self.trip_id} ({self.tail} inscriptions)"
+
+
+
+class ReservationJob(models.Model):
+    """
+    Refund or notification owed to a passenger after a trip was cancelled,
+    recorded in the transaction of the cancellation (cf.
+    api.booking.cancel_trips) and processed later, in id order.
+    """
+    KIND_CHOICES = [
+        ('REFUND', 'Remboursement'),
+        ('NOTIFICATION', 'Notification'),
+    ]
+
+    kind = models.CharField(max_length=15, choices=KIND_CHOICES)
+    trip = models.ForeignKey(Trip, on_delete=models.CASCADE, related_name='jobs', help_text="Trajet annulé")
+    passenger = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='reservation_jobs',
+        help_text="Passager à rembourser ou à prévenir"
+    )
+    reservation = models.ForeignKey(
+        Reservation,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='jobs',
+        help_text="Réservation annulée (vide pour une inscription en liste d'attente)"
+    )
+    amount = models.DecimalField(
+        max_digits=8,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        help_text="Montant à rembourser"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True, help_text="Date de traitement")
+
+    class Meta:
+        verbose_name = 'tâche de réservation'
+        verbose_name_plural = 'tâches de réservation'
+        indexes = [
+            models.Index(fields=['processed_at', 'id'], name='reservation_job_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} trajet #{self.trip_id} pour {self.passenger_id}"
 
 # Custom manager for Rating model
 class RatingManager(models.Manager):
@@ -240,18 +725,16 @@ class RatingManager(models.Manager):
     Custom manager for Rating model with additional calculation methods.
     """
     def average_for_user(self, user):
-        """Calcule la moyenne des notes pour un utilisateur"""
-        ratings = self.filter(rated_user=user)
-        if ratings.exists():
-            total = sum(rating.score for rating in ratings)
-            return round(total / ratings.count(), 2)
-        return 0
-    
+        """Calcule la moyenne des notes pour un utilisateur (cf. UserRatingStats)"""
+        return UserRatingStats.for_user(user).average
+
     def count_for_user(self, user):
         """Compte le nombre d'évaluations pour un utilisateur"""
-        return self.filter(rated_user=user).count()
+        return UserRatingStats.for_user(user).rating_count
+
 
-class Rating(models.Model):
+#Modèle pour les évaluations après trajets
+class Rating(LoadedValuesModel):
     """
     Rating model for user reviews after trips.
     """
@@ -298,6 +781,7 @@ class Rating(models.Model):
         indexes = [
             models.Index(fields=['rated_user', 'score']),
             models.Index(fields=['trip']),
+            models.Index(fields=['created_at', 'idRate'], name='rating_created_keyset_idx'),
         ]
         
     def __str__(self):
@@ -311,4 +795,304 @@ class Rating(models.Model):
         
     def save(self, *args, **kwargs):
         self.clean()
-        super().save(*args, **kwargs)
\ No newline at end of file
+        changes = [(self.rated_user_id, self.trip_id, self.score, 1)]
+        if not self._state.adding:
+            changes.append((self.loaded('rated_user_id'), self.loaded('trip_id'), self.loaded('score'), -1))
+        # Statistiques du noté, classements des conducteurs et note moyenne
+        # recopiée dans les documents de recherche du conducteur
+        with transaction.atomic(using=kwargs.get('using'), savepoint=False):
+            super().save(*args, **kwargs)
+            record_ratings([(user_id, score, delta) for user_id, _, score, delta in changes], kwargs.get('using'))
+            record_leaderboards(changes, kwargs.get('using'))
+            refresh_driver_ratings({user_id for user_id, _, _, _ in changes})
+        self.remember_values(kwargs.get('update_fields'))
+
+
+class UserRatingStats(models.Model):
+    """
+    Count, sum and histogram of the scores received by a user, maintained
+    with F-expressions on every change of their ratings (cf. api.ratings),
+    so that reading them is a primary-key lookup.
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='rating_stats',
+        help_text="Utilisateur évalué"
+    )
+    rating_count = models.PositiveIntegerField(default=0, help_text="Nombre de notes reçues")
+    score_sum = models.PositiveIntegerField(default=0, help_text="Somme des notes reçues")
+    score_1 = models.PositiveIntegerField(default=0, help_text="Nombre de notes de 1")
+    score_2 = models.PositiveIntegerField(default=0, help_text="Nombre de notes de 2")
+    score_3 = models.PositiveIntegerField(default=0, help_text="Nombre de notes de 3")
+    score_4 = models.PositiveIntegerField(default=0, help_text="Nombre de notes de 4")
+    score_5 = models.PositiveIntegerField(default=0, help_text="Nombre de notes de 5")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "statistiques d'évaluation"
+        verbose_name_plural = "statistiques d'évaluation"
+
+    def __str__(self):
+        return f"Notes de {self.user_id} : {self.average}/5 ({self.rating_count})"
+
+    @classmethod
+    def for_user(cls, user):
+        """Stats of ``user`` (an instance or a pk), empty if they were never rated."""
+        user_id = getattr(user, 'pk', user)
+        return cls.objects.filter(pk=user_id).first() or cls(user_id=user_id)
+
+    @property
+    def average(self):
+        if not self.rating_count:
+            return 0
+        return round(self.score_sum / self.rating_count, 2)
+
+    def histogram(self):
+        """``{score: count}`` for the scores 1 to 5."""
+        return {score: getattr(self, score_column(score)) for score in SCORES}
+
+
+class UserReputation(models.Model):
+    """
+    Reputation of a user: time-decayed average of their scores weighted by
+    volume, lowered by their cancellations, recomputed every night by
+    ``compute_reputations`` (cf. api.reputation).
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='reputation',
+        help_text="Utilisateur"
+    )
+    score = models.FloatField(default=PRIOR_MEAN, help_text="Score de réputation")
+    rating_weight = models.FloatField(default=0, help_text="Volume pondéré des notes reçues (confiance)")
+    cancellation_rate = models.FloatField(default=0, help_text="Part pondérée des réservations annulées")
+    computed_at = models.DateTimeField(help_text="Date du calcul")
+
+    class Meta:
+        verbose_name = 'réputation'
+        verbose_name_plural = 'réputations'
+
+    def __str__(self):
+        return f"Réputation de {self.user_id} : {self.score}"
+
+    @classmethod
+    def for_user(cls, user):
+        """Reputation of ``user`` (an instance or a pk), the prior mean if it was never computed."""
+        user_id = getattr(user, 'pk', user)
+        return cls.objects.filter(pk=user_id).first() or cls(user_id=user_id)
+
+
+class Leaderboard(models.Model):
+    """
+    Ranking of the drivers of a community, or of all drivers when it has no
+    community (cf. api.leaderboard). Its size follows the drivers entering
+    and leaving it.
+    """
+    communaute = models.OneToOneField(
+        Community,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='leaderboard',
+        help_text="Communauté classée (aucune : classement global)"
+    )
+    size = models.PositiveIntegerField(default=0, help_text="Nombre de conducteurs classés")
+
+    class Meta:
+        verbose_name = 'classement'
+        verbose_name_plural = 'classements'
+        constraints = [
+            # Un seul classement global
+            models.UniqueConstraint(Coalesce('communaute', Value(0)), name='leaderboard_scope_unique'),
+        ]
+
+    def __str__(self):
+        return f"Classement {self.communaute_id or 'global'} ({self.size})"
+
+
+class DriverRank(models.Model):
+    """
+    Place of a driver in a leaderboard, by Bayesian average of their scores.
+    """
+    leaderboard = models.ForeignKey(
+        Leaderboard,
+        on_delete=models.CASCADE,
+        related_name='ranks',
+        help_text="Classement"
+    )
+    driver = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='leaderboard_ranks',
+        help_text="Conducteur classé"
+    )
+    rank = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text="Rang dans le classement, à partir de 1 (aucun : pas encore renuméroté)"
+    )
+    score = models.FloatField(help_text="Moyenne bayésienne des notes reçues")
+    rating_count = models.PositiveIntegerField(default=0, help_text="Nombre de notes reçues")
+    score_sum = models.PositiveIntegerField(default=0, help_text="Somme des notes reçues")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'rang de conducteur'
+        verbose_name_plural = 'rangs de conducteurs'
+        constraints = [
+            models.UniqueConstraint(fields=['leaderboard', 'driver'], name='driver_rank_unique'),
+        ]
+        indexes = [
+            # Rangs en cache (cf. rank_leaderboards)
+            models.Index(fields=['leaderboard', 'rank'], name='driver_rank_top_idx'),
+            # Meilleurs conducteurs, rang d'un conducteur et renumérotation : parcours dans l'ordre du classement
+            models.Index(fields=['leaderboard', '-score', '-rating_count', 'driver'], name='driver_rank_order_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.rank}. {self.driver_id} ({self.score})"
+
+
+class SavedSearch(models.Model):
+    """
+    Trip search saved by a passenger, who is alerted when a matching trip is
+    posted (cf. api.alerts).
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='saved_searches',
+        help_text="Passager à prévenir"
+    )
+    origine_place = models.ForeignKey(
+        Place,
+        on_delete=models.CASCADE,
+        related_name='+',
+        help_text="Lieu de départ recherché"
+    )
+    destination_place = models.ForeignKey(
+        Place,
+        on_delete=models.CASCADE,
+        related_name='+',
+        help_text="Lieu d'arrivée recherché"
+    )
+    date_debut = models.DateField(help_text="Premier jour de départ accepté")
+    date_fin = models.DateField(help_text="Dernier jour de départ accepté")
+    prix_max = models.DecimalField(
+        max_digits=6,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        help_text="Prix maximum par passager (optionnel)"
+    )
+    places_min = models.PositiveIntegerField(default=1, help_text="Nombre minimum de places libres")
+    active = models.BooleanField(default=True, help_text="Alertes activées")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'recherche enregistrée'
+        verbose_name_plural = 'recherches enregistrées'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.origine_place} → {self.destination_place} ({self.date_debut} - {self.date_fin})"
+
+    def clean(self):
+        if self.date_fin < self.date_debut:
+            raise ValidationError("La fin de la période doit suivre son début !")
+        if (self.date_fin - self.date_debut).days >= MAX_WINDOW_DAYS:
+            raise ValidationError(f"La période ne peut dépasser {MAX_WINDOW_DAYS} jours !")
+
+    def save(self, *args, **kwargs):
+        # La recherche et son index inversé sont écrits ensemble
+        with transaction.atomic(using=kwargs.get('using'), savepoint=False):
+            super().save(*args, **kwargs)
+            index_saved_search(self)
+
+
+class SavedSearchKey(models.Model):
+    """
+    Inverted index of the saved searches: one row per (origin place,
+    destination place, day) of a search, with its price and seat criteria.
+    """
+    saved_search = models.ForeignKey(
+        SavedSearch,
+        on_delete=models.CASCADE,
+        related_name='keys',
+        help_text="Recherche indexée"
+    )
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', help_text="Passager à prévenir")
+    origine_place = models.ForeignKey(Place, on_delete=models.CASCADE, related_name='+')
+    destination_place = models.ForeignKey(Place, on_delete=models.CASCADE, related_name='+')
+    day = models.DateField(help_text="Jour de départ recherché")
+    prix_max = models.DecimalField(max_digits=6, decimal_places=2, null=True, blank=True)
+    places_min = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        verbose_name = "clé de recherche enregistrée"
+        verbose_name_plural = "clés de recherches enregistrées"
+        indexes = [
+            models.Index(fields=['origine_place', 'destination_place', 'day'], name='saved_search_key_idx'),
+            models.Index(fields=['day'], name='saved_search_key_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.origine_place_id} → {self.destination_place_id} le {self.day}"
+
+
+class TripAlert(models.Model):
+    """Queued notification of a trip matching a saved search."""
+    saved_search = models.ForeignKey(
+        SavedSearch,
+        on_delete=models.CASCADE,
+        related_name='alerts',
+        help_text="Recherche correspondante"
+    )
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='trip_alerts', help_text="Passager à prévenir")
+    trip = models.ForeignKey(Trip, on_delete=models.CASCADE, related_name='alerts', help_text="Trajet correspondant")
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True, help_text="Date d'envoi de la notification")
+
+    class Meta:
+        verbose_name = 'alerte de trajet'
+        verbose_name_plural = 'alertes de trajet'
+        unique_together = ['saved_search', 'trip']
+        indexes = [
+            models.Index(fields=['sent_at', 'id'], name='trip_alert_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"Alerte trajet #{self.trip_id} pour {self.user_id}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    Response of a creation request sent with an Idempotency-Key header,
+    replayed when the client retries with the same key (cf. api.idempotency).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', help_text="Auteur de la requête")
+    endpoint = models.CharField(max_length=200, help_text="Chemin de la requête")
+    key = models.CharField(max_length=255, help_text="Valeur de l'en-tête Idempotency-Key")
+    fingerprint = models.CharField(max_length=64, help_text="Empreinte SHA-256 du corps de la requête")
+    # Renseignés dans la transaction qui insère la clé : jamais vides une fois visibles
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response_body = models.JSONField(encoder=DjangoJSONEncoder, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(help_text="Date à partir de laquelle la clé peut être réutilisée")
+
+    class Meta:
+        verbose_name = "clé d'idempotence"
+        verbose_name_plural = "clés d'idempotence"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'endpoint', 'key'], name='idempotency_key_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='idempotency_key_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.endpoint} [{self.key}]"
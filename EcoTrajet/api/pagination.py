@@ -0,0 +1,160 @@
+import base64
+import json
+from datetime import date, datetime
+from uuid import UUID
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(PageNumberPagination):
+    """
+    Page-number pagination by default, keyset (cursor) pagination on request.
+
+    Clients opt in with ``?pagination=cursor`` and then follow the opaque
+    ``next``/``previous`` links. Keyset pages never run ``COUNT(*)`` nor
+    ``OFFSET``: each page is a range read on the view's ``keyset_ordering``
+    (e.g. ``('-temps_depart', '-id')``), whose last field must be unique.
+    Ordering fields may be annotations of the queryset (e.g. a column of a
+    joined table), read from the rows like model fields.
+    """
+    cursor_query_param = 'cursor'
+    mode_query_param = 'pagination'
+    invalid_cursor_message = 'Curseur invalide.'
+
+    @classmethod
+    def wants_keyset(cls, request):
+        return (
+            request.query_params.get(cls.mode_query_param) == 'cursor'
+            or cls.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.use_keyset = self.wants_keyset(request)
+        if not self.use_keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.ordering = tuple(view.keyset_ordering)
+        self.page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request, queryset)
+
+        ordering = self.ordering
+        if reverse:
+            ordering = tuple(self._invert(field) for field in ordering)
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self._after(ordering, position))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.rows = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        if not self.use_keyset:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_next_link(self):
+        if not self.use_keyset:
+            return super().get_next_link()
+        if not (self.has_next and self.rows):
+            return None
+        return self._link(self.rows[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.use_keyset:
+            return super().get_previous_link()
+        if not (self.has_previous and self.rows):
+            return None
+        return self._link(self.rows[0], reverse=True)
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        # count : présent par défaut (pages numérotées), absent des pages par curseur
+        response_schema['required'] = [field for field in response_schema.get('required', []) if field != 'count']
+        response_schema['properties']['count']['description'] = (
+            f"Nombre total de lignes, absent avec ?{self.mode_query_param}=cursor"
+        )
+        return response_schema
+
+    # Curseurs
+
+    def decode_cursor(self, request, queryset):
+        """Return ``(position, reverse)`` from the cursor parameter, or ``(None, False)``."""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            values = payload['p']
+            if len(values) != len(self.ordering):
+                raise ValueError
+            position = tuple(
+                self._field(queryset, field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, values)
+            )
+            return position, bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, obj, reverse):
+        values = [self._json_value(getattr(obj, field.lstrip('-'))) for field in self.ordering]
+        payload = json.dumps({'p': values, 'r': int(reverse)}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode('ascii')).decode('ascii')
+
+    def _link(self, obj, reverse):
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(obj, reverse))
+
+    @staticmethod
+    def _field(queryset, name):
+        if name in queryset.query.annotations:
+            return queryset.query.annotations[name].output_field
+        return queryset.model._meta.get_field(name)
+
+    @staticmethod
+    def _json_value(value):
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        if isinstance(value, UUID):
+            return str(value)
+        return value
+
+    @staticmethod
+    def _invert(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def _after(ordering, position):
+        """
+        Rows strictly after ``position`` in ``ordering``:
+        (a > x) OR (a = x AND b > y) OR ..., plus a leading ``a >= x`` bound
+        so that the database can turn the condition into an index range.
+        """
+        condition = Q()
+        equal = Q()
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        first, value = ordering[0], position[0]
+        bound = 'lte' if first.startswith('-') else 'gte'
+        return Q(**{f'{first.lstrip("-")}__{bound}': value}) & condition
@@ -0,0 +1,194 @@
+"""
+In-process autocomplete index over Place names and aliases.
+
+Each worker keeps a sorted array of ``(key, place_id)`` pairs, where the keys
+are the slugs of the place name, of its aliases and of every word suffix of
+those ("gare-de-lyon" for "Paris Gare de Lyon"). A prefix lookup is then two
+bisections on the array, whatever the number of places.
+
+The index is updated incrementally by the Place/PlaceAlias signals of the
+worker that performed the write. Other workers notice the change through a
+version number kept in the Django cache and rebuild on their next lookup.
+"""
+import threading
+from bisect import bisect_left, insort
+
+from django.core.cache import cache
+from django.utils.text import slugify
+
+from .utils import normalize_place
+
+VERSION_CACHE_KEY = 'places:autocomplete-version'
+
+
+def place_keys(name, aliases=()):
+    """Slugs under which a place can be found by prefix."""
+    keys = set()
+    for label in (name, *aliases):
+        slug = slugify(normalize_place(label))
+        words = slug.split('-')
+        for start in range(len(words)):
+            suffix = '-'.join(words[start:])
+            if suffix:
+                keys.add(suffix)
+    return keys
+
+
+class PlaceIndex:
+    """Sorted-array prefix index of places, safe to share between threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = []      # [(key, place_id)] trié
+        self._keys = {}         # place_id -> clés indexées
+        self._places = {}       # place_id -> {'id', 'name', 'slug'}
+        self._loaded = False
+        self._version = None
+
+    def __len__(self):
+        return len(self._places)
+
+    # Lecture
+
+    def search(self, query, limit=10):
+        """Return up to ``limit`` places whose name or alias has a word starting with ``query``."""
+        prefix = slugify(normalize_place(query))
+        if not prefix:
+            return []
+        self._ensure_fresh()
+        with self._lock:
+            entries = self._entries
+            position = bisect_left(entries, (prefix,))
+            found = {}
+            while position < len(entries) and len(found) < limit * 4:
+                key, place_id = entries[position]
+                if not key.startswith(prefix):
+                    break
+                # Meilleur rang : correspondance depuis le début du nom canonique
+                rank = 0 if self._places[place_id]['slug'].startswith(prefix) else 1
+                found[place_id] = min(rank, found.get(place_id, rank))
+                position += 1
+            places = self._places
+            ranked = sorted(found, key=lambda pid: (found[pid], len(places[pid]['name']), places[pid]['name']))
+            return [places[pid] for pid in ranked[:limit]]
+
+    def resolve(self, text):
+        """Return the id of the place whose slug or alias equals ``text``, or None."""
+        slug = slugify(normalize_place(text))
+        if not slug:
+            return None
+        self._ensure_fresh()
+        with self._lock:
+            for pid in self._ids_for_key(slug):
+                if slug in self._exact_keys(pid):
+                    return pid
+        return None
+
+    # Mise à jour
+
+    def invalidate(self):
+        """Force a full rebuild on the next lookup."""
+        with self._lock:
+            self._loaded = False
+
+    def rebuild(self):
+        """Reload every place from the database."""
+        from .models import Place, PlaceAlias
+
+        version = cache.get(VERSION_CACHE_KEY)
+        aliases = {}
+        for place_id, alias in PlaceAlias.objects.values_list('place_id', 'name'):
+            aliases.setdefault(place_id, []).append(alias)
+        entries, keys, places = [], {}, {}
+        for place_id, name, slug in Place.objects.values_list('id', 'name', 'slug'):
+            alias_names = aliases.get(place_id, [])
+            place_keys_ = place_keys(name, alias_names)
+            places[place_id] = {'id': place_id, 'name': name, 'slug': slug, 'aliases': alias_names}
+            keys[place_id] = place_keys_
+            entries.extend((key, place_id) for key in place_keys_)
+        entries.sort()
+        with self._lock:
+            self._entries, self._keys, self._places = entries, keys, places
+            self._loaded = True
+            self._version = version
+
+    def refresh_place(self, place_id):
+        """Re-index a single place after it (or one of its aliases) changed."""
+        from .models import Place, PlaceAlias
+
+        place = Place.objects.filter(pk=place_id).values('id', 'name', 'slug').first()
+        alias_names = []
+        if place is not None:
+            alias_names = list(PlaceAlias.objects.filter(place_id=place_id).values_list('name', flat=True))
+        version = self._bump_version()
+        with self._lock:
+            if not self._loaded:
+                return
+            if isinstance(self._version, int) and version != self._version + 1:
+                # Un autre worker a modifié les lieux entre-temps : reconstruction complète
+                self._loaded = False
+                return
+            self._remove(place_id)
+            if place is not None:
+                place['aliases'] = alias_names
+                self._places[place_id] = place
+                self._keys[place_id] = place_keys(place['name'], alias_names)
+                for key in self._keys[place_id]:
+                    insort(self._entries, (key, place_id))
+            self._version = version
+
+    def _remove(self, place_id):
+        for key in self._keys.pop(place_id, ()):
+            position = bisect_left(self._entries, (key, place_id))
+            if position < len(self._entries) and self._entries[position] == (key, place_id):
+                del self._entries[position]
+        self._places.pop(place_id, None)
+
+    def _ensure_fresh(self):
+        if not self._loaded or cache.get(VERSION_CACHE_KEY) != self._version:
+            self.rebuild()
+
+    def _ids_for_key(self, key):
+        position = bisect_left(self._entries, (key,))
+        while position < len(self._entries) and self._entries[position][0] == key:
+            yield self._entries[position][1]
+            position += 1
+
+    def _exact_keys(self, place_id):
+        place = self._places[place_id]
+        return {slugify(normalize_place(label)) for label in (place['name'], *place['aliases'])}
+
+    @staticmethod
+    def _bump_version():
+        try:
+            return cache.incr(VERSION_CACHE_KEY)
+        except ValueError:
+            cache.add(VERSION_CACHE_KEY, 1, timeout=None)
+            return cache.get(VERSION_CACHE_KEY)
+
+
+def trigram_search(query, exclude=(), limit=10):
+    """
+    Fuzzy fallback for typos and infixes, served by the pg_trgm GIN index on
+    Place.slug. Only available on PostgreSQL; returns [] elsewhere.
+    """
+    from django.db import connection
+    from .models import Place
+
+    slug = slugify(normalize_place(query))
+    if connection.vendor != 'postgresql' or len(slug) < 3 or limit <= 0:
+        return []
+    from django.contrib.postgres.lookups import TrigramSimilar
+    from django.contrib.postgres.search import TrigramSimilarity
+    from django.db.models import F
+
+    return list(
+        Place.objects.filter(TrigramSimilar(F('slug'), slug))
+        .exclude(id__in=exclude)
+        .annotate(similarity=TrigramSimilarity('slug', slug))
+        .order_by('-similarity', 'name')
+        .values('id', 'name', 'slug')[:limit]
+    )
+
+
+place_index = PlaceIndex()
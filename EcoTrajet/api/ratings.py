@@ -0,0 +1,116 @@
+"""
+Per-user rating aggregates (``UserRatingStats``): count, sum and 1-5
+histogram of the scores received, maintained incrementally.
+
+Every change of a rating turns into deltas per rated user and score, applied
+with one UPDATE of F-expressions per rated user in the transaction of the
+change, so that concurrent ratings of the same user never lose an increment
+and reads of the stats are a primary-key lookup. The first rating of a user
+inserts their row. ``rebuild_rating_stats`` recomputes the rows from the
+ratings by chunks of users, should they ever drift.
+
+``create_ratings`` inserts a batch of ratings (e.g. after a community
+event) with one INSERT, then updates the stats once per rated user and
+sends a single ``ratings_created`` signal instead of one ``post_save`` per
+rating.
+"""
+from collections import Counter, defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.dispatch import Signal
+from django.utils import timezone
+
+SCORES = range(1, 6)
+MAX_BULK_RATINGS = 500
+
+# Envoyé après la validation d'un lot de notes créées par create_ratings (argument ``ratings``)
+ratings_created = Signal()
+
+
+def score_column(score):
+    return f'score_{score}'
+
+
+def rating_deltas(changes):
+    """
+    ``{user_id: Counter({score: delta})}`` from ``(user_id, score, delta)``
+    changes, e.g. ``(rated_user_id, 4, 1)`` for a new rating of 4.
+    """
+    deltas = defaultdict(Counter)
+    for user_id, score, delta in changes:
+        deltas[user_id][score] += delta
+    return deltas
+
+
+def record_ratings(changes, using=None):
+    """
+    Apply ``(user_id, score, delta)`` changes to the stats of the rated users:
+    one UPDATE per user, plus an INSERT for the first rating of a user.
+    """
+    from .models import UserRatingStats
+
+    now = timezone.now()
+    for user_id, scores in rating_deltas(changes).items():
+        scores = {score: delta for score, delta in scores.items() if delta}
+        if not scores:
+            continue
+        count = sum(scores.values())
+        total = sum(score * delta for score, delta in scores.items())
+        increments = {
+            'rating_count': F('rating_count') + count,
+            'score_sum': F('score_sum') + total,
+            'updated_at': now,
+            **{score_column(score): F(score_column(score)) + delta for score, delta in scores.items()},
+        }
+        stats = UserRatingStats.objects.using(using).filter(pk=user_id)
+        updated = stats.update(**increments)
+        if updated or any(delta < 0 for delta in scores.values()):
+            # Ligne à jour, ou absente alors qu'il faudrait la décrémenter (cf. rebuild_rating_stats)
+            continue
+        try:
+            with transaction.atomic(using=using):
+                UserRatingStats.objects.using(using).create(
+                    user_id=user_id, rating_count=count, score_sum=total,
+                    **{score_column(score): delta for score, delta in scores.items()},
+                )
+        except IntegrityError:
+            # Première note concurrente : la ligne existe désormais
+            stats.update(**increments)
+
+
+def aggregate_ratings(ratings):
+    """
+    ``{rated_user_id: {'rating_count', 'score_sum', 'score_1', ...}}`` of the
+    ``ratings`` queryset, in one GROUP BY query.
+    """
+    rows = ratings.order_by().values('rated_user').annotate(
+        rating_count=Count('pk'),
+        score_sum=Sum('score'),
+        **{score_column(score): Count('pk', filter=Q(score=score)) for score in SCORES},
+    )
+    return {row.pop('rated_user'): row for row in rows}
+
+
+def create_ratings(ratings, using=None):
+    """
+    Insert the unsaved ``ratings`` with one bulk INSERT, then update the stats
+    of the rated users (one UPDATE each), the leaderboards of the drivers
+    (cf. api.leaderboard) and the driver rating of their search documents
+    (one read and one UPDATE), in one transaction. Returns the created
+    ratings.
+    """
+    from .documents import refresh_driver_ratings
+    from .leaderboard import record_leaderboards
+    from .models import Rating
+
+    with transaction.atomic(using=using):
+        created = Rating.objects.using(using).bulk_create(ratings)
+        record_ratings([(rating.rated_user_id, rating.score, 1) for rating in created], using)
+        record_leaderboards([(rating.rated_user_id, rating.trip_id, rating.score, 1) for rating in created], using)
+        refresh_driver_ratings({rating.rated_user_id for rating in created})
+        transaction.on_commit(lambda: ratings_created.send(sender=Rating, ratings=created), using=using)
+    # bulk_create ne passe pas par save() : valeurs en base connues pour les modifications suivantes
+    for rating in created:
+        rating.remember_values()
+    return created
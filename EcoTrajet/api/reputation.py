@@ -0,0 +1,159 @@
+"""
+Reputation score of the users, recomputed by the nightly
+``compute_reputations`` job and read as one precomputed number by the search
+(``TripSearchDocument.driver_reputation``) and the rating profile of a user.
+
+Every rating and reservation weighs ``2 ** (-age / HALF_LIFE_DAYS)``, so that
+recent activity counts more. The score is the decayed average of the scores
+received, shrunk towards the leaderboard prior (cf. api.leaderboard) by the
+decayed volume of ratings, which acts as the confidence:
+
+    average = (PRIOR_WEIGHT * PRIOR_MEAN + sum(w * score)) / (PRIOR_WEIGHT + sum(w))
+
+then lowered by the share of cancellations in the decayed reservations of
+the user: reservations they cancelled as a passenger, reservations of the
+trips they cancelled as a driver:
+
+    score = average * (1 - CANCELLATION_PENALTY * cancelled / (reservations + 1))
+
+A user without history has the prior mean. The job reads the sorted ids of
+the users once, then streams the rating and reservation columns by chunks,
+maps their user ids to positions in that array with ``searchsorted`` and
+accumulates the sums with ``bincount``, so that its memory depends on the
+number of users, not on the number of rows nor on the largest id.
+"""
+from itertools import islice
+
+import numpy as np
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from .leaderboard import PRIOR_MEAN, PRIOR_WEIGHT
+from .trip_index import to_micros
+
+HALF_LIFE_DAYS = 180
+CANCELLATION_PENALTY = 0.5
+CHUNK_SIZE = 5000
+DAY_MICROS = 86_400 * 10**6
+
+
+def chunks(queryset, fields, chunk_size=CHUNK_SIZE):
+    """``values_list`` rows of ``queryset`` streamed as tuples of columns, ``chunk_size`` rows at a time."""
+    rows = queryset.values_list(*fields).iterator(chunk_size=chunk_size)
+    while chunk := list(islice(rows, chunk_size)):
+        yield zip(*chunk)
+
+
+def decay(moments, now):
+    """Weight of the events at ``moments`` (datetimes): 1 now, 1/2 after ``HALF_LIFE_DAYS``."""
+    micros = np.fromiter(map(to_micros, moments), np.int64)
+    ages = (to_micros(now) - micros) / DAY_MICROS
+    return np.exp2(-np.maximum(ages, 0) / HALF_LIFE_DAYS)
+
+
+class ReputationSums:
+    """Decayed sums per user, accumulated chunk by chunk, at the positions of the sorted ``user_ids``."""
+
+    def __init__(self, user_ids):
+        self.user_ids = user_ids
+        self.rating_weight = np.zeros(len(user_ids))
+        self.score_sum = np.zeros(len(user_ids))
+        self.reservations = np.zeros(len(user_ids))
+        self.cancelled = np.zeros(len(user_ids))
+
+    def _add(self, column, user_ids, weights):
+        positions = np.searchsorted(self.user_ids, user_ids)
+        # Utilisateurs absents de la liste (inscrits ou supprimés pendant le calcul) : ignorés
+        known = positions < len(self.user_ids)
+        known[known] = self.user_ids[positions[known]] == user_ids[known]
+        column += np.bincount(positions[known], weights=weights[known], minlength=len(column))
+
+    def add_ratings(self, rated_user_ids, scores, created_at, now):
+        users = np.fromiter(rated_user_ids, np.int64)
+        weights = decay(created_at, now)
+        self._add(self.rating_weight, users, weights)
+        self._add(self.score_sum, users, weights * np.fromiter(scores, np.float64))
+
+    def add_reservations(self, passenger_ids, driver_ids, statuts, trip_statuts, updated_at, now):
+        passengers = np.fromiter(passenger_ids, np.int64)
+        drivers = np.fromiter(driver_ids, np.int64)
+        cancelled = np.array(statuts) == 'CANCELLED'
+        by_driver = np.array(trip_statuts) == 'CANCELLED'
+        weights = decay(updated_at, now)
+        for users in (passengers, drivers):
+            self._add(self.reservations, users, weights)
+        self._add(self.cancelled, passengers, weights * (cancelled & ~by_driver))
+        self._add(self.cancelled, drivers, weights * (cancelled & by_driver))
+
+    def scores(self):
+        """``(user_ids, score, rating_weight, cancellation_rate)`` arrays of the users with a history."""
+        users = np.flatnonzero((self.rating_weight > 0) | (self.reservations > 0))
+        weight = self.rating_weight[users]
+        average = (PRIOR_WEIGHT * PRIOR_MEAN + self.score_sum[users]) / (PRIOR_WEIGHT + weight)
+        rate = self.cancelled[users] / (self.reservations[users] + 1)
+        return self.user_ids[users], average * (1 - CANCELLATION_PENALTY * rate), weight, rate
+
+
+def compute_reputations(chunk_size=CHUNK_SIZE, now=None):
+    """
+    ``(user_ids, score, rating_weight, cancellation_rate)`` arrays of every
+    user with ratings or reservations, from a read of the user ids and two
+    streamed reads.
+    """
+    from .models import Rating, Reservation
+    from user_management.models import User
+
+    now = now or timezone.now()
+    user_ids = np.fromiter(User.objects.order_by('pk').values_list('pk', flat=True).iterator(), np.int64)
+    last_id = int(user_ids[-1]) if len(user_ids) else 0
+    sums = ReputationSums(user_ids)
+    # Utilisateurs inscrits pendant le calcul : au prochain passage
+    ratings = Rating.objects.order_by().filter(rated_user__lte=last_id)
+    for columns in chunks(ratings, ('rated_user_id', 'score', 'created_at'), chunk_size):
+        sums.add_ratings(*columns, now)
+    reservations = Reservation.objects.order_by().filter(
+        statut__in=['CONFIRMED', 'CANCELLED'], passenger__lte=last_id, trip__conducteur__lte=last_id,
+    )
+    fields = ('passenger_id', 'trip__conducteur_id', 'statut', 'trip__statut', 'updated_at')
+    for columns in chunks(reservations, fields, chunk_size):
+        sums.add_reservations(*columns, now)
+    return sums.scores()
+
+
+def store_reputations(user_ids, scores, rating_weights, cancellation_rates, now, chunk_size=CHUNK_SIZE):
+    """
+    Write the computed reputations by chunks of users, each in one
+    transaction: one upsert of the ``UserReputation`` rows and one UPDATE of
+    the search documents of their trips. Rows of users without history any
+    more, the ones not written at ``now``, are then deleted and their
+    documents reset to the prior mean. Returns ``(written, removed)``.
+    """
+    from .models import TripSearchDocument, UserReputation
+
+    for start in range(0, len(user_ids), chunk_size):
+        rows = zip(*(column[start:start + chunk_size].tolist()
+                     for column in (user_ids, scores, rating_weights, cancellation_rates)))
+        reputations = [
+            UserReputation(user_id=user_id, score=round(score, 4), rating_weight=round(weight, 4),
+                           cancellation_rate=round(rate, 4), computed_at=now)
+            for user_id, score, weight, rate in rows
+        ]
+        with transaction.atomic():
+            UserReputation.objects.bulk_create(
+                reputations,
+                update_conflicts=True,
+                unique_fields=['user'],
+                update_fields=['score', 'rating_weight', 'cancellation_rate', 'computed_at'],
+            )
+            TripSearchDocument.objects.filter(
+                conducteur_id__in=[reputation.user_id for reputation in reputations],
+            ).update(
+                driver_reputation=Subquery(UserReputation.objects.filter(pk=OuterRef('conducteur_id')).values('score')),
+            )
+    # Lignes non réécrites par ce calcul : sélectionnées en SQL, sans lire leurs clés
+    stale = UserReputation.objects.filter(computed_at__lt=now)
+    with transaction.atomic():
+        TripSearchDocument.objects.filter(conducteur_id__in=stale.values('pk')).update(driver_reputation=PRIOR_MEAN)
+        removed = stale.delete()[0]
+    return len(user_ids), removed
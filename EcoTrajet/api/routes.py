@@ -0,0 +1,170 @@
+"""
+Route corridor matching: trips whose route passes near a pickup point and,
+later along the route, near a drop-off point.
+
+Routes are stored as encoded polylines (Google polyline format, 1e-5
+precision). Each route is densified and indexed on a fixed geohash grid
+(TripRouteCell rows: trip, cell, first and last position along the route),
+so a search only reads the index rows of the cells around the two points
+that belong to the trips of the search, whatever the number of active
+trips, in one grouped query. The few candidates left are then checked
+exactly with NumPy.
+"""
+import math
+
+import numpy as np
+from django.db.models import F, Max, Min, Q
+
+from . import geo
+
+ROUTE_CELL_PRECISION = 5        # cellules d'environ 4,9 x 4,9 km
+DENSIFY_STEP_KM = 0.5
+
+
+def encode_polyline(points):
+    """Encode [(lat, lon), ...] as a polyline string."""
+    chunks, previous = [], (0, 0)
+    for lat, lon in points:
+        current = (round(lat * 1e5), round(lon * 1e5))
+        for value, last in zip(current, previous):
+            delta = value - last
+            delta = ~(delta << 1) if delta < 0 else delta << 1
+            while delta >= 0x20:
+                chunks.append(chr((0x20 | (delta & 0x1f)) + 63))
+                delta >>= 5
+            chunks.append(chr(delta + 63))
+        previous = current
+    return ''.join(chunks)
+
+
+def decode_polyline(encoded):
+    """Decode a polyline string into [(lat, lon), ...]; raises ValueError if malformed."""
+    points, index, lat, lon = [], 0, 0, 0
+    length = len(encoded)
+    while index < length:
+        deltas = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                if index >= length:
+                    raise ValueError("Polyline tronquée")
+                byte = ord(encoded[index]) - 63
+                index += 1
+                if not 0 <= byte < 64:
+                    raise ValueError("Caractère de polyline invalide")
+                result |= (byte & 0x1f) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lon += deltas[1]
+        if not (-9_000_000 <= lat <= 9_000_000 and -18_000_000 <= lon <= 18_000_000):
+            raise ValueError("Coordonnées de polyline hors limites")
+        points.append((lat / 1e5, lon / 1e5))
+    return points
+
+
+def densify(points, step_km=DENSIFY_STEP_KM):
+    """Array of (lat, lon) with intermediate points so that no gap exceeds ``step_km``."""
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    if len(points) < 2:
+        return points
+    starts, ends = points[:-1], points[1:]
+    lengths = _segment_lengths(starts, ends)
+    pieces = []
+    for start, end, length in zip(starts, ends, lengths):
+        count = max(int(math.ceil(length / step_km)), 1)
+        fractions = np.arange(count)[:, None] / count
+        pieces.append(start + (end - start) * fractions)
+    pieces.append(points[-1:])
+    return np.vstack(pieces)
+
+
+def _segment_lengths(starts, ends):
+    lat1, lon1 = np.radians(starts[:, 0]), np.radians(starts[:, 1])
+    lat2, lon2 = np.radians(ends[:, 0]), np.radians(ends[:, 1])
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * geo.EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def route_cells(encoded):
+    """{cell: (first_position, last_position)} of a route on the index grid."""
+    cells = {}
+    for position, (lat, lon) in enumerate(densify(decode_polyline(encoded))):
+        cell = geo.encode(lat, lon, ROUTE_CELL_PRECISION)
+        first, _ = cells.get(cell, (position, position))
+        cells[cell] = (first, position)
+    return cells
+
+
+def cells_in_radius(lat, lon, radius_km, precision=ROUTE_CELL_PRECISION):
+    """Every grid cell intersecting the bounding box of the circle."""
+    height, width = geo.cell_size_degrees(precision)
+    d_lat = radius_km / geo.KM_PER_DEGREE
+    d_lon = radius_km / (geo.KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+    cells = set()
+    lat_steps = np.arange(lat - d_lat, lat + d_lat + height, height)
+    lon_steps = np.arange(lon - d_lon, lon + d_lon + width, width)
+    for cell_lat in np.clip(np.append(lat_steps, lat + d_lat), -90.0, 90.0 - 1e-9):
+        for cell_lon in np.append(lon_steps, lon + d_lon):
+            cells.add(geo.encode(cell_lat, (cell_lon + 180.0) % 360.0 - 180.0, precision))
+    return cells
+
+
+def index_trip_route(trip):
+    """
+    Replace the grid index rows of ``trip`` with those of its current route.
+    Only scheduled trips are kept in the grid, so that its size follows the
+    number of active trips.
+    """
+    from .models import TripRouteCell
+
+    TripRouteCell.objects.filter(trip=trip).delete()
+    if not trip.route_polyline or trip.statut != 'SCHEDULED':
+        return
+    TripRouteCell.objects.bulk_create([
+        TripRouteCell(trip=trip, cell=cell, first_position=first, last_position=last)
+        for cell, (first, last) in route_cells(trip.route_polyline).items()
+    ])
+
+
+def passes_near(encoded, pickup, dropoff, corridor_km):
+    """True when the route comes within ``corridor_km`` of pickup, then of dropoff."""
+    points = densify(decode_polyline(encoded))
+    near_pickup = geo.haversine_km(*pickup, points[:, 0], points[:, 1]) <= corridor_km
+    if not near_pickup.any():
+        return False
+    first = int(np.argmax(near_pickup))
+    near_dropoff = geo.haversine_km(*dropoff, points[first:, 0], points[first:, 1]) <= corridor_km
+    return bool(near_dropoff.any())
+
+
+def within_corridor(queryset, pickup, dropoff, corridor_km):
+    """
+    Restrict ``queryset`` to trips whose route passes within ``corridor_km`` of
+    ``pickup`` and afterwards of ``dropoff`` (both (lat, lon) tuples).
+    """
+    from .models import TripRouteCell
+
+    pickup_cells = cells_in_radius(*pickup, corridor_km)
+    dropoff_cells = cells_in_radius(*dropoff, corridor_km)
+    # Premier passage près du départ, dernier près de l'arrivée, par trajet de la recherche
+    hits = (
+        TripRouteCell.objects.filter(
+            cell__in=pickup_cells | dropoff_cells, trip__in=queryset.order_by().values('id'),
+        )
+        .values('trip_id')
+        .annotate(
+            pickup=Min('first_position', filter=Q(cell__in=pickup_cells)),
+            dropoff=Max('last_position', filter=Q(cell__in=dropoff_cells)),
+        )
+        .filter(pickup__lte=F('dropoff'))
+        .values('trip_id')
+    )
+    matches = [
+        trip_id
+        for trip_id, encoded in queryset.filter(id__in=hits).order_by().values_list('id', 'route_polyline')
+        if passes_near(encoded, pickup, dropoff, corridor_km)
+    ]
+    return queryset.filter(id__in=matches)
@@ -1,9 +1,14 @@
 from rest_framework import serializers
-from user_management.models import Vehicule
-from .models import Rating
+from user_management.models import User, Vehicule
+from .models import DriverRank, Rating
 from django.utils import timezone
 from rest_framework import serializers
-from .models import Trip, Reservation
+from .models import Trip, Reservation, SavedSearch, TripSearchDocument, WaitlistEntry
+from .alerts import MAX_WINDOW_DAYS
+from .booking import MAX_CANCELLED_TRIPS, MAX_GROUP_SIZE, book_group
+from .ratings import MAX_BULK_RATINGS, create_ratings
+from .routes import decode_polyline
+from .tracking import VersionRequired
 
 
 #Serializer pour les véhicules
@@ -41,11 +46,11 @@ class VehiculeCreateSerializer(serializers.ModelSerializer):
             'couleur', 'number_of_seats', 'is_active'
         ]
         
-#Serializer pour les évaluations
+#Serializer pour les évaluations (libellés calculés en SQL, cf. RatingViewSet.with_labels)
 class RatingSerializer(serializers.ModelSerializer):
-    reviewer_name = serializers.SerializerMethodField()
-    rated_user_name = serializers.SerializerMethodField()
-    trip_info = serializers.SerializerMethodField()
+    reviewer_name = serializers.CharField(read_only=True)
+    rated_user_name = serializers.CharField(read_only=True)
+    trip_info = serializers.CharField(read_only=True)
     
     class Meta:
         model = Rating
@@ -55,18 +60,7 @@ class RatingSerializer(serializers.ModelSerializer):
             'commentaires', 'created_at'
         ]
         read_only_fields = ['idRate', 'created_at']
-    
-    def get_reviewer_name(self, obj):
-        return f"{obj.reviewer.prenom} {obj.reviewer.nom}"
-    
-    def get_rated_user_name(self, obj):
-        return f"{obj.rated_user.prenom} {obj.rated_user.nom}"
-    
-    def get_trip_info(self, obj):
-        if obj.trip:
-            return f"{obj.trip.origin} -> {obj.trip.destination}"
-        return None
-    
+
 #Serializer pour la création d'évaluations
 class RatingCreateSerializer(serializers.ModelSerializer):
     #Champ commentaires optionnel
@@ -86,19 +80,84 @@ class RatingCreateSerializer(serializers.ModelSerializer):
         ).exists():
             raise serializers.ValidationError("Vous avez déjà évalué cet utilisateur pour ce trajet.")
         return data
+
+
+#Serializer pour la création groupée d'évaluations : validation et insertion du lot entier
+class RatingBulkListSerializer(serializers.ListSerializer):
+    def validate(self, items):
+        if not 0 < len(items) <= MAX_BULK_RATINGS:
+            raise serializers.ValidationError(f"Entre 1 et {MAX_BULK_RATINGS} évaluations par lot.")
+        triples = {(item['reviewer_id'], item['rated_user_id'], item['trip_id']) for item in items}
+        if len(triples) != len(items):
+            raise serializers.ValidationError("Une évaluation ne peut figurer qu'une fois par lot.")
+        users = {item['reviewer_id'] for item in items} | {item['rated_user_id'] for item in items}
+        if User.objects.filter(pk__in=users).count() != len(users):
+            raise serializers.ValidationError("Utilisateur inconnu.")
+        trips = {item['trip_id'] for item in items}
+        if Trip.objects.filter(pk__in=trips).count() != len(trips):
+            raise serializers.ValidationError("Trajet inconnu.")
+        # Une seule requête pour tous les triplets : candidats filtrés par colonne, puis intersection
+        existing = triples & set(Rating.objects.filter(
+            reviewer__in={reviewer for reviewer, _, _ in triples},
+            rated_user__in={rated_user for _, rated_user, _ in triples},
+            trip__in=trips,
+        ).values_list('reviewer', 'rated_user', 'trip'))
+        if existing:
+            raise serializers.ValidationError(
+                [f"Vous avez déjà évalué l'utilisateur {rated_user} pour le trajet {trip}."
+                 for _, rated_user, trip in sorted(existing)]
+            )
+        return items
+
+    def create(self, validated_data):
+        return create_ratings([Rating(**item) for item in validated_data])
+
+
+class RatingBulkCreateSerializer(serializers.Serializer):
+    reviewer = serializers.IntegerField(source='reviewer_id')
+    rated_user = serializers.IntegerField(source='rated_user_id')
+    trip = serializers.IntegerField(source='trip_id')
+    score = serializers.IntegerField(min_value=1, max_value=5)
+    commentaires = serializers.CharField(required=False, allow_blank=True)
+
+    class Meta:
+        list_serializer_class = RatingBulkListSerializer
+
+    def validate(self, data):
+        if data['reviewer_id'] == data['rated_user_id']:
+            raise serializers.ValidationError("Un utilisateur ne peut pas s'auto-évaluer")
+        return data
+
 #Serializer pour les statistiques d'évaluation d'un utilisateur
 class UserRatingStatsSerializer(serializers.Serializer):
-    user_id = serializers.UUIDField()
+    user_id = serializers.IntegerField()
     user_name = serializers.CharField()
     average_rating = serializers.FloatField()
     total_ratings = serializers.IntegerField()
     ratings_detail = serializers.ListField()
+    reputation = serializers.FloatField()
+
+#Serializer pour le classement des conducteurs (cf. api.leaderboard)
+class DriverRankSerializer(serializers.ModelSerializer):
+    driver_name = serializers.SerializerMethodField()
+
+    class Meta:
+        model = DriverRank
+        fields = ['rank', 'driver', 'driver_name', 'score', 'rating_count']
+
+    def get_driver_name(self, obj):
+        return f"{obj.driver.prenom} {obj.driver.nom}"
 
 class TripListSerializer(serializers.ModelSerializer):
     conducteur = serializers.SerializerMethodField()
+    reservation_count = serializers.IntegerField(read_only=True)
+
     class Meta:
         model = Trip
-        fields = ['id', 'conducteur', 'temps_depart', 'temps_arrive', 'origine', 'destination', 'prix', 'places_dispo']
+        fields = [
+            'id', 'conducteur', 'temps_depart', 'temps_arrive', 'origine', 'destination', 'prix', 'places_dispo',
+            'reservation_count',
+        ]
 
     def get_conducteur(self, obj):
         return {
@@ -108,6 +167,43 @@ class TripListSerializer(serializers.ModelSerializer):
             'email': obj.conducteur.email
         }
     
+#Serializer pour le tableau de bord du conducteur (champs annotés, cf. DriverDashboardView)
+class DriverDashboardTripSerializer(serializers.ModelSerializer):
+    pending_count = serializers.IntegerField(read_only=True)
+    confirmed_count = serializers.IntegerField(read_only=True)
+    seats_sold = serializers.IntegerField(read_only=True)
+    expected_revenue = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    unanswered_requests = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Trip
+        fields = [
+            'id', 'origine', 'destination', 'temps_depart', 'temps_arrive', 'prix', 'places_dispo', 'statut',
+            'pending_count', 'confirmed_count', 'seats_sold', 'expected_revenue', 'unanswered_requests',
+        ]
+
+
+class TripSearchDocumentSerializer(serializers.ModelSerializer):
+    """Search result card, read from the denormalized document only"""
+    id = serializers.IntegerField(source='trip_id', read_only=True)
+    conducteur = serializers.SerializerMethodField()
+
+    class Meta:
+        model = TripSearchDocument
+        fields = [
+            'id', 'conducteur', 'vehicle_label', 'temps_depart', 'temps_arrive', 'origine',
+            'destination', 'origine_place', 'destination_place', 'prix', 'places_dispo', 'statut',
+        ]
+
+    def get_conducteur(self, obj):
+        return {
+            'id': obj.conducteur_id,
+            'name': obj.driver_name,
+            'rating': obj.driver_rating,
+            'rating_count': obj.driver_rating_count,
+            'reputation': obj.driver_reputation,
+        }
+
 class ReservationNestedSerializer(serializers.ModelSerializer):
     class Meta:
         model = Reservation
@@ -124,15 +220,64 @@ class TripDetailSerializer(serializers.ModelSerializer):
         read_only_fields = ['created_at', 'conducteur']
 
 
-class TripWriteSerializer(serializers.ModelSerializer):
+class VersionedWriteSerializer(serializers.ModelSerializer):
+    """
+    Writes of a TrackedModel: the version is ignored on creation and required
+    on update, from the body or an If-Match header, so that the save only
+    applies to the version the client read (cf. api.tracking).
+    Meta.create_only_fields can only be set on creation.
+    """
+    version = serializers.IntegerField(min_value=1, required=False)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.instance is not None:
+            for name in getattr(self.Meta, 'create_only_fields', ()):
+                fields[name].read_only = True
+        return fields
+
+    def to_internal_value(self, data):
+        validated = super().to_internal_value(data)
+        if self.instance is None:
+            validated.pop('version', None)
+            return validated
+        if 'version' not in validated:
+            validated['version'] = self._if_match_version()
+        return validated
+
+    def _if_match_version(self):
+        request = self.context.get('request')
+        header = request.headers.get('If-Match') if request is not None else None
+        if not header:
+            raise VersionRequired()
+        # ETag faible ou fort : W/"3" ou "3"
+        value = header.strip().removeprefix('W/').strip('"')
+        if not value.isdigit() or int(value) < 1:
+            raise serializers.ValidationError({'version': "En-tête If-Match invalide : version attendue."})
+        return int(value)
+
+
+class TripWriteSerializer(VersionedWriteSerializer):
     """Serializer for creating/updating trips"""
     class Meta:
         model = Trip
-        fields = '__all__'
-        extra_kwargs = {
-            'conducteur': {'read_only': True},
-            'statut': {'read_only': True}
-        }
+        fields = [
+            'id', 'conducteur', 'communaute', 'vehicule', 'temps_depart', 'temps_arrive',
+            'origine', 'destination', 'origine_place', 'destination_place',
+            'origine_lat', 'origine_lon', 'destination_lat', 'destination_lon', 'route_polyline',
+            'prix', 'places_dispo', 'statut', 'version', 'created_at', 'updated_at',
+        ]
+        # Places libres modifiables par le conducteur : les réservations changent la version,
+        # une modification faite sur des places lues avant une réservation est refusée (409)
+        read_only_fields = ['conducteur', 'statut', 'created_at', 'updated_at']
+
+    def validate_route_polyline(self, value):
+        if value:
+            try:
+                decode_polyline(value)
+            except ValueError as exc:
+                raise serializers.ValidationError(f"Itinéraire invalide : {exc}")
+        return value
 
     def validate_temps_depart(self, value):
         if value < timezone.now():
@@ -151,6 +296,13 @@ class TripWriteSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 "Le nombre de places disponibles ne peut pas être négatif"
             )
+
+        for prefix in ('origine', 'destination'):
+            lat, lon = f'{prefix}_lat', f'{prefix}_lon'
+            if (lat in data) != (lon in data) or (data.get(lat) is None) != (data.get(lon) is None):
+                raise serializers.ValidationError(
+                    f"{lat} et {lon} doivent être renseignés ensemble"
+                )
             
         return data
 
@@ -166,7 +318,15 @@ class ReservationListSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Reservation
-        fields = ['id', 'passenger', 'trip', 'place_reserv', 'statut', 'created_at']
+        fields = ['id', 'passenger', 'trip', 'place_reserv', 'statut', 'expires_at', 'created_at']
+
+#Serializer pour l'itinéraire du passager : résumé du trajet lu dans son document de recherche
+class ItineraryReservationSerializer(serializers.ModelSerializer):
+    trip = TripSearchDocumentSerializer(source='summary', read_only=True)
+
+    class Meta:
+        model = Reservation
+        fields = ['id', 'trip', 'place_reserv', 'statut', 'expires_at', 'created_at']
 
 class ReservationDetailSerializer(serializers.ModelSerializer):
     passenger = serializers.StringRelatedField()
@@ -176,7 +336,123 @@ class ReservationDetailSerializer(serializers.ModelSerializer):
         model = Reservation
         fields = '__all__'
 
-class ReservationWriteSerializer(serializers.ModelSerializer):
+class ReservationWriteSerializer(VersionedWriteSerializer):
     class Meta:
         model = Reservation
-        exclude = ['created_at']
+        fields = ['id', 'passenger', 'trip', 'place_reserv', 'statut', 'expires_at', 'version', 'updated_at']
+        read_only_fields = ['passenger', 'expires_at', 'updated_at']
+        create_only_fields = ['trip']
+
+
+#Serializer pour les recherches enregistrées (alertes de nouveaux trajets)
+class SavedSearchSerializer(serializers.ModelSerializer):
+    origine = serializers.CharField(source='origine_place.name', read_only=True)
+    destination = serializers.CharField(source='destination_place.name', read_only=True)
+
+    class Meta:
+        model = SavedSearch
+        fields = [
+            'id', 'origine_place', 'origine', 'destination_place', 'destination',
+            'date_debut', 'date_fin', 'prix_max', 'places_min', 'active', 'created_at'
+        ]
+        read_only_fields = ['created_at']
+
+    def validate(self, data):
+        date_debut = data.get('date_debut', getattr(self.instance, 'date_debut', None))
+        date_fin = data.get('date_fin', getattr(self.instance, 'date_fin', None))
+        if date_fin < date_debut:
+            raise serializers.ValidationError("La fin de la période doit suivre son début.")
+        if (date_fin - date_debut).days >= MAX_WINDOW_DAYS:
+            raise serializers.ValidationError(f"La période ne peut dépasser {MAX_WINDOW_DAYS} jours.")
+        if data.get('places_min', 1) < 1:
+            raise serializers.ValidationError("Au moins une place doit être demandée.")
+        return data
+
+
+#Serializer pour la liste d'attente des trajets complets
+class WaitlistEntrySerializer(serializers.ModelSerializer):
+    position = serializers.SerializerMethodField()
+
+    class Meta:
+        model = WaitlistEntry
+        fields = ['id', 'trip', 'place_reserv', 'statut', 'position', 'reservation', 'created_at']
+        read_only_fields = ['statut', 'reservation', 'created_at']
+
+    def get_position(self, obj):
+        if obj.statut != 'WAITING':
+            return None
+        # Annotée par la vue pour les listes, lue sinon
+        position = getattr(obj, 'position', None)
+        return position if position is not None else obj.queue_position()
+
+    def validate(self, data):
+        trip = data['trip']
+        user = self.context['request'].user
+        if trip.statut != 'SCHEDULED':
+            raise serializers.ValidationError("Ce trajet n'est plus ouvert à la réservation.")
+        if trip.conducteur_id == user.pk:
+            raise serializers.ValidationError("Le conducteur ne peut pas attendre une place sur son trajet.")
+        if WaitlistEntry.objects.filter(trip=trip, passenger=user, statut='WAITING').exists():
+            raise serializers.ValidationError("Vous êtes déjà dans la liste d'attente de ce trajet.")
+        return data
+
+
+#Serializers pour la réservation groupée (plusieurs passagers et/ou trajets, tout ou rien)
+class GroupReservationItemSerializer(serializers.Serializer):
+    trip = serializers.IntegerField()
+    passenger = serializers.IntegerField(
+        required=False, help_text="Par défaut, l'auteur de la requête ; un autre passager pour le personnel seulement"
+    )
+    place_reserv = serializers.IntegerField(min_value=1, default=1)
+
+
+class GroupReservationSerializer(serializers.Serializer):
+    reservations = GroupReservationItemSerializer(many=True)
+    statut = serializers.ChoiceField(choices=['PENDING', 'CONFIRMED'], default='PENDING')
+
+    def validate_reservations(self, items):
+        if not 0 < len(items) <= MAX_GROUP_SIZE:
+            raise serializers.ValidationError(f"Entre 1 et {MAX_GROUP_SIZE} réservations par groupe.")
+        user = self.context['request'].user
+        for item in items:
+            item.setdefault('passenger', user.pk)
+        pairs = {(item['passenger'], item['trip']) for item in items}
+        if len(pairs) != len(items):
+            raise serializers.ValidationError("Un passager ne peut figurer qu'une fois par trajet.")
+        passengers = {passenger for passenger, _ in pairs}
+        if passengers - {user.pk} and not user.is_staff:
+            raise serializers.ValidationError("Vous ne pouvez réserver que pour vous-même.")
+        if User.objects.filter(pk__in=passengers).count() != len(passengers):
+            raise serializers.ValidationError("Passager inconnu.")
+        return items
+
+    def validate(self, data):
+        # Comme une réservation simple, seul le passager lui-même peut confirmer d'emblée
+        user = self.context['request'].user
+        if data['statut'] == 'CONFIRMED' and any(item['passenger'] != user.pk for item in data['reservations']):
+            raise serializers.ValidationError(
+                {'statut': "Les réservations faites pour d'autres passagers restent en attente (PENDING)."}
+            )
+        return data
+
+    def create(self, validated_data):
+        reservations = book_group(
+            [(item['passenger'], item['trip'], item['place_reserv']) for item in validated_data['reservations']],
+            statut=validated_data['statut'],
+        )
+        return {'statut': validated_data['statut'], 'reservations': reservations}
+
+    def to_representation(self, instance):
+        return {'reservations': ReservationWriteSerializer(instance['reservations'], many=True).data}
+
+
+#Serializer pour l'annulation groupée de trajets par leur conducteur
+class TripCancellationSerializer(serializers.Serializer):
+    trips = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=MAX_CANCELLED_TRIPS)
+
+    def validate_trips(self, trip_ids):
+        trip_ids = set(trip_ids)
+        owned = Trip.objects.filter(pk__in=trip_ids, conducteur=self.context['request'].user).count()
+        if owned != len(trip_ids):
+            raise serializers.ValidationError("Vous ne pouvez annuler que vos propres trajets.")
+        return sorted(trip_ids)
@@ -1,19 +1,98 @@
-from django.db.models.signals import post_save
+import logging
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
-from user_management.models import Vehicule
-from .models import Rating
+from user_management.models import User, Vehicule
+from .documents import refresh_driver_name, refresh_driver_rating, refresh_vehicle
+from .journeys import timetable
+from .leaderboard import record_leaderboards
+from .models import Place, PlaceAlias, Rating, Trip
+from .places import place_index
+from .ratings import ratings_created, record_ratings
+from .trip_index import trip_columns
+
+logger = logging.getLogger(__name__)
 
 
 @receiver(post_save, sender=Vehicule)
 def vehicule_created(sender, instance, created, **kwargs):
     #Signal déclenché à la création d'un véhicule
     if created:
-        print(f"Nouveau véhicule créé: {instance}")
+        logger.info("Nouveau véhicule créé: %s", instance)
 @receiver(post_save, sender=Rating)
 def rating_created(sender, instance, created, **kwargs):
-    #ignal déclenché à la création d'une évaluation
+    #Signal déclenché à la création d'une évaluation (identifiant seul : pas de requête)
     if created:
         #Notification
-        print(f"Nouvelle évaluation: {instance.score}/5 pour {instance.rated_user}")
-        
+        logger.info("Nouvelle évaluation: %s/5 pour l'utilisateur %s", instance.score, instance.rated_user_id)
+
+
+@receiver(ratings_created)
+def ratings_batch_created(sender, ratings, **kwargs):
+    #Notification groupée pour les évaluations créées en lot
+    logger.info(
+        "%s nouvelles évaluations pour %s utilisateurs", len(ratings), len({rating.rated_user_id for rating in ratings})
+    )
+
+
+def refresh_place_on_commit(place_id, using):
+    #Index et version partagée mis à jour après la validation : les autres workers ne
+    #reconstruisent pas depuis des lignes non validées, un rollback ne laisse rien dans l'index
+    transaction.on_commit(partial(place_index.refresh_place, place_id), using=using)
+
+
+@receiver(post_save, sender=Place)
+def place_saved(sender, instance, using, **kwargs):
+    #Mise à jour incrémentale de l'index d'autocomplétion
+    refresh_place_on_commit(instance.pk, using)
+    instance.link_trips([instance.name])
+
+
+@receiver(post_save, sender=PlaceAlias)
+def place_alias_saved(sender, instance, using, **kwargs):
+    refresh_place_on_commit(instance.place_id, using)
+    instance.place.link_trips([instance.name])
+
+
+@receiver(post_delete, sender=Place)
+@receiver(post_delete, sender=PlaceAlias)
+def place_deleted(sender, instance, using, **kwargs):
+    refresh_place_on_commit(instance.place_id if sender is PlaceAlias else instance.pk, using)
+
+
+@receiver(post_delete, sender=Trip)
+def trip_deleted(sender, instance, **kwargs):
+    #Les suppressions n'apparaissent pas dans le flux updated_at
+    timetable.discard(instance.pk)
+    trip_columns.discard(instance.pk)
+
+
+# Documents de recherche (cf. api.documents) ; les suppressions en cascade
+# envoient leurs signaux dans la transaction de la suppression
+
+@receiver(post_delete, sender=Rating)
+def rating_deleted(sender, instance, **kwargs):
+    # Valeurs en base de la note supprimée (cf. api.ratings)
+    record_ratings([(instance.loaded('rated_user_id'), instance.loaded('score'), -1)])
+    record_leaderboards([(instance.loaded('rated_user_id'), instance.loaded('trip_id'), instance.loaded('score'), -1)])
+    refresh_driver_rating(instance.rated_user_id)
+
+
+@receiver(post_save, sender=Vehicule)
+def vehicule_saved(sender, instance, created, **kwargs):
+    if not created:
+        refresh_vehicle(instance)
+
+
+@receiver(pre_delete, sender=Vehicule)
+def vehicule_deleted(sender, instance, **kwargs):
+    refresh_vehicle(instance, label='')
+
 
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and not {'nom', 'prenom'} & set(update_fields)):
+        return
+    refresh_driver_name(instance)
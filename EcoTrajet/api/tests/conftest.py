@@ -0,0 +1,113 @@
+"""
+Shared fixtures for the api app tests.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.journeys import timetable
+from api.models import Reservation, Trip
+from api.places import place_index
+from api.trip_index import trip_columns
+from user_management.models import User
+
+
+def book(passenger, trip_id, seats=1):
+    """Create a confirmed reservation of ``seats`` seats, or raise ``SoldOut``."""
+    return Reservation.objects.create(
+        passenger=passenger, trip_id=trip_id, place_reserv=seats, statut='CONFIRMED',
+    )
+
+
+def confirm(reservation):
+    reservation.statut = 'CONFIRMED'
+    reservation.save(update_fields=['statut', 'updated_at'])
+    return reservation
+
+
+def cancel(reservation):
+    reservation.statut = 'CANCELLED'
+    reservation.save(update_fields=['statut', 'updated_at'])
+    return reservation
+
+
+def change_seats(reservation, seats):
+    reservation.place_reserv = seats
+    reservation.save(update_fields=['place_reserv', 'updated_at'])
+    return reservation
+
+
+@pytest.fixture(autouse=True)
+def fresh_caches():
+    """In-process indexes and the cache outlive the test transaction: reset them."""
+    cache.clear()
+    place_index.invalidate()
+    timetable.invalidate()
+    trip_columns.invalidate()
+    yield
+    cache.clear()
+    place_index.invalidate()
+    timetable.invalidate()
+    trip_columns.invalidate()
+
+
+@pytest.fixture
+def api_client():
+    """Fixture for creating an API client."""
+    return APIClient()
+
+
+@pytest.fixture
+def make_user(db):
+    """Factory fixture creating users with unique emails."""
+    counter = {'n': 0}
+
+    def _make_user(**kwargs):
+        counter['n'] += 1
+        defaults = {
+            'email': f"user{counter['n']}@example.com",
+            'password': 'Password1!',
+            'nom': f"Nom{counter['n']}",
+            'prenom': f"Prenom{counter['n']}",
+        }
+        defaults.update(kwargs)
+        return User.objects.create_user(**defaults)
+
+    return _make_user
+
+
+@pytest.fixture
+def driver(make_user):
+    """Fixture for a driver user."""
+    return make_user(role='conducteur', nom='Martin', prenom='Claire')
+
+
+@pytest.fixture
+def passenger(make_user):
+    """Fixture for a passenger user."""
+    return make_user(role='passager', nom='Durand', prenom='Paul')
+
+
+@pytest.fixture
+def make_trip(driver):
+    """Factory fixture creating scheduled trips departing tomorrow by default."""
+
+    def _make_trip(**kwargs):
+        depart = kwargs.pop('temps_depart', timezone.now() + timedelta(days=1))
+        defaults = {
+            'conducteur': driver,
+            'origine': 'Paris',
+            'destination': 'Lyon',
+            'temps_depart': depart,
+            'temps_arrive': depart + timedelta(hours=4),
+            'prix': Decimal('25.00'),
+            'places_dispo': 3,
+        }
+        defaults.update(kwargs)
+        return Trip.objects.create(**defaults)
+
+    return _make_trip
@@ -0,0 +1,285 @@
+"""
+Tests for the seat booking service and the reservation endpoints using it.
+"""
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.db import OperationalError
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+
+from api import booking
+from api.management.commands.stress_booking import retryable
+from api.models import Reservation, ReservationJob, Trip, TripSearchDocument, WaitlistEntry, WaitlistQueue
+from api.tests.conftest import book, cancel, change_seats, confirm
+
+pytestmark = pytest.mark.urls('EcoTrajet.urls')
+
+
+def seats(trip):
+    """Free seats of ``trip`` in the database and in its search document."""
+    return (
+        Trip.objects.get(pk=trip.pk).places_dispo,
+        TripSearchDocument.objects.get(trip=trip).places_dispo,
+    )
+
+
+@pytest.mark.django_db
+class TestBookingService:
+    """Seats move with the held state of the reservations."""
+
+    def test_confirm_change_cancel(self, make_trip, passenger):
+        trip = make_trip(places_dispo=4)
+        reservation = Reservation.objects.create(passenger=passenger, trip=trip, place_reserv=2)
+        # Une demande en attente bloque déjà ses places
+        assert seats(trip) == (2, 2)
+        assert reservation.trip.places_dispo == 2
+        confirm(reservation)
+        assert seats(trip) == (2, 2)
+        change_seats(reservation, 3)
+        assert seats(trip) == (1, 1)
+        cancel(reservation)
+        assert seats(trip) == (4, 4)
+
+    def test_sold_out(self, make_trip, passenger):
+        trip = make_trip(places_dispo=2)
+        book(passenger, trip.pk, seats=2)
+        with pytest.raises(booking.SoldOut):
+            book(passenger, trip.pk)
+        with pytest.raises(booking.SoldOut):
+            book(passenger, make_trip(places_dispo=0).pk)
+        closed = make_trip()
+        closed.cancel()
+        with pytest.raises(booking.TripClosed):
+            book(passenger, closed.pk)
+        assert Reservation.objects.count() == 1
+
+    def test_stale_copy_is_refused(self, make_trip, passenger):
+        trip = make_trip(places_dispo=4)
+        reservation = Reservation.objects.create(passenger=passenger, trip=trip, place_reserv=2)
+        stale = Reservation.objects.get(pk=reservation.pk)
+        confirm(reservation)
+        with pytest.raises(booking.ReservationChanged):
+            confirm(stale)
+        assert seats(trip) == (2, 2)
+
+    def test_book_does_not_read_the_trip(self, make_trip, passenger, django_assert_num_queries):
+        trip = make_trip()
+        # Places du trajet, document, réservation
+        with django_assert_num_queries(3):
+            reservation = book(passenger, trip.pk)
+        # Verrou de la réservation, places du trajet, document, réservation
+        with django_assert_num_queries(4):
+            change_seats(reservation, 2)
+
+
+@pytest.mark.django_db
+class TestHolds:
+    """Pending reservations hold their seats until they expire."""
+
+    def test_expired_holds_give_seats_back(self, make_trip, passenger, django_assert_num_queries):
+        trips = [make_trip(places_dispo=4) for _ in range(3)]
+        holds = [
+            Reservation.objects.create(passenger=passenger, trip=trip, place_reserv=n)
+            for trip in trips for n in (1, 2)
+        ]
+        kept = Reservation.objects.create(passenger=passenger, trip=trips[0], place_reserv=1)
+        confirm(holds[0])
+        assert [seats(trip) for trip in trips] == [(0, 0), (1, 1), (1, 1)]
+        Reservation.objects.exclude(pk=kept.pk).update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        # Verrouillage du lot, réservations, trajets, documents, listes d'attente,
+        # indépendamment de sa taille (+ SAVEPOINT / RELEASE dans la transaction du test)
+        with django_assert_num_queries(7):
+            assert booking.expire_holds(batch_size=10) == 5
+        assert [seats(trip) for trip in trips] == [(2, 2), (4, 4), (4, 4)]
+        assert Reservation.objects.filter(statut='EXPIRED').count() == 5
+        assert booking.expire_holds() == 0
+        with pytest.raises(booking.ReservationChanged):
+            confirm(holds[1])
+
+    def test_batches(self, make_trip, passenger):
+        trip = make_trip(places_dispo=7)
+        for _ in range(7):
+            Reservation.objects.create(passenger=passenger, trip=trip, expires_at=timezone.now())
+        assert seats(trip) == (0, 0)
+        assert booking.expire_holds(batch_size=3) == 7
+        assert seats(trip) == (7, 7)
+
+    def test_pending_again_gets_a_new_hold(self, make_trip, passenger):
+        trip = make_trip(places_dispo=2)
+        reservation = Reservation.objects.create(passenger=passenger, trip=trip, expires_at=timezone.now())
+        cancel(reservation)
+        reservation.statut = 'PENDING'
+        reservation.save()
+        assert reservation.expires_at > timezone.now()
+        assert seats(trip) == (1, 1)
+
+
+@pytest.mark.django_db
+class TestReservationEndpoints:
+    """Tests for /api/reservations/."""
+
+    def test_sold_out_is_a_conflict(self, api_client, make_trip, passenger):
+        trip = make_trip(places_dispo=1)
+        api_client.force_authenticate(user=passenger)
+        payload = {'trip': trip.pk, 'passenger': passenger.pk, 'place_reserv': 2, 'statut': 'CONFIRMED'}
+        response = api_client.post(reverse('reservation-list'), payload, format='json')
+        assert response.status_code == status.HTTP_409_CONFLICT
+        assert response.data['detail'].code == 'sold_out'
+        assert seats(trip) == (1, 1)
+
+    def test_delete_gives_seats_back(self, api_client, make_trip, passenger):
+        trip = make_trip(places_dispo=3)
+        reservation = book(passenger, trip.pk, seats=2)
+        api_client.force_authenticate(user=passenger)
+        response = api_client.delete(reverse('reservation-detail', kwargs={'pk': reservation.pk}))
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        assert seats(trip) == (3, 3)
+
+
+@pytest.mark.django_db
+class TestGroupBooking:
+    """Tests for /api/reservations/group/: all the seats or none."""
+
+    def post(self, api_client, user, items, **extra):
+        api_client.force_authenticate(user=user)
+        return api_client.post(reverse('reservation-group'), {'reservations': items, **extra}, format='json')
+
+    def test_books_every_leg(self, api_client, make_trip, passenger):
+        outbound, connecting = make_trip(places_dispo=3), make_trip(places_dispo=2)
+        items = [{'trip': outbound.pk, 'place_reserv': 2}, {'trip': connecting.pk}]
+        response = self.post(api_client, passenger, items, statut='CONFIRMED')
+        assert response.status_code == status.HTTP_201_CREATED
+        assert [(r['passenger'], r['trip'], r['statut']) for r in response.data['reservations']] == [
+            (passenger.pk, outbound.pk, 'CONFIRMED'),
+            (passenger.pk, connecting.pk, 'CONFIRMED'),
+        ]
+        assert (seats(outbound), seats(connecting)) == ((1, 1), (1, 1))
+
+    def test_other_passengers(self, api_client, make_trip, passenger, make_user, driver):
+        trip = make_trip(places_dispo=3)
+        friend, staff = make_user(), make_user(is_staff=True)
+        items = [{'trip': trip.pk, 'passenger': friend.pk}]
+        assert self.post(api_client, passenger, items).status_code == status.HTTP_400_BAD_REQUEST
+        assert self.post(api_client, staff, items, statut='CONFIRMED').status_code == status.HTTP_400_BAD_REQUEST
+        response = self.post(api_client, staff, items)
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data['reservations'][0]['statut'] == 'PENDING'
+        own = self.post(api_client, driver, [{'trip': trip.pk}])
+        assert own.status_code == status.HTTP_400_BAD_REQUEST and own.data['detail'].code == 'own_trip'
+        assert seats(trip) == (2, 2)
+
+    def test_all_or_nothing(self, api_client, make_trip, passenger):
+        open_trip, short, closed = make_trip(places_dispo=3), make_trip(places_dispo=1), make_trip()
+        closed.cancel()
+        response = self.post(api_client, passenger, [{'trip': open_trip.pk}, {'trip': short.pk, 'place_reserv': 2}])
+        assert response.status_code == status.HTTP_409_CONFLICT
+        assert response.data['detail'].code == 'sold_out'
+        response = self.post(api_client, passenger, [{'trip': open_trip.pk}, {'trip': closed.pk}])
+        assert response.data['detail'].code == 'trip_closed'
+        assert not Reservation.objects.exists()
+        assert (seats(open_trip), seats(short)) == ((3, 3), (1, 1))
+
+    def test_validation(self, api_client, make_trip, passenger):
+        trip = make_trip()
+        assert self.post(api_client, passenger, []).status_code == status.HTTP_400_BAD_REQUEST
+        duplicate = [{'trip': trip.pk}, {'trip': trip.pk}]
+        assert self.post(api_client, passenger, duplicate).status_code == status.HTTP_400_BAD_REQUEST
+        unknown = [{'trip': trip.pk, 'passenger': 999_999}]
+        assert self.post(api_client, passenger, unknown).status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_fixed_query_count(self, make_trip, make_user, django_assert_num_queries):
+        trips, users = [make_trip() for _ in range(4)], [make_user() for _ in range(3)]
+        requests = [(user.pk, trip.pk, 1) for trip in trips for user in users]
+        # Verrous, trajets, documents, insertion groupée (+ SAVEPOINT / RELEASE)
+        with django_assert_num_queries(6):
+            assert len(booking.book_group(requests)) == 12
+        assert all(reservation.expires_at for reservation in Reservation.objects.all())
+
+
+@pytest.mark.django_db
+class TestTripCancellation:
+    """Cancelling trips cancels their reservations and queues refunds and notifications."""
+
+    def test_fan_out(self, make_trip, make_user, django_assert_num_queries):
+        trip = make_trip(places_dispo=8, prix=Decimal('12.50'))
+        passengers = [make_user() for _ in range(8)]
+        for n, passenger in enumerate(passengers):
+            Reservation.objects.create(passenger=passenger, trip=trip, statut='CONFIRMED' if n % 2 else 'PENDING')
+        WaitlistEntry.objects.create(trip=trip, passenger=make_user())
+        # Verrous des trajets, réservations et inscriptions, 4 UPDATE, 2 DELETE, 1 INSERT
+        with django_assert_num_queries(10):
+            assert booking.cancel_trips([trip.pk]) == (1, 8)
+        assert seats(trip) == (8, 8)
+        assert set(Reservation.objects.values_list('statut', flat=True)) == {'CANCELLED'}
+        assert WaitlistEntry.objects.get().statut == 'CANCELLED'
+        assert not WaitlistQueue.objects.exists()
+        assert ReservationJob.objects.filter(kind='NOTIFICATION').count() == 9
+        refunds = ReservationJob.objects.filter(kind='REFUND')
+        assert sorted(refunds.values_list('amount', flat=True)) == [Decimal('12.50')] * 4
+        assert booking.cancel_trips([trip.pk]) == (0, 0)
+
+    def test_cost_does_not_depend_on_the_number_of_trips(self, make_trip, passenger, django_assert_num_queries):
+        for count in (2, 50):
+            trips = [make_trip() for _ in range(count)]
+            for trip in trips:
+                book(passenger, trip.pk)
+            # Sans liste d'attente, pas d'UPDATE des inscriptions
+            with django_assert_num_queries(9):
+                assert booking.cancel_trips([trip.pk for trip in trips]) == (count, count)
+        assert ReservationJob.objects.count() == 2 * 52
+
+    def test_closed_trips_do_not_promote(self, make_trip, make_user):
+        trip = make_trip(places_dispo=1)
+        reservation = book(make_user(), trip.pk)
+        WaitlistEntry.objects.create(trip=trip, passenger=make_user())
+        Trip.objects.filter(pk=trip.pk).update(statut='IN_PROGRESS')
+        cancel(reservation)
+        assert WaitlistEntry.objects.get().statut == 'WAITING'
+        assert Trip.objects.get(pk=trip.pk).places_dispo == 1
+        assert booking.promote_waitlist(trip.pk) == 0
+
+    def test_endpoints(self, api_client, driver, make_trip, make_user, passenger):
+        mine, other = make_trip(), make_trip(conducteur=make_user(role='conducteur'))
+        reservation = book(passenger, mine.pk)
+        api_client.force_authenticate(user=driver)
+        response = api_client.post(reverse('trip-cancel'), {'trips': [mine.pk, other.pk]}, format='json')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        response = api_client.delete(reverse('trip-detail', kwargs={'pk': mine.pk}))
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        assert Reservation.objects.get(pk=reservation.pk).statut == 'CANCELLED'
+        recurring = [make_trip() for _ in range(3)]
+        response = api_client.post(reverse('trip-cancel'), {'trips': [trip.pk for trip in recurring]}, format='json')
+        assert response.data == {'trips': 3, 'reservations': 0}
+        assert not Trip.objects.filter(statut='SCHEDULED', conducteur=driver).exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_bookings_never_oversell():
+    out = StringIO()
+    call_command('stress_booking', threads=8, trips=2, seats=15, attempts=200, stdout=out)
+    assert 'Aucune surréservation.' in out.getvalue()
+    assert 'réservées : 30/30' in out.getvalue()
+    assert 'abandons après 5 tentatives' in out.getvalue()
+
+
+def test_stress_retries_only_lock_conflicts():
+    class DriverError(Exception):
+        def __init__(self, sqlstate):
+            self.sqlstate = sqlstate
+
+    def error(message, cause=None):
+        error = OperationalError(message)
+        error.__cause__ = cause
+        return error
+
+    assert retryable(error('database is locked'))
+    assert retryable(error('could not serialize access', DriverError('40001')))
+    assert retryable(error('deadlock detected', DriverError('40P01')))
+    assert not retryable(error('disk I/O error'))
+    assert not retryable(error('terminating connection', DriverError('57P01')))
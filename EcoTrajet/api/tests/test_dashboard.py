@@ -0,0 +1,65 @@
+"""
+Tests for the driver dashboard (/trips/dashboard/).
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+
+from api.models import Reservation
+from api.pagination import KeysetPagination
+from api.tests.conftest import book, cancel
+
+pytestmark = [pytest.mark.django_db, pytest.mark.urls('EcoTrajet.urls')]
+
+
+class TestDriverDashboard:
+    """Upcoming trips of the driver with their reservation figures."""
+
+    def test_figures(self, api_client, driver, make_trip, make_user):
+        trip = make_trip(places_dispo=6, prix=Decimal('12.50'))
+        book(make_user(), trip.pk, seats=2)
+        book(make_user(), trip.pk)
+        Reservation.objects.create(passenger=make_user(), trip=trip)
+        Reservation.objects.create(passenger=make_user(), trip=trip, expires_at=timezone.now() - timedelta(minutes=1))
+        cancel(Reservation.objects.create(passenger=make_user(), trip=trip))
+        empty = make_trip(temps_depart=timezone.now() + timedelta(days=3))
+        make_trip(temps_depart=timezone.now() - timedelta(days=1))
+        make_trip().cancel()
+        make_trip(conducteur=make_user(role='conducteur'))
+        api_client.force_authenticate(user=driver)
+        response = api_client.get(reverse('driver-dashboard'))
+        assert response.status_code == status.HTTP_200_OK
+        first, second = response.data['results']
+        assert (first['id'], second['id']) == (trip.pk, empty.pk)
+        assert {key: first[key] for key in (
+            'pending_count', 'confirmed_count', 'seats_sold', 'expected_revenue', 'unanswered_requests',
+        )} == {
+            'pending_count': 2, 'confirmed_count': 2, 'seats_sold': 3, 'expected_revenue': '37.50',
+            'unanswered_requests': 1,
+        }
+        assert (second['seats_sold'], second['expected_revenue']) == (0, '0.00')
+
+    def test_fixed_number_of_queries(
+        self, api_client, driver, make_trip, make_user, monkeypatch, django_assert_num_queries,
+    ):
+        monkeypatch.setattr(KeysetPagination, 'page_size', 2)
+        passenger = make_user()
+        for day in range(1, 6):
+            trip = make_trip(temps_depart=timezone.now() + timedelta(days=day))
+            book(passenger, trip.pk)
+        api_client.force_authenticate(user=driver)
+        # COUNT de la pagination par page, puis une requête agrégée
+        with django_assert_num_queries(2):
+            response = api_client.get(reverse('driver-dashboard'))
+        assert response.data['count'] == 5
+        assert [row['confirmed_count'] for row in response.data['results']] == [1, 1]
+        with django_assert_num_queries(1):
+            response = api_client.get(reverse('driver-dashboard'), {'pagination': 'cursor'})
+        assert len(response.data['results']) == 2
+        with django_assert_num_queries(1):
+            response = api_client.get(response.data['next'])
+        assert len(response.data['results']) == 2
@@ -0,0 +1,63 @@
+"""
+Tests for the facet counts of /api/trips/facets/.
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+import pytest
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+
+from api.models import Community
+from user_management.models import Vehicule
+
+pytestmark = [pytest.mark.django_db, pytest.mark.urls('EcoTrajet.urls')]
+
+
+def facets(api_client, **params):
+    response = api_client.get(reverse('trip-facets'), params)
+    assert response.status_code == status.HTTP_200_OK
+    return response.data
+
+
+def counts(buckets):
+    return [bucket['count'] for bucket in buckets]
+
+
+class TestTripFacets:
+    """Tests for /api/trips/facets/."""
+
+    def test_counts(self, api_client, make_trip, driver):
+        day = timezone.localdate() + timedelta(days=1)
+        at = lambda hour: timezone.make_aware(datetime.combine(day, time(hour)))
+        van = Vehicule.objects.create(owner=driver, license_plate='VAN-1', make='Renault',
+                                      model='Trafic', couleur='Blanc', number_of_seats=8)
+        alpes = Community.objects.create(name='Alpes', admin=driver)
+        jura = Community.objects.create(name='Jura', admin=driver)
+        make_trip(prix=Decimal('5'), temps_depart=at(7), places_dispo=0, communaute=alpes)
+        make_trip(prix=Decimal('25'), temps_depart=at(8), places_dispo=2, vehicule=van, communaute=alpes)
+        make_trip(prix=Decimal('60'), temps_depart=at(19), places_dispo=6, communaute=jura)
+        make_trip(prix=Decimal('10'), temps_depart=at(23))
+        make_trip().cancel()
+
+        data = facets(api_client)
+        assert data['total'] == 4
+        assert counts(data['price']) == [1, 1, 1, 0, 1]
+        assert counts(data['departure_hour']) == [0, 2, 0, 0, 1, 1]
+        assert counts(data['free_seats']) == [1, 0, 1, 1, 1]
+        assert counts(data['vehicle_size']) == [0, 0, 0, 1, 3]
+        assert data['communities'] == [
+            {'id': alpes.id, 'name': 'Alpes', 'count': 2},
+            {'id': jura.id, 'name': 'Jura', 'count': 1},
+        ]
+        # Mêmes filtres que la recherche
+        assert facets(api_client, max_price=20)['total'] == 2
+
+    def test_single_query_then_cached(self, api_client, make_trip, django_assert_num_queries):
+        make_trip()
+        with django_assert_num_queries(1):
+            assert facets(api_client, min_seats=1)['total'] == 1
+        make_trip()
+        with django_assert_num_queries(0):
+            assert facets(api_client, min_seats=1)['total'] == 1
@@ -0,0 +1,110 @@
+"""
+Tests for the geohash helpers and the radius search of TripListView.
+"""
+import pytest
+from django.urls import reverse
+from rest_framework import status
+
+from api import geo
+from api.models import Trip
+
+pytestmark = pytest.mark.urls('EcoTrajet.urls')
+
+PARIS = (48.8566, 2.3522)
+VERSAILLES = (48.8049, 2.1204)     # ~17 km de Paris
+LYON = (45.7640, 4.8357)            # ~392 km de Paris
+
+
+class TestGeohash:
+    """Tests for the geohash helpers."""
+
+    def test_encode_known_value(self):
+        assert geo.encode(57.64911, 10.40744, 11) == 'u4pruydqqvj'
+
+    def test_haversine(self):
+        distances = geo.haversine_km(*PARIS, [PARIS[0], LYON[0]], [PARIS[1], LYON[1]])
+        assert distances[0] == pytest.approx(0)
+        assert distances[1] == pytest.approx(392, abs=3)
+
+    def test_covering_cells_contain_nearby_points(self):
+        cells = geo.covering_cells(*PARIS, 20)
+        assert any(geo.encode(*VERSAILLES).startswith(cell) for cell in cells)
+        assert not any(geo.encode(*LYON).startswith(cell) for cell in cells)
+
+    def test_successor(self):
+        assert geo._successor('u09') == 'u0b'
+        assert geo._successor('uz') == 'v'
+        assert geo._successor('zz') is None
+
+
+@pytest.mark.django_db
+class TestRadiusSearch:
+    """Tests for the origin/destination radius parameters of /api/trips/."""
+
+    def test_geohash_is_precomputed(self, make_trip):
+        trip = make_trip(origine_lat=PARIS[0], origine_lon=PARIS[1])
+        assert trip.origine_geohash == geo.encode(*PARIS)
+        assert trip.destination_geohash == ''
+        trip.origine_lat, trip.origine_lon = LYON
+        trip.save(update_fields=['origine_lat', 'origine_lon'])
+        trip.refresh_from_db()
+        assert trip.origine_geohash == geo.encode(*LYON)
+
+    def test_departures_within_radius(self, api_client, make_trip):
+        near = make_trip(origine_lat=VERSAILLES[0], origine_lon=VERSAILLES[1])
+        make_trip(origine_lat=LYON[0], origine_lon=LYON[1])
+        make_trip()
+        url = reverse('trip-list')
+
+        response = api_client.get(url, {'origin_lat': PARIS[0], 'origin_lon': PARIS[1], 'origin_radius_km': 25})
+        assert [t['id'] for t in response.data['results']] == [near.id]
+        response = api_client.get(url, {'origin_lat': PARIS[0], 'origin_lon': PARIS[1], 'origin_radius_km': 10})
+        assert response.data['results'] == []
+
+    def test_arrivals_combine_with_other_filters(self, api_client, make_trip):
+        match = make_trip(destination_lat=LYON[0], destination_lon=LYON[1], places_dispo=3)
+        make_trip(destination_lat=LYON[0], destination_lon=LYON[1], places_dispo=1)
+        response = api_client.get(reverse('trip-list'), {
+            'destination_lat': LYON[0] + 0.05, 'destination_lon': LYON[1], 'min_seats': 2,
+        })
+        assert [t['id'] for t in response.data['results']] == [match.id]
+
+    @pytest.mark.parametrize('params', [
+        {'origin_lat': '48.8'},
+        {'origin_lat': 'nord', 'origin_lon': '2'},
+        {'origin_lat': '95', 'origin_lon': '2'},
+        {'origin_lat': '48', 'origin_lon': '2', 'origin_radius_km': '5000'},
+    ])
+    def test_invalid_parameters(self, api_client, params):
+        response = api_client.get(reverse('trip-list'), params)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_bounding_box(self, make_trip):
+        near = make_trip(origine_lat=VERSAILLES[0], origine_lon=VERSAILLES[1])
+        make_trip(origine_lat=PARIS[0] + 0.3, origine_lon=PARIS[1])
+        make_trip(origine_lat=PARIS[0], origine_lon=PARIS[1] + 0.5)
+        east, west = make_trip(origine_lat=0, origine_lon=179.95), make_trip(origine_lat=0, origine_lon=-179.95)
+        make_trip(origine_lat=0, origine_lon=179.5)
+
+        def ids(*point, radius_km):
+            return set(Trip.objects.filter(geo.bounding_box('origine', *point, radius_km)).values_list('id', flat=True))
+
+        assert ids(*PARIS, radius_km=20) == {near.id}
+        # Cercle à cheval sur l'antiméridien
+        assert ids(0, 179.99, radius_km=10) == ids(0, -179.99, radius_km=10) == {east.id, west.id}
+
+    def test_prefilter_uses_geohash_ranges(self):
+        sql = str(Trip.objects.filter(geo.geohash_prefilter('origine_geohash', *PARIS, 20)).query)
+        assert '"api_trip"."origine_geohash" >=' in sql
+        assert 'LIKE' not in sql
+
+    def test_distance_bound_in_sql(self, make_trip, django_assert_num_queries):
+        points = [(PARIS[0] + d_lat, PARIS[1] + d_lon) for d_lat in (-0.2, -0.1, 0, 0.1, 0.2) for d_lon in (-0.3, 0, 0.3)]
+        trips = [make_trip(origine_lat=lat, origine_lon=lon) for lat, lon in points]
+        distances = geo.haversine_km(*PARIS, *zip(*points))
+        queryset = geo.within_radius(Trip.objects.all(), 'origine', *PARIS, 20)
+        assert ' IN (' not in str(queryset.query)
+        with django_assert_num_queries(1):
+            ids = set(queryset.values_list('id', flat=True))
+        assert ids == {trip.id for trip, distance in zip(trips, distances) if distance <= 20}
+        assert 0 < len(ids) < len(trips)
@@ -0,0 +1,116 @@
+"""
+Tests for the Idempotency-Key header of the trip and reservation creation endpoints.
+"""
+import threading
+from datetime import timedelta
+
+import pytest
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from api.models import IdempotencyKey, Reservation, Trip
+
+pytestmark = pytest.mark.urls('EcoTrajet.urls')
+
+
+def post(client, url, payload, key):
+    return client.post(url, payload, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+
+@pytest.fixture
+def book(api_client, passenger):
+    """POST a reservation of ``seats`` seats on ``trip`` with an Idempotency-Key."""
+    api_client.force_authenticate(user=passenger)
+
+    def _book(trip, key, seats=1):
+        payload = {'trip': trip.pk, 'passenger': passenger.pk, 'place_reserv': seats}
+        return post(api_client, reverse('reservation-list'), payload, key)
+
+    return _book
+
+
+@pytest.mark.django_db
+class TestIdempotencyKey:
+    """A retried creation replays the first response instead of creating again."""
+
+    def test_retried_reservation_is_replayed(self, book, make_trip):
+        trip = make_trip(places_dispo=3)
+        first = book(trip, 'abc', seats=2)
+        retry = book(trip, 'abc', seats=2)
+        assert first.status_code == retry.status_code == status.HTTP_201_CREATED
+        assert retry.data == first.data
+        assert retry['Idempotent-Replayed'] == 'true'
+        assert Reservation.objects.count() == 1
+        assert Trip.objects.get(pk=trip.pk).places_dispo == 1
+        assert book(trip, 'def').status_code == status.HTTP_201_CREATED
+        assert Reservation.objects.count() == 2
+
+    def test_key_reused_for_another_request(self, book, make_trip):
+        trip = make_trip()
+        book(trip, 'abc')
+        assert book(trip, 'abc', seats=2).status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        assert Reservation.objects.count() == 1
+
+    def test_failed_request_can_be_retried(self, book, make_trip):
+        trip = make_trip(places_dispo=1)
+        assert book(trip, 'abc', seats=2).status_code == status.HTTP_409_CONFLICT
+        assert not IdempotencyKey.objects.exists()
+        trip.places_dispo = 2
+        trip.save()
+        assert book(trip, 'abc', seats=2).status_code == status.HTTP_201_CREATED
+
+    def test_expired_key_is_reused(self, book, make_trip):
+        trip = make_trip()
+        book(trip, 'abc')
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        assert 'Idempotent-Replayed' not in book(trip, 'abc')
+        assert Reservation.objects.count() == 2
+        assert IdempotencyKey.objects.get().expires_at > timezone.now()
+
+    def test_trip_creation(self, api_client, driver, make_user):
+        depart = timezone.now() + timedelta(days=2)
+        payload = {
+            'origine': 'Paris', 'destination': 'Lyon', 'prix': '20.00', 'places_dispo': 3,
+            'temps_depart': depart.isoformat(), 'temps_arrive': (depart + timedelta(hours=4)).isoformat(),
+        }
+        api_client.force_authenticate(user=driver)
+        first = post(api_client, reverse('trip-list'), payload, 'trip-1')
+        assert post(api_client, reverse('trip-list'), payload, 'trip-1').data == first.data
+        # Les clés sont propres à chaque utilisateur
+        api_client.force_authenticate(user=make_user(role='conducteur'))
+        assert 'Idempotent-Replayed' not in post(api_client, reverse('trip-list'), payload, 'trip-1')
+        assert Trip.objects.count() == 2
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_duplicates(make_trip, passenger):
+    if connection.vendor == 'sqlite':
+        # Base en mémoire partagée : les écrivains concurrents échouent au lieu d'attendre
+        pytest.skip("Écritures concurrentes non supportées par SQLite en mémoire")
+    trip = make_trip(places_dispo=5)
+    payload = {'trip': trip.pk, 'passenger': passenger.pk, 'place_reserv': 1}
+    url = reverse('reservation-list')
+    start = threading.Barrier(6)
+    responses = []
+
+    def retry():
+        client = APIClient()
+        client.force_authenticate(user=passenger)
+        try:
+            start.wait()
+            responses.append(post(client, url, payload, 'same'))
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=retry) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert {response.status_code for response in responses} == {status.HTTP_201_CREATED}
+    assert len({response.data['id'] for response in responses}) == 1
+    assert Reservation.objects.count() == 1
+    assert Trip.objects.get(pk=trip.pk).places_dispo == 4
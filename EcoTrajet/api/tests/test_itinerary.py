@@ -0,0 +1,62 @@
+"""
+Tests for the passenger itinerary (/reservations/itinerary/).
+"""
+from datetime import timedelta
+
+import pytest
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+
+from api.pagination import KeysetPagination
+from api.tests.conftest import book
+
+pytestmark = [pytest.mark.django_db, pytest.mark.urls('EcoTrajet.urls')]
+
+
+@pytest.fixture
+def rides(make_trip, passenger):
+    """Book ``count`` rides departing every day from ``start`` days from now on."""
+    def _rides(count, start):
+        trips = [make_trip(temps_depart=timezone.now() + timedelta(days=start + day)) for day in range(count)]
+        for trip in trips:
+            book(passenger, trip.pk)
+        return [trip.pk for trip in trips]
+    return _rides
+
+
+def walk(api_client, params):
+    ids, response = [], api_client.get(reverse('reservation-itinerary'), {**params, 'pagination': 'cursor'})
+    while True:
+        ids += [row['trip']['id'] for row in response.data['results']]
+        if not response.data['next']:
+            return ids
+        response = api_client.get(response.data['next'])
+
+
+class TestItinerary:
+    """Upcoming and past rides of the passenger, with trip summaries."""
+
+    def test_upcoming_and_past(self, api_client, passenger, rides, make_user, monkeypatch):
+        monkeypatch.setattr(KeysetPagination, 'page_size', 2)
+        upcoming, past = rides(3, start=1), rides(3, start=-5)
+        book(make_user(), upcoming[0])
+        api_client.force_authenticate(user=passenger)
+        assert walk(api_client, {}) == upcoming
+        assert walk(api_client, {'when': 'past'}) == past[::-1]
+        row = api_client.get(reverse('reservation-itinerary')).data['results'][0]
+        assert row['trip']['conducteur']['name'] and row['statut'] == 'CONFIRMED'
+        assert api_client.get(reverse('reservation-itinerary'), {'when': 'later'}).status_code == (
+            status.HTTP_400_BAD_REQUEST
+        )
+
+    def test_cost_does_not_depend_on_the_history(self, api_client, passenger, rides, django_assert_num_queries):
+        api_client.force_authenticate(user=passenger)
+        for count in (2, 30):
+            rides(count, start=-40)
+            # Page de réservations, puis les documents de ses trajets
+            with django_assert_num_queries(2):
+                response = api_client.get(reverse('reservation-itinerary'), {'when': 'past', 'pagination': 'cursor'})
+            assert all(row['trip'] for row in response.data['results'])
+            with django_assert_num_queries(3):
+                api_client.get(reverse('reservation-itinerary'), {'when': 'past'})
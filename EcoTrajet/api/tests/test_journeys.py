@@ -0,0 +1,95 @@
+"""
+Tests for the multi-leg journey planner.
+"""
+from datetime import datetime, time, timedelta
+
+import pytest
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+
+from api.journeys import timetable
+from api.models import Place
+
+pytestmark = [pytest.mark.django_db, pytest.mark.urls('EcoTrajet.urls')]
+
+
+@pytest.fixture
+def at():
+    """at(hour, minute) -> aware datetime tomorrow."""
+    day = timezone.localdate() + timedelta(days=1)
+
+    def _at(hour, minute=0):
+        return timezone.make_aware(datetime.combine(day, time(hour, minute)))
+
+    return _at
+
+
+@pytest.fixture
+def leg(make_trip):
+    def _leg(origine, destination, depart, arrive, **kwargs):
+        return make_trip(origine=origine, destination=destination, temps_depart=depart,
+                         temps_arrive=arrive, **kwargs)
+    return _leg
+
+
+def plan(api_client, at, origin='Paris', destination='Lyon', **params):
+    response = api_client.get(reverse('journey-planner'), {
+        'from': origin, 'to': destination, 'depart_after': at(0).isoformat(), **params,
+    })
+    assert response.status_code == status.HTTP_200_OK
+    return [[leg['id'] for leg in journey['legs']] for journey in response.data['results']]
+
+
+class TestJourneyPlanner:
+    """Tests for /api/journeys/."""
+
+    def test_direct_trip(self, api_client, at, leg):
+        direct = leg('Paris', 'Lyon', at(8), at(12))
+        assert plan(api_client, at) == [[direct.id]]
+
+    def test_two_legs_with_transfer_window(self, api_client, at, leg):
+        first = leg('Paris', 'Dijon', at(8), at(11))
+        second = leg('Dijon', 'Lyon', at(11, 30), at(13))
+        leg('Dijon', 'Lyon', at(11, 5), at(12, 30))  # correspondance trop courte
+        assert plan(api_client, at) == [[first.id, second.id]]
+
+    def test_pareto_set_and_leg_limit(self, api_client, at, leg):
+        direct = leg('Paris', 'Lyon', at(14), at(19))
+        a = leg('Paris', 'Auxerre', at(6), at(8))
+        b = leg('Auxerre', 'Dijon', at(8, 30), at(10))
+        c = leg('Dijon', 'Lyon', at(10, 30), at(12))
+        assert plan(api_client, at) == [[direct.id], [a.id, b.id, c.id]]
+        assert plan(api_client, at, max_legs=2) == [[direct.id]]
+
+    def test_only_bookable_trips(self, api_client, at, leg):
+        leg('Paris', 'Lyon', at(8), at(12), places_dispo=0)
+        leg('Paris', 'Lyon', at(9), at(13), statut='CANCELLED')
+        small = leg('Paris', 'Lyon', at(10), at(14), places_dispo=1)
+        assert plan(api_client, at) == [[small.id]]
+        assert plan(api_client, at, seats=2) == []
+
+    def test_stops_use_canonical_places(self, api_client, at, leg):
+        Place.objects.create(name='Lyon').aliases.create(name='Lyon Part-Dieu')
+        first = leg('Paris', 'Lyon Part-Dieu', at(8), at(12))
+        assert plan(api_client, at, destination='lyon') == [[first.id]]
+
+    def test_timetable_follows_writes(self, api_client, at, leg, monkeypatch):
+        assert plan(api_client, at) == []
+        reloads = []
+        monkeypatch.setattr(timetable, 'reload', lambda: reloads.append(1))
+        trip = leg('Paris', 'Lyon', at(8), at(12))
+        assert plan(api_client, at) == [[trip.id]]
+        trip.temps_depart, trip.temps_arrive = at(7), at(11)
+        trip.save()
+        assert plan(api_client, at, depart_after=at(7, 30).isoformat()) == []
+        trip.cancel()
+        assert plan(api_client, at) == []
+        # Mises à jour incrémentales, sans rechargement complet
+        assert reloads == []
+
+    def test_missing_parameter(self, api_client):
+        response = api_client.get(reverse('journey-planner'), {'from': 'Paris'})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        invalid = api_client.get(reverse('journey-planner'), {'from': 'Paris', 'to': 'Lyon', 'depart_after': '2024-13-01'})
+        assert invalid.status_code == status.HTTP_400_BAD_REQUEST
@@ -0,0 +1,145 @@
+"""
+Tests for the driver leaderboards (api.leaderboard).
+"""
+import random
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework import status
+
+from api.leaderboard import RANK_ORDER, bayesian_score, leaderboard_totals, rank_leaderboards, ranked
+from api.models import Community, DriverRank, Leaderboard, Rating
+
+pytestmark = [pytest.mark.django_db, pytest.mark.urls('EcoTrajet.urls')]
+
+
+def board(communaute=None):
+    ranks = DriverRank.objects.filter(leaderboard__communaute=communaute).order_by('rank')
+    return [(rank.rank, rank.driver_id, rank.score, rank.rating_count, rank.score_sum) for rank in ranks]
+
+
+def expected(communaute=None):
+    return ranked(leaderboard_totals(Rating.objects.all()).get(communaute, {}))
+
+
+class TestLeaderboard:
+    """Ratings update the totals of their driver; the job renumbers the ranks to match a full recomputation."""
+
+    def test_incremental_ranks(self, make_user, make_trip):
+        rng = random.Random(7)
+        community = Community.objects.create(name='Alpes', admin=make_user())
+        drivers = [make_user(role='conducteur') for _ in range(6)]
+        trips = [make_trip(conducteur=driver, communaute=community if n % 2 else None)
+                 for n, driver in enumerate(drivers)]
+        reviewers = [make_user() for _ in range(5)]
+        ratings = []
+        for reviewer in reviewers:
+            for trip in rng.sample(trips, 4):
+                ratings.append(Rating.objects.create(
+                    reviewer=reviewer, rated_user=trip.conducteur, trip=trip, score=rng.randint(1, 5),
+                ))
+        # Note d'un passager : absente des classements
+        Rating.objects.create(reviewer=drivers[0], rated_user=reviewers[0], trip=trips[0], score=1)
+        for rating in rng.sample(ratings, 6):
+            rating.score = rng.randint(1, 5)
+            rating.save()
+        for rating in rng.sample(ratings, 5):
+            Rating.objects.get(pk=rating.pk).delete()
+        assert {row[1:] for row in board()} == {row[1:] for row in expected()}
+        # Taille tenue à jour par les notes, avant toute renumérotation
+        assert Leaderboard.objects.get(communaute__isnull=True).size == len(expected())
+        assert rank_leaderboards(chunk_size=2)[0] == 2
+        assert board() == expected() and board(community) == expected(community.pk)
+        assert [driver_id for _, driver_id, *_ in board(community)] == [
+            driver_id for _, driver_id, *_ in board() if driver_id in {drivers[n].pk for n in (1, 3, 5)}
+        ]
+        assert Leaderboard.objects.get(communaute__isnull=True).size == len(board())
+
+    def test_volume_outweighs_a_single_top_score(self, make_user, make_trip):
+        newcomer, veteran = make_user(role='conducteur'), make_user(role='conducteur')
+        Rating.objects.create(reviewer=make_user(), rated_user=newcomer, trip=make_trip(conducteur=newcomer), score=5)
+        trip = make_trip(conducteur=veteran)
+        for score in (5, 5, 4, 5, 5, 4, 5, 5):
+            Rating.objects.create(reviewer=make_user(), rated_user=veteran, trip=trip, score=score)
+        rank_leaderboards()
+        assert [driver_id for _, driver_id, *_ in board()] == [veteran.pk, newcomer.pk]
+        assert board()[1][2] == bayesian_score(5, 1)
+
+    def test_rebuild(self, make_user, make_trip, driver):
+        community = Community.objects.create(name='Jura', admin=driver)
+        trip = make_trip(communaute=community)
+        Rating.objects.create(reviewer=make_user(), rated_user=driver, trip=trip, score=4)
+        # Trajet changé de communauté sans mise à jour des classements
+        trip.communaute = None
+        trip.save()
+        DriverRank.objects.filter(leaderboard__communaute__isnull=True).update(rank=9)
+        out = StringIO()
+        call_command('rebuild_leaderboards', stdout=out)
+        assert board() == expected() and board(community) == []
+        assert '2 classements' in out.getvalue()
+
+    def test_ratings_leave_other_rows_alone(self, make_user, make_trip):
+        first, second = make_user(role='conducteur'), make_user(role='conducteur')
+        Rating.objects.create(reviewer=make_user(), rated_user=first, trip=make_trip(conducteur=first), score=3)
+        call_command('rank_leaderboards', stdout=StringIO())
+        ranks = list(DriverRank.objects.values_list('driver_id', 'rank', 'updated_at'))
+        Rating.objects.create(reviewer=make_user(), rated_user=second, trip=make_trip(conducteur=second), score=5)
+        # Nouveau conducteur sans rang, les autres lignes inchangées jusqu'au prochain passage
+        assert DriverRank.objects.get(driver=second).rank is None
+        assert list(DriverRank.objects.exclude(driver=second).values_list('driver_id', 'rank', 'updated_at')) == ranks
+        assert Leaderboard.objects.get(communaute__isnull=True).size == 2
+        out = StringIO()
+        call_command('rank_leaderboards', stdout=out)
+        assert '1 classements renumérotés, 2 rangs modifiés' in out.getvalue()
+        assert [driver_id for _, driver_id, *_ in board()] == [second.pk, first.pk]
+        assert Leaderboard.objects.get(communaute__isnull=True).size == 2
+
+
+class TestLeaderboardEndpoints:
+    """Top drivers and the rank of a driver are index reads on the current scores."""
+
+    def test_rank_order_is_indexed(self):
+        # Premiers conducteurs lus dans l'ordre de l'index, sans tri
+        index_fields = {tuple(index.fields) for index in DriverRank._meta.indexes}
+        assert ('leaderboard', *(field.replace('driver_id', 'driver') for field in RANK_ORDER)) in index_fields
+
+    def test_top_drivers_and_rank(self, api_client, make_user, make_trip, django_assert_num_queries):
+        community = Community.objects.create(name='Alpes', admin=make_user())
+        drivers = [make_user(role='conducteur') for _ in range(4)]
+        for n, driver in enumerate(drivers):
+            trip = make_trip(conducteur=driver, communaute=community if n < 2 else None)
+            Rating.objects.create(reviewer=make_user(), rated_user=driver, trip=trip, score=2 + n)
+        # Sans renumérotation préalable
+        api_client.force_authenticate(user=make_user())
+        with django_assert_num_queries(1):
+            response = api_client.get(reverse('rating-top-drivers'), {'limit': 3})
+        assert [row['driver'] for row in response.data] == [drivers[3].pk, drivers[2].pk, drivers[1].pk]
+        assert [row['rank'] for row in response.data] == [1, 2, 3]
+        assert response.data[0]['driver_name'] == f"{drivers[3].prenom} {drivers[3].nom}"
+        response = api_client.get(reverse('rating-top-drivers'), {'community': community.pk})
+        assert [row['driver'] for row in response.data] == [drivers[1].pk, drivers[0].pk]
+
+        with django_assert_num_queries(2):
+            response = api_client.get(reverse('rating-driver-rank'), {'user_id': drivers[1].pk})
+        assert (response.data['rank'], response.data['total_drivers']) == (3, 4)
+        response = api_client.get(reverse('rating-driver-rank'), {'user_id': drivers[1].pk, 'community': community.pk})
+        assert (response.data['rank'], response.data['total_drivers']) == (1, 2)
+        missing = api_client.get(reverse('rating-driver-rank'), {'user_id': drivers[3].pk, 'community': community.pk})
+        assert missing.status_code == status.HTTP_404_NOT_FOUND
+        assert api_client.get(reverse('rating-top-drivers'), {'limit': 0}).status_code == status.HTTP_400_BAD_REQUEST
+        assert api_client.get(reverse('rating-top-drivers'), {'community': 'x'}).status_code == (
+            status.HTTP_400_BAD_REQUEST
+        )
+
+    def test_new_rating_is_ranked_at_once(self, api_client, make_user, make_trip):
+        first, second = make_user(role='conducteur'), make_user(role='conducteur')
+        Rating.objects.create(reviewer=make_user(), rated_user=first, trip=make_trip(conducteur=first), score=3)
+        rank_leaderboards()
+        Rating.objects.create(reviewer=make_user(), rated_user=second, trip=make_trip(conducteur=second), score=5)
+        api_client.force_authenticate(user=make_user())
+        response = api_client.get(reverse('rating-top-drivers'))
+        assert [(row['rank'], row['driver']) for row in response.data] == [(1, second.pk), (2, first.pk)]
+        response = api_client.get(reverse('rating-driver-rank'), {'user_id': first.pk})
+        assert (response.data['rank'], response.data['total_drivers']) == (2, 2)
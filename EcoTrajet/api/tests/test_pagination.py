@@ -0,0 +1,107 @@
+"""
+Tests for the opt-in keyset pagination of trip, reservation and rating lists.
+"""
+from datetime import timedelta
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+
+from api.models import Rating, Reservation
+from api.pagination import KeysetPagination
+
+pytestmark = [pytest.mark.django_db, pytest.mark.urls('EcoTrajet.urls')]
+
+
+@pytest.fixture(autouse=True)
+def small_pages(monkeypatch):
+    monkeypatch.setattr(KeysetPagination, 'page_size', 2)
+
+
+def walk(api_client, url, params=None):
+    """Follow next links and return the list of pages (lists of ids)."""
+    pages = []
+    response = api_client.get(url, params)
+    while True:
+        assert response.status_code == status.HTTP_200_OK
+        assert 'count' not in response.data
+        pages.append([item.get('id', item.get('idRate')) for item in response.data['results']])
+        if not response.data['next']:
+            return pages, response
+        response = api_client.get(response.data['next'])
+
+
+class TestTripKeysetPagination:
+    """Tests for keyset pages on /api/trips/."""
+
+    def test_page_number_mode_is_the_default(self, api_client, make_trip):
+        make_trip()
+        response = api_client.get(reverse('trip-list'))
+        assert response.data['count'] == 1
+
+    def test_walks_forward_and_back_in_natural_order(self, api_client, make_trip):
+        now = timezone.now()
+        trips = [make_trip(temps_depart=now + timedelta(days=i)) for i in range(5)]
+        # Deux trajets au même horaire : départage par id
+        trips.append(make_trip(temps_depart=trips[2].temps_depart))
+        expected = [t.id for t in sorted(trips, key=lambda t: (t.temps_depart, t.id), reverse=True)]
+
+        pages, last = walk(api_client, reverse('trip-list'), {'pagination': 'cursor'})
+        assert [i for page in pages for i in page] == expected
+        assert [len(page) for page in pages] == [2, 2, 2]
+
+        previous = api_client.get(last.data['previous'])
+        assert [t['id'] for t in previous.data['results']] == pages[1]
+        first = api_client.get(previous.data['previous'])
+        assert [t['id'] for t in first.data['results']] == pages[0]
+        assert first.data['previous'] is None
+
+    def test_keyset_combines_with_search_filters(self, api_client, make_trip):
+        for _ in range(3):
+            make_trip(origine='Lille')
+        make_trip(origine='Paris')
+        pages, _ = walk(api_client, reverse('trip-list'), {'pagination': 'cursor', 'origin': 'lille'})
+        assert sum(len(page) for page in pages) == 3
+
+    def test_keyset_page_runs_no_count(self, api_client, make_trip):
+        for _ in range(3):
+            make_trip()
+        with CaptureQueriesContext(connection) as queries:
+            api_client.get(reverse('trip-list'), {'pagination': 'cursor'})
+        # Une seule requête, la page : pas de SELECT COUNT(*) du total
+        [page] = [q['sql'].upper() for q in queries.captured_queries]
+        assert not page.startswith('SELECT COUNT(')
+        assert 'OFFSET' not in page
+
+    def test_response_schema_describes_both_modes(self):
+        schema = KeysetPagination().get_paginated_response_schema({'type': 'array'})
+        assert set(schema['properties']) == {'count', 'next', 'previous', 'results'}
+        assert 'count' not in schema['required'] and 'results' in schema['required']
+
+    def test_invalid_cursor(self, api_client):
+        response = api_client.get(reverse('trip-list'), {'cursor': 'pas-un-curseur'})
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+class TestReservationAndRatingKeysetPagination:
+    """Tests for keyset pages on reservations and ratings."""
+
+    def test_reservations(self, api_client, passenger, make_trip):
+        reservations = [Reservation.objects.create(passenger=passenger, trip=make_trip()) for _ in range(3)]
+        api_client.force_authenticate(user=passenger)
+        pages, _ = walk(api_client, reverse('reservation-list'), {'pagination': 'cursor'})
+        assert [i for page in pages for i in page] == [r.id for r in reversed(reservations)]
+
+    def test_ratings(self, api_client, driver, make_user, make_trip):
+        trip = make_trip()
+        ratings = [
+            Rating.objects.create(reviewer=make_user(), rated_user=driver, trip=trip, score=4)
+            for _ in range(3)
+        ]
+        api_client.force_authenticate(user=driver)
+        pages, _ = walk(api_client, reverse('rating-list'), {'pagination': 'cursor'})
+        expected = [str(r.idRate) for r in sorted(ratings, key=lambda r: (r.created_at, r.idRate), reverse=True)]
+        assert [i for page in pages for i in page] == expected
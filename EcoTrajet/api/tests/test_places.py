@@ -0,0 +1,123 @@
+"""
+Tests for the Place table, trip/place linking and the autocomplete endpoint.
+"""
+import time
+
+import pytest
+from django.db import transaction
+from django.urls import reverse
+from rest_framework import status
+
+from api.models import Place, PlaceAlias
+from api.places import place_index, place_keys
+
+pytestmark = [pytest.mark.django_db, pytest.mark.urls('EcoTrajet.urls')]
+
+
+@pytest.fixture
+def paris():
+    place = Place.objects.create(name='Paris')
+    PlaceAlias.objects.create(place=place, name='Paris Gare de Lyon')
+    return place
+
+
+def autocomplete(api_client, q, **params):
+    response = api_client.get(reverse('place-autocomplete'), {'q': q, **params})
+    assert response.status_code == status.HTTP_200_OK
+    return [place['name'] for place in response.data['results']]
+
+
+class TestPlaceModel:
+    """Tests for Place, PlaceAlias and PlaceManager.resolve."""
+
+    def test_slug_is_accent_folded(self):
+        assert Place.objects.create(name='Saint-Étienne').slug == 'saint-etienne'
+
+    def test_resolve_by_name_or_alias(self, paris):
+        assert Place.objects.resolve('  PARIS ') == paris
+        assert Place.objects.resolve('paris gare de lyon') == paris
+        assert Place.objects.resolve('Lyon') is None
+
+    def test_place_keys_include_word_suffixes(self):
+        assert {'paris-gare-de-lyon', 'gare-de-lyon', 'lyon'} <= place_keys('Paris', ['Paris Gare de Lyon'])
+
+
+class TestTripPlaces:
+    """Tests for the trip → place links."""
+
+    def test_trip_is_linked_on_save(self, paris, make_trip):
+        trip = make_trip(origine='Paris Gare de Lyon', destination='Nowhere')
+        assert trip.origine_place == paris
+        assert trip.destination_place is None
+
+    def test_existing_trips_are_linked_when_alias_is_added(self, make_trip):
+        trip = make_trip(origine='Marseille St-Charles')
+        marseille = Place.objects.create(name='Marseille')
+        PlaceAlias.objects.create(place=marseille, name='Marseille St-Charles')
+        trip.refresh_from_db()
+        assert trip.origine_place == marseille
+
+    def test_editing_the_text_relinks(self, paris, make_trip):
+        trip = make_trip(origine='Paris')
+        trip.origine = 'Lille'
+        trip.save()
+        assert trip.origine_place is None
+
+    def test_search_by_alias_finds_canonical_trips(self, api_client, paris, make_trip):
+        match = make_trip(origine='paris')
+        make_trip(origine='Lille')
+        response = api_client.get(reverse('trip-list'), {'origin': 'Paris Gare de Lyon'})
+        assert [t['id'] for t in response.data['results']] == [match.id]
+
+    def test_search_by_place_id(self, api_client, paris, make_trip):
+        match = make_trip(origine='Paris')
+        make_trip(origine='Lille')
+        response = api_client.get(reverse('trip-list'), {'origin_place': paris.id})
+        assert [t['id'] for t in response.data['results']] == [match.id]
+
+
+class TestPlaceAutocomplete:
+    """Tests for /api/places/autocomplete/."""
+
+    def test_prefix_accents_and_inner_words(self, api_client, paris):
+        Place.objects.create(name='Saint-Étienne')
+        Place.objects.create(name='Pau')
+        assert autocomplete(api_client, 'pa') == ['Pau', 'Paris']
+        assert autocomplete(api_client, 'SAINT-É') == ['Saint-Étienne']
+        assert autocomplete(api_client, 'gare de') == ['Paris']
+        assert autocomplete(api_client, '') == []
+
+    def test_index_follows_changes(self, api_client, paris, django_capture_on_commit_callbacks):
+        assert autocomplete(api_client, 'bord') == []
+        with django_capture_on_commit_callbacks(execute=True):
+            bordeaux = Place.objects.create(name='Bordeaux')
+        assert autocomplete(api_client, 'bord') == ['Bordeaux']
+        bordeaux.name = 'Bordeaux Saint-Jean'
+        with django_capture_on_commit_callbacks(execute=True):
+            bordeaux.save()
+        assert autocomplete(api_client, 'saint-j') == ['Bordeaux Saint-Jean']
+        with django_capture_on_commit_callbacks(execute=True):
+            bordeaux.delete()
+        assert autocomplete(api_client, 'bord') == []
+
+    def test_rolled_back_change_is_not_indexed(self, api_client, paris):
+        assert autocomplete(api_client, 'bord') == []
+        with pytest.raises(RuntimeError), transaction.atomic():
+            Place.objects.create(name='Bordeaux')
+            raise RuntimeError
+        assert autocomplete(api_client, 'bord') == []
+
+    def test_limit(self, api_client):
+        for i in range(30):
+            Place.objects.create(name=f'Ville {i}')
+        assert len(autocomplete(api_client, 'ville')) == 10
+        assert len(autocomplete(api_client, 'ville', limit=50)) == 20
+
+    def test_lookup_is_fast(self):
+        Place.objects.bulk_create([Place(name=f'Commune {i}', slug=f'commune-{i}') for i in range(5000)])
+        place_index.rebuild()
+        started = time.perf_counter()
+        for i in range(200):
+            place_index.search(f'commune {i}')
+        average_ms = (time.perf_counter() - started) * 1000 / 200
+        assert average_ms < 5
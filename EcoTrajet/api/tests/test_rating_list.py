@@ -0,0 +1,56 @@
+"""
+Tests for the rating listings (/api/ratings/): names and trip labels are
+read with the page, whatever its size.
+"""
+import pytest
+from django.urls import reverse
+from rest_framework import status
+
+from api.models import Rating
+
+pytestmark = [pytest.mark.django_db, pytest.mark.urls('EcoTrajet.urls')]
+
+
+@pytest.fixture
+def rate_driver(driver, make_user, make_trip):
+    """Give ``count`` ratings to the driver, each on a trip of its own."""
+    def _rate(count):
+        for _ in range(count):
+            Rating.objects.create(
+                reviewer=make_user(), rated_user=driver, trip=make_trip(destination='Grenoble'), score=4,
+            )
+    return _rate
+
+
+class TestRatingList:
+    """Listings run a fixed number of queries."""
+
+    def test_constant_queries(self, api_client, driver, passenger, rate_driver, django_assert_num_queries):
+        api_client.force_authenticate(user=passenger)
+        trip_id = None
+        for count in (2, 12):
+            rate_driver(count)
+            trip_id = Rating.objects.latest('created_at').trip_id
+            # Nombre de lignes puis la page, noms et trajets compris
+            with django_assert_num_queries(2):
+                response = api_client.get(reverse('rating-list'))
+            with django_assert_num_queries(2):
+                api_client.get(reverse('rating-list'), {'rated_user': driver.pk, 'min_score': 3})
+            with django_assert_num_queries(1):
+                api_client.get(reverse('rating-list'), {'rated_user': driver.pk, 'pagination': 'cursor'})
+            with django_assert_num_queries(1):
+                trip_response = api_client.get(reverse('rating-trip-ratings'), {'trip_id': trip_id})
+        row = response.data['results'][0]
+        assert row['rated_user_name'] == f"{driver.prenom} {driver.nom}"
+        assert row['trip_info'] == 'Paris -> Grenoble' and row['reviewer_name'].startswith('Prenom')
+        assert [row['trip'] for row in trip_response.data] == [trip_id]
+
+    def test_update_returns_fresh_labels(self, api_client, driver, passenger, make_user, make_trip):
+        rating = Rating.objects.create(reviewer=passenger, rated_user=driver, trip=make_trip(), score=3)
+        other = make_user(prenom='Luc', nom='Petit')
+        api_client.force_authenticate(user=passenger)
+        response = api_client.patch(
+            reverse('rating-detail', kwargs={'pk': rating.pk}), {'rated_user': other.pk}, format='json',
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['rated_user_name'] == 'Luc Petit'
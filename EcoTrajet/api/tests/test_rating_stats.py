@@ -0,0 +1,140 @@
+"""
+Tests for the incrementally maintained rating statistics (UserRatingStats).
+"""
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+
+from api import serializers
+from api.models import Rating, TripSearchDocument, UserRatingStats
+
+pytestmark = [pytest.mark.django_db, pytest.mark.urls('EcoTrajet.urls')]
+
+
+def stats(user):
+    row = UserRatingStats.for_user(user)
+    return row.rating_count, row.score_sum, row.histogram()
+
+
+def histogram(**counts):
+    return {score: counts.get(f's{score}', 0) for score in range(1, 6)}
+
+
+class TestUserRatingStats:
+    """Every change of a rating moves the stats of the rated user."""
+
+    def test_create_update_delete(self, driver, passenger, make_user, make_trip):
+        trip = make_trip()
+        rating = Rating.objects.create(reviewer=passenger, rated_user=driver, trip=trip, score=4)
+        Rating.objects.create(reviewer=make_user(), rated_user=driver, trip=trip, score=5)
+        assert stats(driver) == (2, 9, histogram(s4=1, s5=1))
+        assert Rating.ratings.average_for_user(driver) == 4.5
+        rating.score = 2
+        rating.save()
+        assert stats(driver) == (2, 7, histogram(s2=1, s5=1))
+        other = make_user(role='conducteur')
+        rating.rated_user = other
+        rating.save()
+        assert stats(driver) == (1, 5, histogram(s5=1))
+        assert stats(other) == (1, 2, histogram(s2=1))
+        Rating.objects.get(pk=rating.pk).delete()
+        assert stats(other) == (0, 0, histogram())
+        assert Rating.ratings.count_for_user(other) == 0
+
+    def test_writes_do_not_aggregate_ratings(self, driver, passenger, make_trip):
+        trip = make_trip()
+        with CaptureQueriesContext(connection) as queries:
+            rating = Rating.objects.create(reviewer=passenger, rated_user=driver, trip=trip, score=4)
+            rating.delete()
+        assert not [query['sql'] for query in queries if 'AVG(' in query['sql'] or 'GROUP BY' in query['sql']]
+        Rating.objects.create(reviewer=passenger, rated_user=driver, trip=trip, score=5)
+        document = TripSearchDocument.objects.get(trip=trip)
+        assert (document.driver_rating, document.driver_rating_count) == (5, 1)
+
+    def test_user_stats_is_a_primary_key_lookup(self, api_client, driver, passenger, make_trip,
+                                                django_assert_num_queries):
+        Rating.objects.create(reviewer=passenger, rated_user=driver, trip=make_trip(), score=4)
+        Rating.objects.create(reviewer=passenger, rated_user=driver, trip=make_trip(), score=5)
+        api_client.force_authenticate(user=passenger)
+        url = reverse('rating-user-stats')
+        with django_assert_num_queries(1):
+            response = api_client.get(url, {'user_id': driver.pk})
+        assert response.status_code == status.HTTP_200_OK
+        assert (response.data['user_id'], response.data['average_rating'], response.data['total_ratings']) == (
+            driver.pk, 4.5, 2,
+        )
+        assert response.data['user_name'] == f"{driver.prenom} {driver.nom}"
+        assert response.data['ratings_detail'][3] == {'score': 4, 'count': 1, 'percentage': 50.0}
+        assert api_client.get(url, {'user_id': passenger.pk}).data['total_ratings'] == 0
+        assert api_client.get(url, {'user_id': 999_999}).status_code == status.HTTP_404_NOT_FOUND
+        assert api_client.get(url, {'user_id': 'abc'}).status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_rebuild(self, driver, passenger, make_user, make_trip):
+        Rating.objects.create(reviewer=passenger, rated_user=driver, trip=make_trip(), score=3)
+        unrated = make_user()
+        UserRatingStats.objects.filter(pk=driver.pk).update(rating_count=7, score_3=0)
+        UserRatingStats.objects.create(user=unrated, rating_count=1, score_sum=5, score_5=1)
+        out = StringIO()
+        call_command('rebuild_rating_stats', chunk_size=1, stdout=out)
+        assert stats(driver) == (1, 3, histogram(s3=1))
+        assert not UserRatingStats.objects.filter(pk=unrated.pk).exists()
+        assert '1 statistiques' in out.getvalue() and '1 supprimées' in out.getvalue()
+
+
+class TestBulkRatings:
+    """A batch of ratings costs a fixed number of queries per rated user, not per rating."""
+
+    def test_bulk_create(self, api_client, driver, make_user, make_trip, django_assert_num_queries):
+        trips = [make_trip(), make_trip()]
+        reviewers = [make_user() for _ in range(20)]
+        payload = [
+            {'reviewer': reviewer.pk, 'rated_user': driver.pk, 'trip': trip.pk, 'score': 1 + n % 5}
+            for n, (reviewer, trip) in enumerate((reviewer, trip) for reviewer in reviewers for trip in trips)
+        ]
+        api_client.force_authenticate(user=reviewers[0])
+        url = reverse('rating-bulk-create')
+        # Utilisateurs, trajets, triplets existants, insertion, statistiques (mise à jour puis
+        # création de la ligne), classement global (trajets, création du classement, ligne du
+        # conducteur verrouillée puis insérée, taille du classement), note des documents (lecture
+        # et mise à jour), et les savepoints
+        with django_assert_num_queries(22):
+            response = api_client.post(url, payload, format='json')
+        assert response.status_code == status.HTTP_201_CREATED
+        assert len(response.data) == 40 and response.data[0]['rated_user'] == driver.pk
+        assert stats(driver) == (40, 120, histogram(s1=8, s2=8, s3=8, s4=8, s5=8))
+
+        other = make_user(role='conducteur')
+        response = api_client.post(url, [payload[0], {**payload[1], 'rated_user': other.pk}], format='json')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert Rating.objects.count() == 40
+        duplicate = api_client.post(url, [payload[1], payload[1]], format='json')
+        assert duplicate.status_code == status.HTTP_400_BAD_REQUEST
+        own = api_client.post(url, [{**payload[0], 'rated_user': reviewers[0].pk}], format='json')
+        assert own.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_bulk_create_race(self, api_client, driver, make_user, make_trip, monkeypatch):
+        reviewer, trip = make_user(), make_trip()
+        create_ratings = serializers.create_ratings
+
+        def concurrent(ratings):
+            # Même lot enregistré par une autre requête entre la validation et l'insertion
+            Rating.objects.create(reviewer=reviewer, rated_user=driver, trip=trip, score=2)
+            return create_ratings(ratings)
+
+        monkeypatch.setattr(serializers, 'create_ratings', concurrent)
+        api_client.force_authenticate(user=reviewer)
+        response = api_client.post(
+            reverse('rating-bulk-create'),
+            [{'reviewer': reviewer.pk, 'rated_user': driver.pk, 'trip': trip.pk, 'score': 4}],
+            format='json',
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data['non_field_errors'] == [
+            f"Vous avez déjà évalué l'utilisateur {driver.pk} pour le trajet {trip.pk}."
+        ]
+        assert stats(driver)[:2] == (1, 2)
@@ -0,0 +1,110 @@
+"""
+Tests for the nightly reputation scores (api.reputation).
+"""
+from datetime import timedelta
+from io import StringIO
+
+import numpy as np
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from api.leaderboard import PRIOR_MEAN
+from api.models import Rating, TripSearchDocument, UserReputation
+from api.reputation import ReputationSums, compute_reputations, store_reputations
+from api.tests.conftest import book, cancel
+
+pytestmark = [pytest.mark.django_db, pytest.mark.urls('EcoTrajet.urls')]
+
+
+def scores(**kwargs):
+    user_ids, score, *_ = compute_reputations(**kwargs)
+    return dict(zip(user_ids.tolist(), score.tolist()))
+
+
+def rate(user, trip, score, reviewer, days_ago=0):
+    rating = Rating.objects.create(reviewer=reviewer, rated_user=user, trip=trip, score=score)
+    Rating.objects.filter(pk=rating.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+
+
+class TestReputation:
+    """Recent ratings weigh more, volume adds confidence, cancellations cost."""
+
+    def test_decay_volume_and_cancellations(self, make_user, make_trip):
+        recent, old, single = (make_user(role='conducteur') for _ in range(3))
+        for n in range(4):
+            rate(recent, make_trip(conducteur=recent), 5, make_user())
+            rate(old, make_trip(conducteur=old), 5, make_user(), days_ago=720)
+        rate(single, make_trip(conducteur=single), 5, make_user())
+        before = scores()
+        assert before[recent.pk] > before[single.pk] > before[old.pk] > PRIOR_MEAN
+
+        careful, flaky = make_user(), make_user()
+        trip = make_trip(places_dispo=4)
+        book(careful, trip.pk)
+        cancel(book(flaky, trip.pk))
+        cancelled_trip = make_trip(conducteur=recent)
+        book(careful, cancelled_trip.pk)
+        cancelled_trip.cancel()
+        computed = scores()
+        # Annulation par le conducteur : seul le conducteur est pénalisé
+        assert computed[careful.pk] == PRIOR_MEAN > computed[flaky.pk]
+        assert computed[recent.pk] < before[recent.pk] and computed[old.pk] == pytest.approx(before[old.pk])
+        assert computed == pytest.approx(scores(chunk_size=1))
+
+    def test_sums_are_sized_by_user_count(self, make_user, make_trip):
+        sparse = make_user(role='conducteur', idUser=10**9)
+        rate(sparse, make_trip(conducteur=sparse), 5, make_user())
+        assert scores()[sparse.pk] > PRIOR_MEAN
+        sums = ReputationSums(np.array([3, 10**9]))
+        assert len(sums.rating_weight) == 2
+        # Utilisateur inconnu du calcul : ignoré
+        sums.add_ratings([10**9, 7], [5, 1], [timezone.now()] * 2, timezone.now())
+        assert sums.score_sum.tolist() == [0, pytest.approx(5)]
+
+    def test_stale_rows_are_deleted_in_sql(self, make_user, make_trip):
+        kept, gone = make_user(role='conducteur'), make_user(role='conducteur')
+        make_trip(conducteur=gone)
+        UserReputation.objects.create(user=gone, score=1, computed_at=timezone.now())
+        now = timezone.now()
+        reputations = (np.array([kept.pk]), np.array([4.0]), np.array([1.0]), np.array([0.0]))
+        with CaptureQueriesContext(connection) as queries:
+            assert store_reputations(*reputations, now) == (1, 1)
+        # Lignes périmées ni lues ni listées : sélectionnées par la date du calcul
+        assert not any(query['sql'].startswith('SELECT') for query in queries.captured_queries)
+        assert any(query['sql'].startswith('DELETE') and '"computed_at" <' in query['sql']
+                   for query in queries.captured_queries)
+        assert list(UserReputation.objects.values_list('pk', flat=True)) == [kept.pk]
+        assert set(TripSearchDocument.objects.filter(conducteur=gone).values_list('driver_reputation', flat=True)) == {
+            PRIOR_MEAN
+        }
+
+    def test_job_feeds_search_and_profile(self, api_client, make_user, make_trip, django_assert_num_queries):
+        good, poor = make_user(role='conducteur'), make_user(role='conducteur')
+        good_trip, poor_trip = make_trip(conducteur=good), make_trip(conducteur=poor)
+        rate(good, good_trip, 5, make_user())
+        rate(poor, poor_trip, 1, make_user())
+        UserReputation.objects.create(user=make_user(), score=1, computed_at=timezone.now())
+        out = StringIO()
+        call_command('compute_reputations', chunk_size=1, stdout=out)
+        assert '2 réputations calculées, 1 supprimées' in out.getvalue()
+        documents = dict(TripSearchDocument.objects.values_list('conducteur_id', 'driver_reputation'))
+        assert documents[good.pk] == UserReputation.objects.get(pk=good.pk).score > PRIOR_MEAN > documents[poor.pk]
+        # Nouveau trajet : réputation recopiée à la création du document
+        make_trip(conducteur=good)
+        assert set(TripSearchDocument.objects.filter(conducteur=good).values_list('driver_reputation', flat=True)) == {
+            documents[good.pk]
+        }
+
+        response = api_client.get(reverse('trip-search'), {'sort': 'reputation'})
+        assert [row['conducteur']['id'] for row in response.data['results']] == [good.pk, good.pk, poor.pk]
+        api_client.force_authenticate(user=poor)
+        with django_assert_num_queries(1):
+            response = api_client.get(reverse('rating-user-stats'), {'user_id': poor.pk})
+        assert response.data['reputation'] == documents[poor.pk]
+        assert api_client.get(reverse('rating-user-stats'), {'user_id': make_user().pk}).data['reputation'] == (
+            PRIOR_MEAN
+        )
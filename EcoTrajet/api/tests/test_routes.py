@@ -0,0 +1,114 @@
+"""
+Tests for route polylines, the route grid index and corridor search.
+"""
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+
+from api.models import TripRouteCell
+from api.routes import decode_polyline, encode_polyline, route_cells
+from api.serializers import TripWriteSerializer
+
+pytestmark = pytest.mark.urls('EcoTrajet.urls')
+
+PARIS = (48.8566, 2.3522)
+ORLEANS = (47.9030, 1.9093)
+BLOIS = (47.5861, 1.3359)
+TOURS = (47.3941, 0.6848)
+LYON = (45.7640, 4.8357)
+PARIS_TOURS = encode_polyline([PARIS, ORLEANS, BLOIS, TOURS])
+
+
+class TestPolyline:
+    """Tests for the polyline codec."""
+
+    def test_reference_encoding(self):
+        points = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+        assert encode_polyline(points) == '_p~iF~ps|U_ulLnnqC_mqNvxq`@'
+        assert decode_polyline('_p~iF~ps|U_ulLnnqC_mqNvxq`@') == points
+
+    @pytest.mark.parametrize('value', ['_p~iF', '_p~iF~ps|U \x01'])
+    def test_malformed(self, value):
+        with pytest.raises(ValueError):
+            decode_polyline(value)
+
+    def test_route_cells_follow_the_route(self):
+        cells = route_cells(PARIS_TOURS)
+        # Itinéraire densifié : pas de trou entre les cellules sur ~240 km
+        assert len(cells) > 40
+        positions = sorted(cells.values())
+        assert positions[0][0] == 0
+
+
+@pytest.mark.django_db
+class TestRouteIndex:
+    """Tests for the TripRouteCell grid maintained by Trip.save."""
+
+    def test_cells_written_on_create_and_replaced_on_edit(self, make_trip):
+        trip = make_trip(route_polyline=PARIS_TOURS)
+        assert TripRouteCell.objects.filter(trip=trip).count() == len(route_cells(PARIS_TOURS))
+        trip.route_polyline = encode_polyline([PARIS, LYON])
+        trip.save()
+        assert TripRouteCell.objects.filter(trip=trip).count() == len(route_cells(trip.route_polyline))
+
+    def test_only_scheduled_trips_are_indexed(self, make_trip):
+        trip = make_trip(route_polyline=PARIS_TOURS)
+        trip.cancel()
+        assert not TripRouteCell.objects.filter(trip=trip).exists()
+
+    def test_unchanged_route_is_not_reindexed(self, make_trip, django_assert_num_queries):
+        trip = make_trip(route_polyline=PARIS_TOURS)
+        trip.prix = 12
+        # UPDATE du trajet et de son document de recherche, pas de réindexation
+        with django_assert_num_queries(2):
+            trip.save()
+
+    def test_invalid_polyline_is_rejected(self):
+        serializer = TripWriteSerializer(data={'route_polyline': '_p~iF'}, partial=True)
+        assert not serializer.is_valid()
+        assert 'route_polyline' in serializer.errors
+
+
+@pytest.mark.django_db
+class TestCorridorSearch:
+    """Tests for the pickup/dropoff parameters of /api/trips/."""
+
+    def search(self, api_client, pickup, dropoff, **extra):
+        response = api_client.get(reverse('trip-list'), {
+            'pickup_lat': pickup[0], 'pickup_lon': pickup[1],
+            'dropoff_lat': dropoff[0], 'dropoff_lon': dropoff[1], **extra,
+        })
+        assert response.status_code == status.HTTP_200_OK
+        return [t['id'] for t in response.data['results']]
+
+    def test_intermediate_towns_in_order(self, api_client, make_trip):
+        trip = make_trip(route_polyline=PARIS_TOURS)
+        make_trip(route_polyline=encode_polyline([PARIS, LYON]))
+        assert self.search(api_client, ORLEANS, BLOIS) == [trip.id]
+        assert self.search(api_client, BLOIS, ORLEANS) == []
+
+    def test_corridor_width(self, api_client, make_trip):
+        make_trip(route_polyline=PARIS_TOURS)
+        off_route = (47.75, 2.40)   # ~40 km au sud-est d'Orléans
+        assert self.search(api_client, off_route, TOURS) == []
+        assert self.search(api_client, off_route, TOURS, corridor_km=30) == []
+        near_orleans = (47.95, 2.05)  # ~8 km de l'itinéraire, près d'Orléans
+        assert self.search(api_client, near_orleans, TOURS) == []
+        assert len(self.search(api_client, near_orleans, TOURS, corridor_km=10)) == 1
+
+    def test_cells_of_the_matching_trips_only(self, api_client, make_trip):
+        cheap = make_trip(route_polyline=PARIS_TOURS, places_dispo=3)
+        for _ in range(3):
+            make_trip(route_polyline=PARIS_TOURS, places_dispo=1)
+        with CaptureQueriesContext(connection) as queries:
+            assert self.search(api_client, ORLEANS, BLOIS, min_seats=2) == [cheap.id]
+        cell_queries = [query['sql'] for query in queries if 'api_triproutecell' in query['sql']]
+        # Une requête groupée, filtrée par la recherche en sous-requête
+        assert len(cell_queries) == 1
+        assert 'GROUP BY' in cell_queries[0] and 'places_dispo' in cell_queries[0]
+
+    def test_pickup_requires_dropoff(self, api_client):
+        response = api_client.get(reverse('trip-list'), {'pickup_lat': 48, 'pickup_lon': 2})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
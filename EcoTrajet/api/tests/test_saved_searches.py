@@ -0,0 +1,143 @@
+"""
+Tests for saved searches, their inverted index and trip percolation.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+from django.core import mail
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+
+from api.alerts import percolate
+from api.models import Place, SavedSearch, SavedSearchKey, TripAlert
+
+pytestmark = [pytest.mark.django_db, pytest.mark.urls('EcoTrajet.urls')]
+
+
+@pytest.fixture
+def paris():
+    return Place.objects.create(name='Paris')
+
+
+@pytest.fixture
+def lyon():
+    return Place.objects.create(name='Lyon')
+
+
+@pytest.fixture
+def save_search(passenger, paris, lyon):
+    tomorrow = timezone.localdate() + timedelta(days=1)
+
+    def _save_search(**kwargs):
+        defaults = {
+            'user': passenger, 'origine_place': paris, 'destination_place': lyon,
+            'date_debut': tomorrow, 'date_fin': tomorrow,
+        }
+        defaults.update(kwargs)
+        return SavedSearch.objects.create(**defaults)
+
+    return _save_search
+
+
+@pytest.fixture
+def post_trip(make_trip, django_capture_on_commit_callbacks):
+    """Create a trip and run the percolation queued for after the commit."""
+    def _post_trip(**kwargs):
+        with django_capture_on_commit_callbacks(execute=True):
+            return make_trip(**kwargs)
+    return _post_trip
+
+
+def alerted(trip):
+    return set(TripAlert.objects.filter(trip=trip).values_list('saved_search_id', flat=True))
+
+
+class TestSavedSearchIndex:
+    """One SavedSearchKey per day of the window, rewritten on save."""
+
+    def test_keys_follow_the_search(self, save_search):
+        search = save_search(date_fin=timezone.localdate() + timedelta(days=3))
+        assert search.keys.count() == 3
+        search.prix_max = Decimal('20')
+        search.save()
+        assert set(search.keys.values_list('prix_max', flat=True)) == {Decimal('20')}
+        search.active = False
+        search.save()
+        assert not search.keys.exists()
+
+
+class TestPercolation:
+    """Trips are matched against the saved searches when saved."""
+
+    def test_matching_searches_are_alerted(self, post_trip, save_search, driver, paris, lyon):
+        match = save_search()
+        cheap_enough = save_search(prix_max=Decimal('30'), places_min=3)
+        save_search(prix_max=Decimal('20'))
+        save_search(places_min=4)
+        later = timezone.localdate() + timedelta(days=5)
+        save_search(date_debut=later, date_fin=later + timedelta(days=1))
+        save_search(origine_place=lyon, destination_place=paris)
+        save_search(user=driver)
+        trip = post_trip()
+        assert alerted(trip) == {match.id, cheap_enough.id}
+
+    def test_edits_only_add_new_matches(self, post_trip, save_search, django_capture_on_commit_callbacks):
+        search = save_search(prix_max=Decimal('20'))
+        trip = post_trip()
+        assert alerted(trip) == set()
+        with django_capture_on_commit_callbacks(execute=True):
+            trip.prix = Decimal('18')
+            trip.save()
+        assert alerted(trip) == {search.id}
+        with django_capture_on_commit_callbacks(execute=True) as callbacks:
+            trip.places_dispo -= 1
+            trip.save()
+        # Moins de places : aucune nouvelle correspondance possible, pas de percolation
+        assert callbacks == []
+        assert TripAlert.objects.count() == 1
+
+    def test_constant_cost(self, make_trip, save_search, make_user, paris, lyon, django_assert_num_queries):
+        trip = make_trip()
+        save_search()
+        with django_assert_num_queries(2):
+            assert percolate(trip) == 1
+        other, start = make_user(), timezone.localdate() + timedelta(days=2)
+        for n in range(30):
+            save_search(user=other, date_debut=start, date_fin=start + timedelta(days=n % 7))
+            save_search(user=other, origine_place=lyon, destination_place=paris)
+        with django_assert_num_queries(2):
+            assert percolate(trip) == 1
+
+    def test_unknown_places_are_not_percolated(self, post_trip, save_search):
+        save_search()
+        assert alerted(post_trip(origine='Meaux')) == set()
+
+
+class TestSavedSearchAPI:
+    """Tests for /api/api/saved-searches/ and the alert delivery command."""
+
+    def test_create_and_validate(self, api_client, passenger, paris, lyon):
+        api_client.force_authenticate(user=passenger)
+        day = timezone.localdate() + timedelta(days=1)
+        payload = {'origine_place': paris.id, 'destination_place': lyon.id, 'date_debut': day}
+        url = reverse('savedsearch-list')
+        response = api_client.post(url, {**payload, 'date_fin': day + timedelta(days=2)}, format='json')
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data['origine'] == 'Paris'
+        assert SavedSearchKey.objects.filter(saved_search_id=response.data['id']).count() == 3
+        response = api_client.post(url, {**payload, 'date_fin': day + timedelta(days=60)}, format='json')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_send_alerts(self, post_trip, save_search, passenger):
+        save_search()
+        save_search(places_min=2)
+        post_trip()
+        post_trip()
+        call_command('send_trip_alerts', stdout=None)
+        assert len(mail.outbox) == 1
+        assert mail.outbox[0].to == [passenger.email]
+        assert mail.outbox[0].body.count('Paris → Lyon') == 4
+        assert not TripAlert.objects.filter(sent_at__isnull=True).exists()
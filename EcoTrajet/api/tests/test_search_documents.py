@@ -0,0 +1,110 @@
+"""
+Tests for the denormalized trip search documents and /api/trips/search/.
+"""
+from decimal import Decimal
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework import status
+
+from api.models import Rating, Reservation, TripSearchDocument
+from user_management.models import Vehicule
+
+pytestmark = [pytest.mark.django_db, pytest.mark.urls('EcoTrajet.urls')]
+
+
+@pytest.fixture
+def vehicule(driver):
+    return Vehicule.objects.create(
+        owner=driver, license_plate='AB-123-CD', make='Renault', model='Zoé',
+        couleur='Bleu', number_of_seats=4,
+    )
+
+
+def document(trip):
+    return TripSearchDocument.objects.get(trip=trip)
+
+
+class TestDocumentMaintenance:
+    """The document follows every write that changes a search result."""
+
+    def test_created_with_trip(self, make_trip, vehicule):
+        doc = document(make_trip(vehicule=vehicule))
+        assert doc.driver_name == 'Claire M.'
+        assert doc.vehicle_label == 'Renault Zoé'
+        assert (doc.origine_norm, doc.destination_norm) == ('paris', 'lyon')
+        assert (doc.prix, doc.places_dispo, doc.statut) == (Decimal('25.00'), 3, 'SCHEDULED')
+
+    def test_trip_and_reservation_writes(self, make_trip, passenger):
+        trip = make_trip()
+        trip.prix = Decimal('19.50')
+        trip.save(update_fields=['prix'])
+        assert document(trip).prix == Decimal('19.50')
+        reservation = Reservation.objects.create(passenger=passenger, trip=trip, place_reserv=2)
+        reservation.statut = 'CONFIRMED'
+        reservation.save()
+        assert document(trip).places_dispo == 1
+        trip.cancel()
+        assert document(trip).statut == 'CANCELLED'
+
+    def test_driver_rating(self, make_trip, driver, passenger):
+        trip = make_trip()
+        other = make_trip()
+        rating = Rating.objects.create(reviewer=passenger, rated_user=driver, trip=trip, score=4)
+        assert (document(other).driver_rating, document(other).driver_rating_count) == (Decimal('4.00'), 1)
+        rating.score = 5
+        rating.save()
+        assert document(other).driver_rating == Decimal('5.00')
+        rating.delete()
+        assert (document(other).driver_rating, document(other).driver_rating_count) == (0, 0)
+
+    def test_driver_and_vehicle_edits(self, make_trip, driver, vehicule, make_user):
+        trip = make_trip(vehicule=vehicule)
+        driver.prenom = 'Claude'
+        driver.save()
+        vehicule.model = 'Mégane'
+        vehicule.save()
+        assert (document(trip).driver_name, document(trip).vehicle_label) == ('Claude M.', 'Renault Mégane')
+        trip.conducteur = make_user(nom='Petit', prenom='Léa')
+        trip.vehicule = None
+        trip.save()
+        assert (document(trip).driver_name, document(trip).vehicle_label) == ('Léa P.', '')
+
+    def test_rebuild_command(self, make_trip, driver, passenger):
+        trips = [make_trip() for _ in range(5)]
+        Rating.objects.create(reviewer=passenger, rated_user=driver, trip=trips[0], score=3)
+        expected = list(TripSearchDocument.objects.order_by('trip').values())
+        TripSearchDocument.objects.all().delete()
+        call_command('rebuild_search_documents', workers=1, chunk_size=2, stdout=None)
+        rebuilt = list(TripSearchDocument.objects.order_by('trip').values())
+        for row in expected + rebuilt:
+            row.pop('updated_at')
+        assert rebuilt == expected
+
+
+class TestTripSearchView:
+    """Tests for /api/trips/search/."""
+
+    def search(self, api_client, **params):
+        response = api_client.get(reverse('trip-search'), params)
+        assert response.status_code == status.HTTP_200_OK
+        return response.data['results']
+
+    def test_filters_and_card(self, api_client, make_trip, vehicule):
+        match = make_trip(vehicule=vehicule, prix=Decimal('15.00'))
+        make_trip(prix=Decimal('40.00'))
+        make_trip(destination='Dijon')
+        make_trip().cancel()
+        results = self.search(api_client, origin='paris', destination='LYON', max_price=20)
+        assert [r['id'] for r in results] == [match.id]
+        assert results[0]['conducteur']['name'] == 'Claire M.'
+        assert results[0]['vehicle_label'] == 'Renault Zoé'
+
+    def test_single_table_read(self, api_client, make_trip, django_assert_num_queries):
+        for _ in range(3):
+            make_trip()
+        self.search(api_client, origin='Paris')  # index des lieux chargé
+        with django_assert_num_queries(1):
+            results = self.search(api_client, origin='Paris', pagination='cursor')
+        assert len(results) == 3
@@ -0,0 +1,117 @@
+"""
+Tests for the in-process columnar trip index behind /api/trips/search/.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+
+from api.models import Community, Place, Reservation
+from api.pagination import KeysetPagination
+from api.trip_index import trip_columns
+
+pytestmark = [pytest.mark.django_db, pytest.mark.urls('EcoTrajet.urls')]
+
+
+@pytest.fixture
+def columns(settings, monkeypatch):
+    """Index enabled and refreshed on every request."""
+    settings.TRIP_COLUMN_INDEX = True
+    monkeypatch.setattr(trip_columns, 'refresh_seconds', 0)
+    return trip_columns
+
+
+@pytest.fixture
+def places(db):
+    return Place.objects.create(name='Paris'), Place.objects.create(name='Lyon')
+
+
+def search(api_client, **params):
+    params.setdefault('departure_after', timezone.now().isoformat())
+    response = api_client.get(reverse('trip-search'), params)
+    assert response.status_code == status.HTTP_200_OK
+    return [trip['id'] for trip in response.data['results']], response
+
+
+class TestTripColumnIndex:
+    """The index answers like the database and follows the writes."""
+
+    def test_same_results_as_database(self, api_client, make_trip, places, driver, settings, monkeypatch):
+        monkeypatch.setattr(trip_columns, 'refresh_seconds', 0)
+        monkeypatch.setattr(KeysetPagination, 'page_size', 3)
+        community = Community.objects.create(name='Covoit Lyon', admin=driver)
+        now = timezone.now()
+        for hours in range(1, 13):
+            make_trip(
+                temps_depart=now + timedelta(hours=hours),
+                prix=Decimal(10 + hours), places_dispo=hours % 4,
+                destination='Lyon' if hours % 3 else 'Dijon',
+                communaute=community if hours % 2 else None,
+            )
+        make_trip(temps_depart=now - timedelta(hours=1))
+        queries = [
+            {}, {'origin': 'paris', 'destination': 'Lyon'}, {'min_seats': 2, 'max_price': '17.5'},
+            {'community': community.id}, {'departure_before': (now + timedelta(hours=6)).isoformat()},
+            {'destination_place': places[1].id, 'page': 2},
+        ]
+        for params in queries:
+            settings.TRIP_COLUMN_INDEX = False
+            expected, _ = search(api_client, **params)
+            settings.TRIP_COLUMN_INDEX = True
+            found, response = search(api_client, **params)
+            assert 'X-Index-Staleness' in response
+            assert found == expected, params
+
+    def test_follows_writes_without_reload(self, api_client, make_trip, passenger, columns, monkeypatch):
+        kept = make_trip(places_dispo=2)
+        cancelled = make_trip()
+        deleted = make_trip()
+        assert len(search(api_client)[0]) == 3
+        reloads = []
+        monkeypatch.setattr(columns, 'reload', lambda: reloads.append(1))
+
+        cancelled.cancel()
+        deleted.delete()
+        added = make_trip(temps_depart=timezone.now() + timedelta(hours=2))
+        reservation = Reservation.objects.create(passenger=passenger, trip=kept, place_reserv=1)
+        reservation.statut = 'CONFIRMED'
+        reservation.save()
+        assert search(api_client)[0] == [added.id, kept.id]
+        assert search(api_client, min_seats=2)[0] == [added.id]
+        assert reloads == []
+
+    def test_price_limit_is_inclusive(self, api_client, make_trip, columns):
+        trip = make_trip(prix=Decimal('0.29'))
+        search(api_client)
+        # 0.29 * 100 vaut 28.999… en flottant : arrondi comme les prix de l'index
+        assert list(columns.search(timezone.now(), max_price=0.29)) == [trip.id]
+        assert search(api_client, max_price='0.29')[0] == [trip.id]
+
+    def test_falls_back_to_database(self, api_client, make_trip, columns):
+        make_trip(origine='Meaux')
+        # Fenêtre antérieure au chargement de l'index, lieu inconnu, curseur
+        for params in ({'departure_after': '2000-01-01'}, {'origin': 'Meaux'}, {'pagination': 'cursor'}):
+            found, response = search(api_client, **params)
+            assert len(found) == 1
+            assert 'X-Index-Staleness' not in response
+
+    def test_page_hydrated_in_one_query(self, api_client, make_trip, columns, django_assert_num_queries):
+        for _ in range(3):
+            make_trip()
+        search(api_client)
+        columns.refresh_seconds = 3600
+        with django_assert_num_queries(1):
+            found, _ = search(api_client)
+        assert len(found) == 3
+
+    def test_stats(self, api_client, make_trip, columns):
+        assert columns.stats() == {'loaded': False}
+        make_trip()
+        search(api_client)
+        stats = columns.stats()
+        assert stats['trips'] == 1
+        assert stats['memory_bytes'] == 2 * 8 + 5 * 4
+        assert 0 <= stats['staleness_seconds'] < 60
@@ -0,0 +1,73 @@
+"""
+Tests for the reservation listing and passenger manifest of a trip (/trips/<id>/reservations/).
+"""
+import csv
+import io
+import json
+
+import pytest
+from django.urls import reverse
+from rest_framework import status
+
+from api.pagination import KeysetPagination
+from api.tests.conftest import book, cancel
+
+pytestmark = [pytest.mark.django_db, pytest.mark.urls('EcoTrajet.urls')]
+
+
+@pytest.fixture
+def booked_trip(make_trip, make_user):
+    trip = make_trip(places_dispo=6)
+    for n in range(5):
+        book(make_user(prenom=f'P{n}', telephone=f'060000000{n}'), trip.pk)
+    return trip
+
+
+def url(trip):
+    return reverse('trip-reservations', kwargs={'trip_id': trip.pk})
+
+
+def content(response):
+    return b''.join(response.streaming_content).decode()
+
+
+class TestTripReservations:
+    """Only the driver of the trip sees its reservations; an unknown trip is a 404."""
+
+    def test_only_the_driver(self, api_client, booked_trip, make_user, driver):
+        api_client.force_authenticate(user=make_user())
+        assert api_client.get(url(booked_trip)).status_code == status.HTTP_403_FORBIDDEN
+        api_client.force_authenticate(user=driver)
+        missing = reverse('trip-reservations', kwargs={'trip_id': 999_999})
+        assert api_client.get(missing).status_code == status.HTTP_404_NOT_FOUND
+
+    def test_cursor_pages(self, api_client, booked_trip, driver, monkeypatch, django_assert_num_queries):
+        monkeypatch.setattr(KeysetPagination, 'page_size', 2)
+        api_client.force_authenticate(user=driver)
+        ids = []
+        response = api_client.get(url(booked_trip), {'pagination': 'cursor'})
+        while True:
+            ids += [row['id'] for row in response.data['results']]
+            if not response.data['next']:
+                break
+            # Propriété du trajet, puis la page
+            with django_assert_num_queries(2):
+                response = api_client.get(response.data['next'])
+        assert ids == sorted(ids) and len(ids) == 5
+
+    def test_csv_manifest(self, api_client, booked_trip, driver, make_user, django_assert_num_queries):
+        cancel(book(make_user(), booked_trip.pk))
+        api_client.force_authenticate(user=driver)
+        with django_assert_num_queries(2):
+            response = api_client.get(url(booked_trip), {'manifest': 'csv', 'statut': 'CONFIRMED'})
+            rows = list(csv.DictReader(io.StringIO(content(response))))
+        assert response['Content-Type'].startswith('text/csv')
+        assert [(row['prenom'], row['telephone']) for row in rows] == [(f'P{n}', f'060000000{n}') for n in range(5)]
+
+    def test_json_manifest(self, api_client, booked_trip, driver):
+        api_client.force_authenticate(user=driver)
+        rows = json.loads(content(api_client.get(url(booked_trip), {'manifest': 'json'})))
+        assert [row['prenom'] for row in rows] == [f'P{n}' for n in range(5)]
+        assert json.loads(content(api_client.get(url(booked_trip), {'manifest': 'json', 'statut': 'PENDING'}))) == []
+        response = api_client.get(url(booked_trip), {'manifest': 'xml'})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
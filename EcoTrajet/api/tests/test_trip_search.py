@@ -0,0 +1,124 @@
+"""
+Tests for the trip search filters of TripListView.
+"""
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+
+from api.models import Reservation, Trip
+from api.utils import normalize_place
+
+pytestmark = [pytest.mark.django_db, pytest.mark.urls('EcoTrajet.urls')]
+
+
+def result_ids(response):
+    return {trip['id'] for trip in response.data['results']}
+
+
+class TestNormalizePlace:
+    """Tests for normalize_place."""
+
+    def test_accents_case_and_spaces(self):
+        assert normalize_place("  Évry   Courcouronnes ") == 'evry courcouronnes'
+        assert normalize_place('SAINT-ÉTIENNE') == 'saint-etienne'
+
+    def test_empty(self):
+        assert normalize_place(None) == ''
+        assert normalize_place('') == ''
+
+
+class TestTripNormalizedFields:
+    """Tests for the normalized columns maintained by Trip.save."""
+
+    def test_save_fills_normalized_places(self, make_trip):
+        trip = make_trip(origine='Orléans ', destination='Besançon')
+        assert trip.origine_norm == 'orleans'
+        assert trip.destination_norm == 'besancon'
+
+    def test_update_fields_keeps_normalized_places_in_sync(self, make_trip):
+        trip = make_trip()
+        trip.origine = 'Nîmes'
+        trip.save(update_fields=['origine'])
+        trip.refresh_from_db()
+        assert trip.origine_norm == 'nimes'
+
+
+class TestTripSearch:
+    """Tests for the search parameters of /api/trips/."""
+
+    def test_no_filters_lists_everything(self, api_client, make_trip):
+        trips = [make_trip(), make_trip(origine='Lille')]
+        response = api_client.get(reverse('trip-list'))
+        assert response.status_code == status.HTTP_200_OK
+        assert result_ids(response) == {t.id for t in trips}
+
+    def test_reservation_count_is_annotated(self, api_client, make_trip, make_user, django_assert_num_queries):
+        booked, empty = make_trip(places_dispo=4), make_trip()
+        for statut in ('PENDING', 'CONFIRMED', 'CANCELLED'):
+            Reservation.objects.create(passenger=make_user(), trip=booked, place_reserv=1, statut=statut)
+        # Comptage puis page, sans requête sur les réservations
+        with django_assert_num_queries(2):
+            response = api_client.get(reverse('trip-list'))
+        counts = {trip['id']: trip['reservation_count'] for trip in response.data['results']}
+        assert counts == {booked.id: 2, empty.id: 0}
+
+    def test_origin_destination_are_normalized(self, api_client, make_trip):
+        match = make_trip(origine='Saint-Étienne', destination='Lyon')
+        make_trip(origine='Paris', destination='Lyon')
+        response = api_client.get(reverse('trip-list'), {
+            'origin': ' saint-etienne', 'destination': 'LYON',
+        })
+        assert result_ids(response) == {match.id}
+
+    def test_departure_date_selects_the_whole_day(self, api_client, make_trip):
+        day = timezone.localdate() + timedelta(days=3)
+        noon = timezone.make_aware(datetime(day.year, day.month, day.day, 12))
+        match = make_trip(temps_depart=noon)
+        make_trip(temps_depart=noon + timedelta(days=1))
+        make_trip(temps_depart=noon - timedelta(days=1))
+        response = api_client.get(reverse('trip-list'), {'departure_time': day.isoformat()})
+        assert result_ids(response) == {match.id}
+
+    def test_departure_window(self, api_client, make_trip):
+        now = timezone.now()
+        match = make_trip(temps_depart=now + timedelta(hours=5))
+        make_trip(temps_depart=now + timedelta(hours=1))
+        make_trip(temps_depart=now + timedelta(hours=10))
+        response = api_client.get(reverse('trip-list'), {
+            'departure_after': (now + timedelta(hours=2)).isoformat(),
+            'departure_before': (now + timedelta(hours=8)).isoformat(),
+        })
+        assert result_ids(response) == {match.id}
+
+    def test_status_seats_and_price(self, api_client, make_trip):
+        match = make_trip(places_dispo=3, prix=Decimal('15.00'))
+        make_trip(places_dispo=1, prix=Decimal('15.00'))
+        make_trip(places_dispo=3, prix=Decimal('40.00'))
+        make_trip(places_dispo=3, prix=Decimal('15.00'), statut='CANCELLED')
+        response = api_client.get(reverse('trip-list'), {
+            'status': 'SCHEDULED', 'min_seats': 2, 'max_price': '20',
+        })
+        assert result_ids(response) == {match.id}
+
+    @pytest.mark.parametrize('params', [
+        {'status': 'UNKNOWN'},
+        {'min_seats': 'deux'},
+        {'max_price': '-1'},
+        {'departure_time': 'demain'},
+        {'departure_time': '2024-02-30'},
+        {'departure_after': '2024-02-30T10:00'},
+        {'max_price': 'inf'},
+        {'max_price': 'nan'},
+    ])
+    def test_invalid_parameters(self, api_client, params):
+        response = api_client.get(reverse('trip-list'), params)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_search_indexes_declared(self):
+        index_fields = {tuple(index.fields) for index in Trip._meta.indexes}
+        assert ('statut', 'temps_depart') in index_fields
+        assert ('origine_norm', 'destination_norm', 'temps_depart') in index_fields
@@ -0,0 +1,135 @@
+"""
+Tests for the loaded values and the optimistic version check of trips and reservations.
+"""
+import pytest
+from django.db import transaction
+from django.urls import reverse
+from rest_framework import status
+
+from api.models import Reservation, Trip
+from api.tests.conftest import book, cancel, change_seats
+from api.tracking import ConcurrentModification
+
+pytestmark = [pytest.mark.django_db, pytest.mark.urls('EcoTrajet.urls')]
+
+
+class TestLoadedValues:
+    """Instances know the values they were loaded with."""
+
+    def test_loaded_and_saved_values(self, make_trip, passenger):
+        trip = make_trip(places_dispo=3)
+        loaded = Trip.objects.get(pk=trip.pk)
+        assert (loaded.loaded('places_dispo'), loaded.loaded('statut')) == (3, 'SCHEDULED')
+        reservation = Reservation.objects.only('id', 'statut').get(pk=book(passenger, trip.pk).pk)
+        assert reservation.loaded('place_reserv') is None
+        assert reservation.loaded('statut') == 'CONFIRMED'
+        cancel(reservation)
+        assert reservation.loaded('statut') == 'CANCELLED'
+
+    def test_transition_without_reading_the_row(self, make_trip, passenger, django_assert_num_queries):
+        trip = make_trip(places_dispo=3)
+        reservation = Reservation.objects.get(pk=book(passenger, trip.pk).pk)
+        # Verrou de la réservation, places du trajet, document, liste d'attente, réservation
+        with django_assert_num_queries(5):
+            cancel(reservation)
+        assert Trip.objects.get(pk=trip.pk).places_dispo == 3
+
+
+class TestVersions:
+    """Every write increments the version; a write based on an older one is refused."""
+
+    def test_concurrent_saves(self, make_trip):
+        trip = make_trip()
+        first, second = Trip.objects.get(pk=trip.pk), Trip.objects.get(pk=trip.pk)
+        first.prix = 25
+        first.save()
+        assert first.version == 2
+        second.prix = 30
+        # Le conflit annule la transaction englobante : point de sauvegarde
+        with pytest.raises(ConcurrentModification), transaction.atomic():
+            second.save()
+        assert second.version == 1
+        assert Trip.objects.get(pk=trip.pk).prix == 25
+
+    def test_set_based_writes_increment_the_version(self, make_trip, passenger):
+        trip = make_trip(places_dispo=3)
+        reservation = book(passenger, trip.pk)
+        stale = Trip.objects.get(pk=trip.pk)
+        change_seats(reservation, 2)
+        stale.prix = 25
+        with pytest.raises(ConcurrentModification), transaction.atomic():
+            stale.save()
+        assert Trip.objects.get(pk=trip.pk).places_dispo == 1
+
+
+@pytest.mark.django_db(transaction=True)
+class TestDetailViews:
+    """A PATCH sending the version it read is refused once the row changed."""
+
+    def test_stale_trip_patch_is_a_conflict(self, api_client, driver, make_trip):
+        trip = make_trip()
+        url = reverse('trip-detail', kwargs={'pk': trip.pk})
+        api_client.force_authenticate(user=driver)
+        version = api_client.get(url).data['version']
+        response = api_client.patch(url, {'prix': '25.00', 'version': version}, format='json')
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['version'] == version + 1
+        response = api_client.patch(url, {'prix': '30.00', 'version': version}, format='json')
+        assert response.status_code == status.HTTP_409_CONFLICT
+        assert response.data['detail'].code == 'stale_version'
+        assert Trip.objects.get(pk=trip.pk).prix == 25
+
+    def test_stale_reservation_patch_is_a_conflict(self, api_client, make_trip, passenger):
+        trip = make_trip(places_dispo=3)
+        reservation = Reservation.objects.create(passenger=passenger, trip=trip)
+        url = reverse('reservation-detail', kwargs={'pk': reservation.pk})
+        api_client.force_authenticate(user=passenger)
+        read = api_client.get(url).data['version']
+        change_seats(reservation, 2)
+        response = api_client.patch(url, {'statut': 'CONFIRMED', 'version': read}, format='json')
+        assert response.status_code == status.HTTP_409_CONFLICT
+        assert Reservation.objects.get(pk=reservation.pk).statut == 'PENDING'
+        assert Trip.objects.get(pk=trip.pk).places_dispo == 1
+        response = api_client.patch(url, {'statut': 'CONFIRMED', 'version': read + 1}, format='json')
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['version'] == read + 2
+
+    def test_update_without_version_is_refused(self, api_client, driver, make_trip):
+        trip = make_trip()
+        url = reverse('trip-detail', kwargs={'pk': trip.pk})
+        api_client.force_authenticate(user=driver)
+        response = api_client.patch(url, {'prix': '25.00'}, format='json')
+        assert response.status_code == status.HTTP_428_PRECONDITION_REQUIRED
+        assert response.data['detail'].code == 'version_required'
+        response = api_client.patch(url, {'prix': '25.00'}, format='json', HTTP_IF_MATCH='"1"')
+        assert response.status_code == status.HTTP_200_OK
+        response = api_client.patch(url, {'prix': '30.00'}, format='json', HTTP_IF_MATCH='W/"1"')
+        assert response.status_code == status.HTTP_409_CONFLICT
+        assert Trip.objects.get(pk=trip.pk).prix == 25
+
+    def test_capacity_change_applies_to_the_seats_read(self, api_client, driver, make_trip, passenger):
+        trip = make_trip(places_dispo=3)
+        url = reverse('trip-detail', kwargs={'pk': trip.pk})
+        api_client.force_authenticate(user=driver)
+        read = api_client.get(url).data['version']
+        book(passenger, trip.pk, seats=2)
+        response = api_client.patch(url, {'places_dispo': 5, 'version': read}, format='json')
+        assert response.status_code == status.HTTP_409_CONFLICT
+        assert Trip.objects.get(pk=trip.pk).places_dispo == 1
+        response = api_client.patch(url, {'places_dispo': 3, 'version': read + 1}, format='json')
+        assert response.status_code == status.HTTP_200_OK
+        assert Trip.objects.get(pk=trip.pk).places_dispo == 3
+
+    def test_maintained_fields_are_not_writable(self, api_client, make_trip, passenger, make_user):
+        trip, other = make_trip(places_dispo=3), make_trip()
+        api_client.force_authenticate(user=passenger)
+        response = api_client.post(reverse('reservation-list'), {
+            'trip': trip.pk, 'passenger': make_user().pk, 'version': 7, 'statut': 'CONFIRMED',
+        }, format='json')
+        assert response.status_code == status.HTTP_201_CREATED
+        assert (response.data['passenger'], response.data['version']) == (passenger.pk, 1)
+        url = reverse('reservation-detail', kwargs={'pk': response.data['id']})
+        response = api_client.patch(url, {'trip': other.pk, 'place_reserv': 2, 'version': 1}, format='json')
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['trip'] == trip.pk
+        assert Trip.objects.get(pk=trip.pk).places_dispo == 1
@@ -0,0 +1,170 @@
+"""
+Tests for the waitlist of full trips and its promotion when seats are freed.
+"""
+from datetime import timedelta
+
+import pytest
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+
+from api import booking
+from api.models import Reservation, Trip, TripSearchDocument, WaitlistEntry
+from api.tests.conftest import book, change_seats
+
+pytestmark = [pytest.mark.django_db, pytest.mark.urls('EcoTrajet.urls')]
+
+
+@pytest.fixture
+def full_trip(make_trip, make_user):
+    trip = make_trip(places_dispo=2)
+    book(make_user(), trip.pk, seats=2)
+    return trip
+
+
+@pytest.fixture
+def join(api_client):
+    def _join(user, trip, seats=1):
+        api_client.force_authenticate(user=user)
+        return api_client.post(
+            reverse('waitlistentry-list'), {'trip': trip.pk, 'place_reserv': seats}, format='json',
+        )
+    return _join
+
+
+def statuses(trip):
+    return list(WaitlistEntry.objects.filter(trip=trip).values_list('statut', flat=True))
+
+
+class TestWaitlist:
+    """Passengers queue on full trips and are served first come, first served."""
+
+    def test_join_and_positions(self, api_client, join, full_trip, make_trip, make_user, django_assert_num_queries):
+        first, second = make_user(), make_user()
+        response = join(first, full_trip)
+        assert response.status_code == status.HTTP_201_CREATED
+        assert (response.data['statut'], response.data['position']) == ('WAITING', 1)
+        assert join(second, full_trip).data['position'] == 2
+        assert join(second, full_trip).status_code == status.HTTP_400_BAD_REQUEST
+        other_trip = make_trip(places_dispo=1)
+        book(make_user(), other_trip.pk)
+        for user in (make_user(), make_user(), second, make_user()):
+            join(user, other_trip)
+        join(second, make_trip())
+        with django_assert_num_queries(2):
+            response = api_client.get(reverse('waitlistentry-list'))
+        assert [entry['position'] for entry in response.data['results']] == [2, 3, None]
+
+    def test_leaving_keeps_positions_dense(self, api_client, join, full_trip, make_user, django_assert_num_queries):
+        users = [make_user() for _ in range(6)]
+        for user in users:
+            join(user, full_trip)
+        entries = {entry.passenger_id: entry for entry in WaitlistEntry.objects.all()}
+        # Sorties sans renumérotation : les numéros gardent des trous
+        for user in (users[1], users[4]):
+            api_client.force_authenticate(user=user)
+            response = api_client.delete(reverse('waitlistentry-detail', kwargs={'pk': entries[user.pk].pk}))
+            assert response.status_code == status.HTTP_204_NO_CONTENT
+        positions = {}
+        for user in (users[0], users[2], users[3], users[5]):
+            entry = WaitlistEntry.objects.get(pk=entries[user.pk].pk)
+            # Inscriptions en attente jusqu'au numéro de l'inscription (déjà lu)
+            with django_assert_num_queries(1):
+                positions[user] = entry.queue_position()
+        assert list(positions.values()) == [1, 2, 3, 4]
+        change_seats(Reservation.objects.get(trip=full_trip), 1)
+        assert WaitlistEntry.objects.get(passenger=users[0]).statut == 'PROMOTED'
+        assert [WaitlistEntry.objects.get(passenger=user).queue_position() for user in (users[2], users[3], users[5])] == [
+            1, 2, 3,
+        ]
+        api_client.force_authenticate(user=users[1])
+        response = api_client.delete(reverse('waitlistentry-detail', kwargs={'pk': entries[users[1].pk].pk}))
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_driver_cannot_join(self, join, full_trip, driver):
+        assert join(driver, full_trip).status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_cancellation_promotes_the_head(self, full_trip, join, make_user):
+        first, second = make_user(), make_user()
+        join(first, full_trip)
+        join(second, full_trip)
+        change_seats(Reservation.objects.get(trip=full_trip), 1)
+        promoted = WaitlistEntry.objects.get(passenger=first)
+        assert promoted.statut == 'PROMOTED'
+        assert (promoted.reservation.passenger, promoted.reservation.statut) == (first, 'PENDING')
+        assert Trip.objects.get(pk=full_trip.pk).places_dispo == 0
+        assert WaitlistEntry.objects.get(passenger=second).queue_position() == 1
+
+    def test_head_blocks_the_queue_until_it_leaves(self, api_client, full_trip, join, make_user):
+        join(make_user(), full_trip, seats=2)
+        second = make_user()
+        join(second, full_trip)
+        change_seats(Reservation.objects.get(trip=full_trip), 1)
+        assert statuses(full_trip) == ['WAITING', 'WAITING']
+        head = WaitlistEntry.objects.first()
+        api_client.force_authenticate(user=head.passenger)
+        response = api_client.delete(reverse('waitlistentry-detail', kwargs={'pk': head.pk}))
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        assert statuses(full_trip) == ['CANCELLED', 'PROMOTED']
+        assert Reservation.objects.filter(trip=full_trip, passenger=second).exists()
+
+    def test_driver_adds_seats(self, full_trip, join, make_user):
+        for seats in (1, 2, 1):
+            join(make_user(), full_trip, seats=seats)
+        trip = Trip.objects.get(pk=full_trip.pk)
+        trip.places_dispo = 4
+        trip.save()
+        assert statuses(trip) == ['PROMOTED', 'PROMOTED', 'PROMOTED']
+        assert trip.places_dispo == Trip.objects.get(pk=trip.pk).places_dispo == 0
+
+    def test_driver_adds_seats_over_http(self, api_client, full_trip, join, make_user, driver):
+        first, second = make_user(), make_user()
+        join(first, full_trip, seats=2)
+        join(second, full_trip)
+        url = reverse('trip-detail', kwargs={'pk': full_trip.pk})
+        api_client.force_authenticate(user=driver)
+        read = api_client.get(url).data
+        response = api_client.patch(url, {'places_dispo': 2, 'version': read['version']}, format='json')
+        assert response.status_code == status.HTTP_200_OK
+        # La tête de file prend les deux places ajoutées, la suivante attend toujours
+        assert statuses(full_trip) == ['PROMOTED', 'WAITING']
+        assert Reservation.objects.filter(trip=full_trip, passenger=first, place_reserv=2).exists()
+        assert response.data['places_dispo'] == Trip.objects.get(pk=full_trip.pk).places_dispo == 0
+        assert response.data['version'] == Trip.objects.get(pk=full_trip.pk).version
+
+    def test_free_seats_are_taken_at_once(self, make_trip, join, make_user):
+        response = join(make_user(), make_trip())
+        assert response.data['statut'] == 'PROMOTED'
+        assert response.data['position'] is None
+
+    def test_expired_holds_promote(self, make_trip, make_user, join):
+        trip = make_trip(places_dispo=1)
+        Reservation.objects.create(passenger=make_user(), trip=trip, expires_at=timezone.now() - timedelta(seconds=1))
+        join(make_user(), trip)
+        assert booking.expire_holds() == 1
+        assert statuses(trip) == ['PROMOTED']
+        assert Trip.objects.get(pk=trip.pk).places_dispo == 0
+
+    def test_leaving_writes_only_the_entry(self, full_trip, join, make_user, django_assert_num_queries):
+        for _ in range(4):
+            join(make_user(), full_trip)
+        entries = list(WaitlistEntry.objects.order_by('seq'))
+        with django_assert_num_queries(1):
+            assert booking.leave_waitlist(entries[0])
+        assert not booking.leave_waitlist(entries[0])
+        assert list(WaitlistEntry.objects.filter(statut='WAITING').order_by('seq').values_list('seq', 'updated_at')) == [
+            (entry.seq, entry.updated_at) for entry in entries[1:]
+        ]
+        assert [entry.queue_position() for entry in entries[1:]] == [1, 2, 3]
+
+    def test_promotion_is_batched(self, full_trip, join, make_user, django_assert_num_queries):
+        for seats in (1, 1, 2, 1):
+            join(make_user(), full_trip, seats=seats)
+        Trip.objects.filter(pk=full_trip.pk).update(places_dispo=3)
+        TripSearchDocument.objects.filter(trip=full_trip).update(places_dispo=3)
+        # Entrées de tête et places libres, places prises (trajet, document), réservations, entrées
+        with django_assert_num_queries(5):
+            assert booking.promote_waitlist(full_trip.pk) == 2
+        assert statuses(full_trip) == ['PROMOTED', 'PROMOTED', 'WAITING', 'WAITING']
+        assert Trip.objects.get(pk=full_trip.pk).places_dispo == 1
+        assert Reservation.objects.filter(trip=full_trip, statut='PENDING', expires_at__isnull=False).count() == 2
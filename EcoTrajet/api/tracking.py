@@ -0,0 +1,108 @@
+"""
+Change tracking of model instances.
+
+``LoadedValuesModel`` remembers the field values an instance was loaded
+with (``from_db``), so that a ``save`` can tell which fields changed, and
+from what, without reading the row again. The values are refreshed by
+``remember_values`` once the subclass has acted on the change, typically at
+the end of its ``save``.
+
+``TrackedModel`` also adds a ``version`` column for optimistic concurrency control: every
+``save`` of an existing row increments it and only writes the row if it
+still holds the version of the instance (``UPDATE ... WHERE version = n``).
+A client sending the version it read with its changes therefore gets a
+``ConcurrentModification`` (409) instead of overwriting a newer write; an
+update sent without a version is refused with ``VersionRequired`` (428).
+Like an integrity error, the conflict is found by the write itself and
+dooms the enclosing transaction: a caller that wants to carry on wraps the
+``save`` in a savepoint. Set-based updates of tracked rows must increment
+the version as well.
+"""
+from django.db import models
+from django.db.models import F
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class ConcurrentModification(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Cet objet a été modifié entre-temps, veuillez le recharger."
+    default_code = 'stale_version'
+
+
+class VersionRequired(APIException):
+    status_code = status.HTTP_428_PRECONDITION_REQUIRED
+    default_detail = "La version lue (champ version ou en-tête If-Match) est requise pour modifier cet objet."
+    default_code = 'version_required'
+
+
+def next_version():
+    """Expression incrementing the version of the rows of a set-based update."""
+    return F('version') + 1
+
+
+class LoadedValuesModel(models.Model):
+    # Valeurs en base connues de l'instance, par attname (vide pour une nouvelle instance)
+    _loaded_values = {}
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def loaded(self, attname, default=None):
+        """Value of ``attname`` in the database when the instance was loaded or last saved."""
+        return self._loaded_values.get(attname, default)
+
+    def remember_values(self, fields=None):
+        """Record the current values of ``fields`` (all of them by default) as stored."""
+        if fields is None:
+            attnames = [field.attname for field in self._meta.concrete_fields]
+        else:
+            attnames = [self._meta.get_field(name).attname for name in fields]
+        # Les champs différés non chargés restent inconnus
+        values = {name: self.__dict__[name] for name in attnames if name in self.__dict__}
+        self._loaded_values = {**self._loaded_values, **values}
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        self.remember_values(fields)
+
+
+class TrackedModel(LoadedValuesModel):
+    version = models.PositiveIntegerField(
+        default=1,
+        help_text="Incrémentée à chaque modification (contrôle de concurrence optimiste)"
+    )
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            super().save(*args, **kwargs)
+            return
+        # La version de l'instance est celle attendue en base (cf. _do_update)
+        expected = self.version
+        self.version = expected + 1
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+        try:
+            super().save(*args, **kwargs)
+        except ConcurrentModification:
+            self.version = expected
+            raise
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        if self._state.adding or not values:
+            return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+        if base_qs.filter(pk=pk_val, version=self.version - 1)._update(values):
+            return True
+        # Ligne absente : save() se replie sur un INSERT, comme sans contrôle de version
+        if base_qs.filter(pk=pk_val).exists():
+            raise ConcurrentModification()
+        return False
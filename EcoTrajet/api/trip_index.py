@@ -0,0 +1,247 @@
+"""
+In-process columnar index of the upcoming scheduled trips (optional, see
+the ``TRIP_COLUMN_INDEX`` setting).
+
+Each worker holds the scheduled trips departing after ``floor`` (shortly
+before the last full load) in NumPy arrays sorted by (departure, id): departure, price,
+free seats, origin and destination place ids and community id. A search is
+two bisections for the departure window plus vectorized masks for the other
+criteria; the ORM only loads the rows of the page returned, by primary key.
+
+Readers never lock: they take a reference to the current snapshot, which is
+immutable. Refreshes build a new snapshot from the trips changed since the
+last one (``Trip.updated_at`` feed: api.booking changes the seats with
+queryset UPDATEs that also set ``updated_at``) and swap the reference, at
+most every ``refresh_seconds`` and by one request at a time.
+"""
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.utils import timezone
+
+from .journeys import SYNC_OVERLAP
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+NO_ID = -1
+
+
+def to_micros(moment):
+    """Aware datetime -> microseconds since the epoch (exact)."""
+    return (moment - EPOCH) // timedelta(microseconds=1)
+
+
+def _ids(values):
+    """Foreign key values, NO_ID for NULL."""
+    return (NO_ID if value is None else value for value in values)
+
+
+class TripColumns:
+    """Immutable column arrays of one state of the index."""
+
+    columns = ('id', 'depart', 'price', 'seats', 'origin', 'destination', 'community')
+
+    def __init__(self, arrays, floor, synced_at):
+        self.arrays = arrays
+        self.floor = floor
+        self.synced_at = synced_at
+        for name, array in arrays.items():
+            array.flags.writeable = False
+            setattr(self, name, array)
+
+    def __len__(self):
+        return len(self.id)
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self.arrays.values())
+
+    @classmethod
+    def from_rows(cls, rows, floor, synced_at):
+        """Build from ``(id, depart, prix, places_dispo, origin, destination, community)`` rows."""
+        rows = list(rows)
+        count = len(rows)
+        ids, departs, prices, seats, origins, destinations, communities = zip(*rows) if rows else [()] * 7
+        arrays = {
+            'id': np.fromiter(ids, np.int64, count),
+            'depart': np.fromiter(map(to_micros, departs), np.int64, count),
+            'price': np.fromiter((round(price * 100) for price in prices), np.int32, count),
+            'seats': np.fromiter(seats, np.int32, count),
+            'origin': np.fromiter(_ids(origins), np.int32, count),
+            'destination': np.fromiter(_ids(destinations), np.int32, count),
+            'community': np.fromiter(_ids(communities), np.int32, count),
+        }
+        order = np.lexsort((arrays['id'], arrays['depart']))
+        return cls({name: arrays[name][order] for name in cls.columns}, floor, synced_at)
+
+    def merged(self, removed_ids, added, synced_at):
+        """New snapshot without ``removed_ids`` and with the (sorted) ``added`` snapshot."""
+        keep = ~np.isin(self.id, removed_ids) if len(removed_ids) else np.ones(len(self), dtype=bool)
+        kept = {name: array[keep] for name, array in self.arrays.items()}
+        # Position d'insertion sur (départ, id) : bissection sur le départ puis
+        # départage des égalités par l'id
+        positions = np.searchsorted(kept['depart'], added.depart, side='left')
+        for index, (depart, trip_id) in enumerate(zip(added.depart, added.id)):
+            position = positions[index]
+            while (position < len(kept['id']) and kept['depart'][position] == depart
+                   and kept['id'][position] < trip_id):
+                position += 1
+            positions[index] = position
+        arrays = {
+            name: np.insert(kept[name], positions, added.arrays[name]) for name in self.columns
+        }
+        return TripColumns(arrays, self.floor, synced_at)
+
+
+class HydratedIds:
+    """
+    Sequence over an array of primary keys whose slices are loaded with a
+    single ``in_bulk`` query, so that a paginator only reads the page shown.
+    """
+
+    def __init__(self, ids, model):
+        self.ids = ids
+        self.model = model
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        ids = self.ids[index].tolist()
+        rows = self.model.objects.in_bulk(ids)
+        # Lignes supprimées depuis le dernier rafraîchissement de l'index ignorées
+        return [rows[pk] for pk in ids if pk in rows]
+
+
+class TripColumnIndex:
+    """Per-worker columnar index of the upcoming scheduled trips."""
+
+    fields = (
+        'id', 'temps_depart', 'prix', 'places_dispo', 'origine_place_id',
+        'destination_place_id', 'communaute_id', 'statut',
+    )
+    refresh_seconds = 1.0
+    full_reload_seconds = 600
+    # Les recherches « à partir de maintenant » restent couvertes entre deux chargements
+    history = timedelta(hours=1)
+
+    def __init__(self):
+        self._refresh_lock = threading.Lock()
+        self._snapshot = None
+        self._reloaded_at = 0.0
+        self._discarded = set()
+
+    def __len__(self):
+        snapshot = self._snapshot
+        return 0 if snapshot is None else len(snapshot)
+
+    # Rafraîchissement
+
+    def _queryset(self):
+        from .models import Trip
+
+        return Trip.objects.order_by()
+
+    def reload(self):
+        """Load every scheduled trip departing after ``history`` ago."""
+        started = timezone.now()
+        floor = started - self.history
+        rows = self._queryset().filter(statut='SCHEDULED', temps_depart__gte=floor).values_list(*self.fields[:-1])
+        snapshot = TripColumns.from_rows(rows.iterator(chunk_size=10_000), floor, started)
+        self._snapshot = snapshot
+        self._reloaded_at = time.monotonic()
+        self._discarded = set()
+
+    def sync(self):
+        """Apply the trips changed since the current snapshot was taken."""
+        snapshot = self._snapshot
+        if snapshot is None or time.monotonic() - self._reloaded_at > self.full_reload_seconds:
+            self.reload()
+            return
+        started = timezone.now()
+        discarded, self._discarded = self._discarded, set()
+        changed = list(self._queryset().filter(
+            updated_at__gte=snapshot.synced_at - SYNC_OVERLAP
+        ).values_list(*self.fields))
+        removed = np.array(sorted(discarded.union(row[0] for row in changed)), dtype=np.int64)
+        added = TripColumns.from_rows(
+            [row[:-1] for row in changed if row[-1] == 'SCHEDULED' and row[1] >= snapshot.floor],
+            snapshot.floor, started,
+        )
+        self._snapshot = snapshot.merged(removed, added, started)
+
+    def snapshot(self):
+        """Current snapshot, refreshed first if older than ``refresh_seconds``."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._refresh_lock:
+                if self._snapshot is None:
+                    self.reload()
+            return self._snapshot
+        if (timezone.now() - snapshot.synced_at).total_seconds() > self.refresh_seconds:
+            # Un seul rafraîchissement à la fois ; les autres requêtes lisent
+            # l'état courant pendant ce temps
+            if self._refresh_lock.acquire(blocking=False):
+                try:
+                    self.sync()
+                finally:
+                    self._refresh_lock.release()
+        return self._snapshot
+
+    def discard(self, trip_id):
+        """Forget a hard-deleted trip at the next refresh (deletes leave no updated_at)."""
+        self._discarded.add(trip_id)
+
+    def invalidate(self):
+        self._snapshot = None
+
+    def stats(self):
+        """Size, memory footprint and staleness of the current snapshot."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return {'loaded': False}
+        return {
+            'loaded': True,
+            'trips': len(snapshot),
+            'memory_bytes': snapshot.nbytes,
+            'floor': snapshot.floor,
+            'synced_at': snapshot.synced_at,
+            'staleness_seconds': (timezone.now() - snapshot.synced_at).total_seconds(),
+        }
+
+    # Recherche
+
+    def search(self, after, before=None, origin=None, destination=None, min_seats=None,
+               max_price=None, community=None):
+        """
+        Ids of the matching trips in (departure, id) order, or None when the
+        index cannot answer (departure window starting before its floor).
+        """
+        snapshot = self.snapshot()
+        if after < snapshot.floor:
+            return None
+        depart = snapshot.depart
+        start = np.searchsorted(depart, to_micros(after), side='left')
+        end = len(depart) if before is None else np.searchsorted(depart, to_micros(before), side='left')
+        mask = None
+        for column, value, compare in (
+            (snapshot.origin, origin, np.equal),
+            (snapshot.destination, destination, np.equal),
+            (snapshot.community, community, np.equal),
+            (snapshot.seats, min_seats, np.greater_equal),
+            (snapshot.price, None if max_price is None else round(max_price * 100), np.less_equal),
+        ):
+            if value is None:
+                continue
+            if mask is None:
+                mask = compare(column[start:end], value)
+            else:
+                mask &= compare(column[start:end], value)
+        ids = snapshot.id[start:end]
+        return ids if mask is None else ids[mask]
+
+
+trip_columns = TripColumnIndex()
@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import VehiculeViewSet, RatingViewSet
+from .views import VehiculeViewSet, RatingViewSet, SavedSearchViewSet, WaitlistViewSet
 from django.urls import include, path
 from rest_framework.authtoken.views import obtain_auth_token
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
@@ -9,14 +9,24 @@ from rest_framework.routers import DefaultRouter
 
 from .views import (
     TripListView,
+    TripSearchView,
+    TripFacetsView,
     TripDetailView,
+    TripCancelView,
+    DriverDashboardView,
     ReservationListView,
     ReservationDetailView,
-    TripReservationsView
+    GroupReservationView,
+    PassengerItineraryView,
+    TripReservationsView,
+    PlaceAutocompleteView,
+    JourneyPlannerView,
 )
 router = DefaultRouter()
 router.register(r'vehicules', VehiculeViewSet)
 router.register(r'ratings', RatingViewSet)
+router.register(r'saved-searches', SavedSearchViewSet)
+router.register(r'waitlist', WaitlistViewSet)
 
 urlpatterns = [
     path('api/', include(router.urls)),
@@ -27,10 +37,18 @@ urlpatterns = [
     
     # Trip&Reservation
     path('trips/', TripListView.as_view(), name='trip-list'),
+    path('trips/search/', TripSearchView.as_view(), name='trip-search'),
+    path('trips/facets/', TripFacetsView.as_view(), name='trip-facets'),
+    path('trips/dashboard/', DriverDashboardView.as_view(), name='driver-dashboard'),
+    path('trips/cancel/', TripCancelView.as_view(), name='trip-cancel'),
     path('trips/<int:pk>/', TripDetailView.as_view(), name='trip-detail'),
     path('trips/<int:trip_id>/reservations/', TripReservationsView.as_view(), name='trip-reservations'),
     path('reservations/', ReservationListView.as_view(), name='reservation-list'),
+    path('reservations/itinerary/', PassengerItineraryView.as_view(), name='reservation-itinerary'),
+    path('reservations/group/', GroupReservationView.as_view(), name='reservation-group'),
     path('reservations/<int:pk>/', ReservationDetailView.as_view(), name='reservation-detail'),
     # Trip&Reservation
 
+    path('places/autocomplete/', PlaceAutocompleteView.as_view(), name='place-autocomplete'),
+    path('journeys/', JourneyPlannerView.as_view(), name='journey-planner'),
 ]
\ No newline at end of file
@@ -0,0 +1,13 @@
+import unicodedata
+
+
+def normalize_place(value):
+    """
+    Return the search form of a place name: accents removed, case folded
+    and whitespace collapsed, so "Évry ", "evry" and "EVRY" compare equal.
+    """
+    if not value:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', value)
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return ' '.join(stripped.casefold().split())
@@ -1,16 +1,44 @@
 
+import hashlib
+import math
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from urllib.parse import urlencode
+
 from rest_framework import viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework import generics, permissions, status
-from .models import Trip, Reservation
+from .models import Trip, Reservation, SavedSearch, TripSearchDocument, WaitlistEntry
 from django.shortcuts import get_object_or_404
 from rest_framework.permissions import IsAuthenticated
-from .models import Rating, User
-from django.db.models import Avg
+from rest_framework.exceptions import ValidationError
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .models import DriverRank, Rating, User, UserRatingStats, UserReputation
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Concat
 from user_management.models import Vehicule
+from .booking import cancel_trips, delete_reservation, leave_waitlist, promote_waitlist
+from .facets import facet_counts
+from .geo import within_radius
+from .idempotency import IdempotentCreateMixin
+from .journeys import stop_key, timetable
+from .leaderboard import MAX_TOP_DRIVERS, current_rank, top_ranks
+from .manifest import FORMATS as MANIFEST_FORMATS, stream_manifest
+from .pagination import KeysetPagination
+from .routes import within_corridor
+from .trip_index import HydratedIds, trip_columns
+from .places import place_index, trigram_search
+from .utils import normalize_place
 from .serializers import (
-    VehiculeSerializer, VehiculeCreateSerializer, RatingCreateSerializer, RatingSerializer, UserRatingStatsSerializer
+    VehiculeSerializer, VehiculeCreateSerializer, RatingCreateSerializer, RatingSerializer, UserRatingStatsSerializer,
+    RatingBulkCreateSerializer, DriverRankSerializer,
+    SavedSearchSerializer, WaitlistEntrySerializer,
 )
 
 #ViewSet pour la gestion des véhicules
@@ -66,19 +94,90 @@ class VehiculeViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
     
 
+#ViewSet pour les recherches enregistrées de l'utilisateur connecté
+class SavedSearchViewSet(viewsets.ModelViewSet):
+    """
+    CRUD on the saved searches of the current user, who gets a TripAlert
+    whenever a matching trip is posted (cf. api.alerts).
+    """
+    queryset = SavedSearch.objects.all()
+    serializer_class = SavedSearchSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return SavedSearch.objects.filter(user=self.request.user).select_related(
+            'origine_place', 'destination_place'
+        )
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+
+#ViewSet pour la liste d'attente des trajets complets
+class WaitlistViewSet(viewsets.ModelViewSet):
+    """
+    Waitlist entries of the current user. Joining a full trip queues the
+    passenger; the head of the queue becomes a pending reservation as soon as
+    seats are freed (cf. api.booking.promote_waitlist). Leaving cancels the entry.
+    """
+    queryset = WaitlistEntry.objects.all()
+    serializer_class = WaitlistEntrySerializer
+    permission_classes = [IsAuthenticated]
+    http_method_names = ['get', 'post', 'delete', 'head', 'options']
+
+    def get_queryset(self):
+        # Position : inscriptions en attente jusqu'au numéro de l'inscription, sur l'index (trip, seq)
+        ahead = WaitlistEntry.objects.filter(
+            trip=OuterRef('trip'), statut='WAITING', seq__lte=OuterRef('seq'),
+        ).order_by().values('trip').annotate(count=Count('pk')).values('count')
+        return WaitlistEntry.objects.filter(passenger=self.request.user).annotate(position=Subquery(ahead))
+
+    def perform_create(self, serializer):
+        try:
+            with transaction.atomic():
+                entry = serializer.save(passenger=self.request.user)
+                # Des places ont pu se libérer depuis que le trajet a été vu complet
+                promote_waitlist(entry.trip_id)
+        except IntegrityError:
+            raise ValidationError("Vous êtes déjà dans la liste d'attente de ce trajet.")
+        entry.refresh_from_db(fields=['statut', 'reservation', 'seq'])
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            if not leave_waitlist(instance):
+                raise ValidationError("Cette inscription n'est plus en attente.")
+            # La tête de file pouvait bloquer des demandes plus petites
+            promote_waitlist(instance.trip_id)
+
+
 #ViewSet pour la gestion des évaluations
 class RatingViewSet(viewsets.ModelViewSet):
     queryset = Rating.objects.all()
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-created_at', '-idRate')
     
     def get_serializer_class(self):
         if self.action == 'create':
             return RatingCreateSerializer
         return RatingSerializer
+
+    #Noms et trajet projetés par jointure : nombre de requêtes indépendant de la taille de la page
+    def with_labels(self, queryset):
+        return queryset.annotate(
+            reviewer_name=Concat('reviewer__prenom', Value(' '), 'reviewer__nom'),
+            rated_user_name=Concat('rated_user__prenom', Value(' '), 'rated_user__nom'),
+            trip_info=Concat('trip__origine', Value(' -> '), 'trip__destination'),
+        )
     
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        # Libellés relus : l'évaluation a pu changer d'utilisateur ou de trajet
+        serializer.instance = self.with_labels(Rating.objects.filter(pk=serializer.instance.pk)).get()
+
     #Filtrage des évaluations
     def get_queryset(self):
-        queryset = Rating.objects.all()
+        queryset = self.with_labels(Rating.objects.all())
         
         # Filtrer par utilisateur évalué
         rated_user_id = self.request.query_params.get('rated_user', None)
@@ -100,7 +199,7 @@ class RatingViewSet(viewsets.ModelViewSet):
         if min_score:
             queryset = queryset.filter(score__gte=min_score)
         
-        return queryset
+        return queryset.order_by(*self.keyset_ordering)
     
     #Statistiques d'évaluation pour un utilisateur
     @action(detail=False, methods=['get'])
@@ -111,34 +210,72 @@ class RatingViewSet(viewsets.ModelViewSet):
                 {'error': 'user_id parameter is required'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
-        user = get_object_or_404(User, id=user_id)
-        ratings = Rating.objects.filter(rated_user=user)
-        
-        #Calcul des statistiques
-        avg_rating = ratings.aggregate(Avg('score'))['score__avg'] or 0
-        total_ratings = ratings.count()
-        
+        if not user_id.isdigit():
+            return Response({'error': 'user_id must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Utilisateur, statistiques maintenues à jour (cf. UserRatingStats) et réputation
+        # calculée chaque nuit (cf. UserReputation) : une lecture par clé primaire
+        user = get_object_or_404(User.objects.select_related('rating_stats', 'reputation'), pk=user_id)
+        try:
+            stats = user.rating_stats
+        except UserRatingStats.DoesNotExist:
+            stats = UserRatingStats(user=user)
+        try:
+            reputation = user.reputation
+        except UserReputation.DoesNotExist:
+            reputation = UserReputation(user=user)
+
         # Détail par score
-        ratings_detail = []
-        for score in range(1, 6):
-            count = ratings.filter(score=score).count()
-            ratings_detail.append({
+        ratings_detail = [
+            {
                 'score': score,
                 'count': count,
-                'percentage': round((count / total_ratings * 100) if total_ratings > 0 else 0, 2)
-            })
-        
-        data = {
-            'user_id': user.id,
-            'user_name': f"{user.first_name} {user.last_name}",
-            'average_rating': round(avg_rating, 2),
-            'total_ratings': total_ratings,
-            'ratings_detail': ratings_detail
-        }
-        
-        return Response(data)
+                'percentage': round((count / stats.rating_count * 100) if stats.rating_count > 0 else 0, 2)
+            }
+            for score, count in stats.histogram().items()
+        ]
+        serializer = UserRatingStatsSerializer({
+            'user_id': user.pk,
+            'user_name': f"{user.prenom} {user.nom}",
+            'average_rating': stats.average,
+            'total_ratings': stats.rating_count,
+            'ratings_detail': ratings_detail,
+            'reputation': reputation.score,
+        })
+        return Response(serializer.data)
     
+    #Rangs du classement demandé : ?community=<id>, classement global sinon
+    def leaderboard_ranks(self, request):
+        community = request.query_params.get('community')
+        if community is None:
+            return DriverRank.objects.filter(leaderboard__communaute__isnull=True)
+        if not community.isdigit():
+            raise ValidationError({'error': 'community must be an integer'})
+        return DriverRank.objects.filter(leaderboard__communaute=community)
+
+    #Meilleurs conducteurs : lecture des premières lignes de l'index des moyennes (cf. api.leaderboard)
+    @action(detail=False, methods=['get'])
+    def top_drivers(self, request):
+        limit = request.query_params.get('limit', '10')
+        if not limit.isdigit() or not 0 < int(limit) <= MAX_TOP_DRIVERS:
+            return Response(
+                {'error': f'limit must be between 1 and {MAX_TOP_DRIVERS}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        ranks = top_ranks(self.leaderboard_ranks(request).select_related('driver'), int(limit))
+        return Response(DriverRankSerializer(ranks, many=True).data)
+
+    #Rang d'un conducteur dans le classement, d'après les moyennes à jour
+    @action(detail=False, methods=['get'])
+    def driver_rank(self, request):
+        user_id = request.query_params.get('user_id')
+        if not user_id or not user_id.isdigit():
+            return Response({'error': 'user_id must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        ranks = self.leaderboard_ranks(request).select_related('driver', 'leaderboard')
+        rank = get_object_or_404(ranks, driver=user_id)
+        rank.rank, total_drivers = current_rank(rank)
+        return Response({**DriverRankSerializer(rank).data, 'total_drivers': total_drivers})
+
     #Récupérer toutes les évaluations d'un trajet
     @action(detail=False, methods=['get'])
     def trip_ratings(self, request):
@@ -149,37 +286,225 @@ class RatingViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        ratings = Rating.objects.filter(trip=trip_id)
+        ratings = self.with_labels(Rating.objects.filter(trip=trip_id))
         serializer = self.get_serializer(ratings, many=True)
         return Response(serializer.data)
     
-    #Créer plusieurs évaluations en une fois
+    #Créer plusieurs évaluations en une fois (une requête par vérification, une insertion, cf. create_ratings)
     @action(detail=False, methods=['post'])
     def bulk_create(self, request):
-        serializer = RatingCreateSerializer(data=request.data, many=True)
+        serializer = RatingBulkCreateSerializer(data=request.data, many=True)
         if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            try:
+                serializer.save()
+                return Response(serializer.data, status=status.HTTP_201_CREATED)
+            except IntegrityError:
+                # Lot enregistré en parallèle : doublons signalés comme à la validation
+                serializer = RatingBulkCreateSerializer(data=request.data, many=True)
+                if serializer.is_valid():
+                    raise ValidationError("Vous avez déjà évalué cet utilisateur pour ce trajet.")
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
 from .serializers import (
     TripListSerializer,
+    TripSearchDocumentSerializer,
     TripDetailSerializer,
     TripWriteSerializer,
+    TripCancellationSerializer,
+    DriverDashboardTripSerializer,
+    ItineraryReservationSerializer,
     ReservationListSerializer,
     ReservationDetailSerializer,
     ReservationWriteSerializer,
-    ReservationNestedSerializer
+    ReservationNestedSerializer,
+    GroupReservationSerializer,
 )
 
-class TripListView(generics.ListCreateAPIView):
+class TripFilterMixin:
+    """Search parameters shared by the trip listings (see TripListView)."""
+
+    def filter_trips(self, queryset, params, default_status=None):
+        """Apply the place, departure window, status, seats and price filters."""
+        # Filtrer par lieux : lieu canonique si le texte est connu (cf. trip_place_depart_idx),
+        # sinon forme normalisée du texte saisi (cf. trip_route_depart_idx)
+        queryset = self._filter_place(queryset, params, 'origin', 'origine')
+        queryset = self._filter_place(queryset, params, 'destination', 'destination')
+
+        # Filtrer par fenêtre de départ
+        start, end = self._departure_window(params)
+        if start is not None:
+            queryset = queryset.filter(temps_depart__gte=start)
+        if end is not None:
+            queryset = queryset.filter(temps_depart__lt=end)
+
+        # Filtrer par statut
+        trip_status = params.get('status', default_status)
+        if trip_status:
+            if trip_status not in dict(Trip.STATUS_CHOICES):
+                raise ValidationError({'status': f"Statut inconnu : {trip_status}"})
+            queryset = queryset.filter(statut=trip_status)
+
+        # Filtrer par places libres et prix maximum
+        min_seats = params.get('min_seats')
+        if min_seats:
+            queryset = queryset.filter(places_dispo__gte=self._parse_number(min_seats, 'min_seats', int))
+        max_price = params.get('max_price')
+        if max_price:
+            queryset = queryset.filter(prix__lte=self._parse_number(max_price, 'max_price', Decimal))
+
+        # Filtrer par communauté
+        community = params.get('community')
+        if community:
+            queryset = queryset.filter(communaute=self._parse_number(community, 'community', int))
+        return queryset
+
+    def _filter_place(self, queryset, params, param, field):
+        place_id = params.get(f'{param}_place')
+        if place_id:
+            return queryset.filter(**{f'{field}_place': self._parse_number(place_id, f'{param}_place', int)})
+        text = params.get(param)
+        if not normalize_place(text):
+            return queryset
+        place_id = place_index.resolve(text)
+        if place_id is not None:
+            return queryset.filter(**{f'{field}_place': place_id})
+        return queryset.filter(**{f'{field}_norm': normalize_place(text)})
+
+    @staticmethod
+    def _parse_number(value, name, cast):
+        try:
+            number = cast(value)
+            negative = number < 0
+            if not math.isfinite(number):
+                raise ValueError
+        except (ValueError, ArithmeticError):
+            raise ValidationError({name: "Valeur numérique attendue"})
+        if negative:
+            raise ValidationError({name: "La valeur doit être positive"})
+        return number
+
+    @staticmethod
+    def _parse_moment(value, name, end_of_day=False):
+        """Parse an ISO datetime or date into an aware datetime."""
+        try:
+            moment = parse_datetime(value)
+            day = parse_date(value) if moment is None else None
+        except ValueError:
+            # Format correct mais date inexistante (ex. 2024-02-30)
+            moment = day = None
+        if moment is None:
+            if day is None:
+                raise ValidationError({name: "Date ou date-heure ISO attendue"})
+            if end_of_day:
+                day += timedelta(days=1)
+            moment = datetime.combine(day, time.min)
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return moment
+
+    def _departure_window(self, params):
+        """Return the [start, end) departure window requested, either bound may be None."""
+        start = end = None
+        departure_time = params.get('departure_time')
+        if departure_time:
+            start = self._parse_moment(departure_time, 'departure_time')
+            day = timezone.localtime(start).date() + timedelta(days=1)
+            end = timezone.make_aware(datetime.combine(day, time.min))
+        departure_after = params.get('departure_after')
+        if departure_after:
+            start = self._parse_moment(departure_after, 'departure_after')
+        departure_before = params.get('departure_before')
+        if departure_before:
+            end = self._parse_moment(departure_before, 'departure_before', end_of_day=True)
+        return start, end
+
+
+def with_reservation_count(trips):
+    """Annotate ``reservation_count``, the active (pending or confirmed) reservations of each trip, in SQL."""
+    active = Reservation.objects.filter(
+        trip=OuterRef('pk'), statut__in=['PENDING', 'CONFIRMED'],
+    ).order_by().values('trip').annotate(count=Count('pk')).values('count')
+    return trips.annotate(reservation_count=Coalesce(Subquery(active), 0))
+
+
+class TripListView(TripFilterMixin, IdempotentCreateMixin, generics.ListCreateAPIView):
     """
-    GET: List all trips
-    POST: Create new trip (driver only)
+    GET: List trips, optionally filtered by the search parameters below
+    POST: Create new trip (driver only), idempotent with an Idempotency-Key header
+
+    Search parameters (all optional):
+        origin, destination: place names, matched case- and accent-insensitively,
+            through the Place table (aliases included) when the name is known
+        origin_place, destination_place: Place ids
+        origin_lat, origin_lon, origin_radius_km: departures within the radius (default 10 km)
+        destination_lat, destination_lon, destination_radius_km: same for arrivals
+        pickup_lat, pickup_lon, dropoff_lat, dropoff_lon, corridor_km: trips whose
+            route passes within corridor_km (default 5) of the pickup, then of the drop-off
+        departure_time: a date (the whole day) or a datetime (until the end of that day)
+        departure_after, departure_before: explicit departure window (ISO datetimes)
+        status: one of Trip.STATUS_CHOICES
+        min_seats: minimum number of free seats
+        max_price: price ceiling per passenger
+        community: Community id
+
+    Add ?pagination=cursor for keyset pages without a total count.
+    Each trip carries its number of active (pending or confirmed) reservations.
     """
-    queryset = Trip.objects.select_related('conducteur', 'communaute').prefetch_related('reservations')
+    queryset = Trip.objects.select_related('conducteur', 'communaute')
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-temps_depart', '-id')
+    default_radius_km = 10
+    max_radius_km = 200
+    default_corridor_km = 5
+    max_corridor_km = 30
+
+    def get_queryset(self):
+        params = self.request.query_params
+        queryset = self.filter_trips(super().get_queryset(), params)
+
+        # Recherche par rayon autour d'un point (départ et/ou arrivée), bornée en SQL
+        for param, field in (('origin', 'origine'), ('destination', 'destination')):
+            point = self._parse_point(params, param)
+            if point is not None:
+                queryset = within_radius(queryset, field, *point)
+
+        # Trajets passant près du point de prise en charge puis du point de dépose
+        corridor = {
+            'radius_param': 'corridor_km',
+            'default_radius': self.default_corridor_km,
+            'max_radius': self.max_corridor_km,
+        }
+        pickup = self._parse_point(params, 'pickup', **corridor)
+        dropoff = self._parse_point(params, 'dropoff', **corridor)
+        if (pickup is None) != (dropoff is None):
+            raise ValidationError({'pickup': "pickup_* et dropoff_* vont ensemble"})
+        if pickup is not None:
+            queryset = within_corridor(queryset, pickup[:2], dropoff[:2], pickup[2])
+
+        return with_reservation_count(queryset)
+
+    def _parse_point(self, params, param, radius_param=None, default_radius=None, max_radius=None):
+        """Return (lat, lon, radius_km) for the <param>_lat/_lon/_radius_km parameters, or None."""
+        radius_param = radius_param or f'{param}_radius_km'
+        default_radius = default_radius or self.default_radius_km
+        max_radius = max_radius or self.max_radius_km
+        lat, lon = params.get(f'{param}_lat'), params.get(f'{param}_lon')
+        if lat is None and lon is None:
+            return None
+        if lat is None or lon is None:
+            raise ValidationError({param: f"{param}_lat et {param}_lon vont ensemble"})
+        try:
+            lat, lon = float(lat), float(lon)
+        except ValueError:
+            raise ValidationError({param: "Coordonnées numériques attendues"})
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise ValidationError({param: "Coordonnées hors limites"})
+        radius = self._parse_number(params.get(radius_param, default_radius), radius_param, float)
+        if not 0 < radius <= max_radius:
+            raise ValidationError({radius_param: f"Rayon entre 0 et {max_radius} km"})
+        return lat, lon, radius
 
     def get_serializer_class(self):
         if self.request.method == 'POST':
@@ -189,10 +514,110 @@ class TripListView(generics.ListCreateAPIView):
     def perform_create(self, serializer):
         serializer.save(conducteur=self.request.user)
 
+class TripSearchView(TripFilterMixin, generics.ListAPIView):
+    """
+    GET: Trip search results read from the denormalized TripSearchDocument
+    table (one indexed scan, no join), in departure order.
+
+    Accepts the origin/destination, *_place, departure_time, departure_after,
+    departure_before, status (SCHEDULED by default), min_seats, max_price and
+    community parameters of TripListView, and ?pagination=cursor.
+    ?sort=reputation ranks the drivers with the best nightly reputation
+    (api.reputation) first, then by departure.
+
+    With the TRIP_COLUMN_INDEX setting, page-number searches of upcoming
+    trips on known places are answered by the in-process columnar index
+    (api.trip_index) and only the page is read from the database; the
+    X-Index-Staleness header then gives the age of the index in seconds.
+    """
+    queryset = TripSearchDocument.objects.all()
+    serializer_class = TripSearchDocumentSerializer
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = KeysetPagination
+    orderings = {
+        'depart': ('temps_depart', 'trip_id'),
+        'reputation': ('-driver_reputation', 'temps_depart', 'trip_id'),
+    }
+
+    @property
+    def keyset_ordering(self):
+        return self.orderings[self.sort]
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.sort = request.query_params.get('sort', 'depart')
+        if self.sort not in self.orderings:
+            raise ValidationError({'sort': "Valeurs possibles : depart, reputation."})
+
+    def get_queryset(self):
+        params = self.request.query_params
+        self.index_staleness = None
+        # L'index en colonnes ne connaît que l'ordre des départs
+        if settings.TRIP_COLUMN_INDEX and self.sort == 'depart' and not KeysetPagination.wants_keyset(self.request):
+            ids = self._search_columns(params)
+            if ids is not None:
+                self.index_staleness = trip_columns.stats()['staleness_seconds']
+                return HydratedIds(ids, TripSearchDocument)
+        queryset = self.filter_trips(super().get_queryset(), params, 'SCHEDULED')
+        return queryset.order_by(*self.keyset_ordering)
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if self.index_staleness is not None:
+            response['X-Index-Staleness'] = f"{self.index_staleness:.3f}"
+        return response
+
+    def _search_columns(self, params):
+        """Matching ids from the columnar index, or None when it cannot answer."""
+        if params.get('status', 'SCHEDULED') != 'SCHEDULED':
+            return None
+        start, end = self._departure_window(params)
+        if start is None:
+            return None
+        criteria = {}
+        for param in ('origin', 'destination'):
+            place_id = params.get(f'{param}_place')
+            if place_id:
+                criteria[param] = self._parse_number(place_id, f'{param}_place', int)
+            elif normalize_place(params.get(param)):
+                # Lieu inconnu : seule la forme normalisée, absente de l'index, permet de filtrer
+                criteria[param] = place_index.resolve(params[param])
+                if criteria[param] is None:
+                    return None
+        for param, cast in (('min_seats', int), ('max_price', Decimal), ('community', int)):
+            if params.get(param):
+                criteria[param] = self._parse_number(params[param], param, cast)
+        return trip_columns.search(start, end, **criteria)
+
+
+class TripFacetsView(TripFilterMixin, generics.GenericAPIView):
+    """
+    GET: Facet counts of the trips matching the TripSearchView parameters
+    (price histogram, departure hours, free seats, communities, vehicle
+    sizes), computed in one aggregate query and cached for a short while.
+    """
+    queryset = Trip.objects.all()
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = None
+    cache_seconds = 30
+
+    def get(self, request):
+        params = request.query_params
+        query = urlencode(sorted((key, value) for key, values in params.lists() for value in values))
+        key = 'trips:facets:' + hashlib.md5(query.encode()).hexdigest()
+        facets = cache.get(key)
+        if facets is None:
+            facets = facet_counts(self.filter_trips(self.get_queryset(), params, 'SCHEDULED'))
+            cache.set(key, facets, self.cache_seconds)
+        return Response(facets)
+
+
 class TripDetailView(generics.RetrieveUpdateDestroyAPIView):
     """
     GET: Retrieve trip details
-    PUT/PATCH: Update trip (driver only)
+    PUT/PATCH: Update trip (driver only) with the ``version`` read (field or If-Match
+        header): 428 without it, 409 if it is not the current one. Seats added
+        to ``places_dispo`` go to the waitlist first (cf. api.booking.promote_waitlist)
     DELETE: Cancel trip (driver only)
     """
     queryset = Trip.objects.select_related('conducteur').prefetch_related('reservations')
@@ -209,9 +634,23 @@ class TripDetailView(generics.RetrieveUpdateDestroyAPIView):
         return [permissions.IsAuthenticatedOrReadOnly()]
 
     def perform_destroy(self, instance):
-        """Soft delete by changing status to CANCELLED"""
-        instance.statut = 'CANCELLED'
-        instance.save()
+        """Soft delete: the trip and its reservations are cancelled, passengers refunded and notified"""
+        cancel_trips([instance.pk])
+
+
+class TripCancelView(generics.GenericAPIView):
+    """
+    POST: Cancel several trips of the driver at once (e.g. a recurring trip),
+    with their reservations, in a fixed number of queries (cf. api.booking.cancel_trips)
+    """
+    serializer_class = TripCancellationSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        trips, reservations = cancel_trips(serializer.validated_data['trips'])
+        return Response({'trips': trips, 'reservations': reservations})
 
 class IsDriverOrReadOnly(permissions.BasePermission):
     """Custom permission to only allow drivers to edit their trips"""
@@ -220,13 +659,16 @@ class IsDriverOrReadOnly(permissions.BasePermission):
             return True
         return obj.conducteur == request.user
 
-class ReservationListView(generics.ListCreateAPIView):
+class ReservationListView(IdempotentCreateMixin, generics.ListCreateAPIView):
     """
     GET: List all reservations
-    POST: Create new reservation
+    POST: Create new reservation (retries with the same Idempotency-Key header
+        replay the first response)
     """
     serializer_class = ReservationListSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-created_at', '-id')
 
     def get_queryset(self):
         # Users can only see their own reservations
@@ -243,10 +685,64 @@ class ReservationListView(generics.ListCreateAPIView):
         # Automatically set passenger to current user
         serializer.save(passenger=self.request.user)
 
+class PassengerItineraryView(generics.ListAPIView):
+    """
+    GET ?when=upcoming|past: Reservations of the passenger on trips to come
+    (soonest first, the default) or already departed (latest first), with
+    keyset pagination on the departure of their trip. The trip, driver and
+    vehicle summaries come from the search documents of the page, read in
+    one query: two queries per page whatever the history of the passenger,
+    plus the count of page-number pagination.
+    """
+    serializer_class = ItineraryReservationSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    orderings = {'upcoming': ('depart', 'id'), 'past': ('-depart', '-id')}
+
+    @property
+    def keyset_ordering(self):
+        return self.orderings[self.when]
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.when = request.query_params.get('when', 'upcoming')
+        if self.when not in self.orderings:
+            raise ValidationError({'when': "Valeurs possibles : upcoming, past."})
+
+    def get_queryset(self):
+        now = timezone.now()
+        queryset = Reservation.objects.filter(passenger=self.request.user).annotate(depart=F('trip__temps_depart'))
+        if self.when == 'upcoming':
+            queryset = queryset.filter(depart__gte=now)
+        else:
+            queryset = queryset.filter(depart__lt=now)
+        return queryset.order_by(*self.keyset_ordering)
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset())
+        summaries = {
+            document.trip_id: document
+            for document in TripSearchDocument.objects.filter(trip_id__in={reservation.trip_id for reservation in page})
+        }
+        for reservation in page:
+            reservation.summary = summaries.get(reservation.trip_id)
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+
+class GroupReservationView(IdempotentCreateMixin, generics.CreateAPIView):
+    """
+    POST: Reserve seats for several passengers and/or trips (e.g. a journey
+    with a connection) in one request, all or nothing (cf. api.booking.book_group)
+    """
+    serializer_class = GroupReservationSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+
 class ReservationDetailView(generics.RetrieveUpdateDestroyAPIView):
     """
     GET: Retrieve reservation details
-    PATCH: Update reservation status
+    PATCH: Update reservation status with the ``version`` read (field or If-Match
+        header): 428 without it, 409 if it is not the current one
     DELETE: Cancel reservation
     """
     queryset = Reservation.objects.select_related('trip', 'passenger')
@@ -264,10 +760,7 @@ class ReservationDetailView(generics.RetrieveUpdateDestroyAPIView):
 
     def perform_destroy(self, instance):
         """Handle seat availability when cancelling"""
-        if instance.statut == 'CONFIRMED':
-            instance.trip.places_dispo += instance.place_reserv
-            instance.trip.save()
-        instance.delete()
+        delete_reservation(instance)
 
 class IsPassengerOrDriver(permissions.BasePermission):
     """Allow passengers to modify their reservations or drivers to modify reservations for their trips"""
@@ -276,14 +769,159 @@ class IsPassengerOrDriver(permissions.BasePermission):
             return True
         return obj.passenger == request.user or obj.trip.conducteur == request.user
 
+class DriverDashboardView(generics.ListAPIView):
+    """
+    GET: Upcoming trips of the driver with their reservation figures
+    (pending and confirmed reservations, seats sold, expected revenue,
+    unanswered requests), computed by conditional aggregation in the query
+    listing the trips: one query per page whatever the number of trips,
+    plus the count of page-number pagination. Ordered by departure, cursor
+    pagination with ?pagination=cursor.
+    """
+    serializer_class = DriverDashboardTripSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('temps_depart', 'id')
+
+    def get_queryset(self):
+        now = timezone.now()
+        pending = Q(reservations__statut='PENDING')
+        confirmed = Q(reservations__statut='CONFIRMED')
+        seats_sold = Coalesce(Sum('reservations__place_reserv', filter=confirmed), Value(0))
+        return (
+            Trip.objects.filter(conducteur=self.request.user, temps_depart__gte=now)
+            .exclude(statut='CANCELLED')
+            .annotate(
+                pending_count=Count('reservations', filter=pending),
+                confirmed_count=Count('reservations', filter=confirmed),
+                seats_sold=seats_sold,
+                # Demandes encore en attente d'une réponse (blocage non expiré)
+                unanswered_requests=Count('reservations', filter=pending & Q(reservations__expires_at__gt=now)),
+            )
+            .annotate(expected_revenue=ExpressionWrapper(
+                F('prix') * F('seats_sold'), output_field=DecimalField(max_digits=10, decimal_places=2),
+            ))
+            .order_by(*self.keyset_ordering)
+        )
+
+
+class IsTripDriver(permissions.BasePermission):
+    """Only the driver of the trip of the URL, checked with one query on the trip primary key (404 if unknown)"""
+    message = "Seul le conducteur du trajet peut consulter ses réservations."
+
+    def has_permission(self, request, view):
+        trip = get_object_or_404(Trip.objects.only('conducteur_id'), pk=view.kwargs['trip_id'])
+        return trip.conducteur_id == request.user.pk
+
+
 class TripReservationsView(generics.ListAPIView):
-    """List all reservations for a specific trip (driver only)"""
+    """
+    List the reservations of a trip (driver only) by creation date, cursor
+    pagination with ?pagination=cursor. ?manifest=csv|json streams the whole
+    passenger manifest instead, with names and contact data read in one
+    joined query (cf. api.manifest). ?statut= filters both.
+    """
     serializer_class = ReservationNestedSerializer
-    permission_classes = [permissions.IsAuthenticated, IsDriverOrReadOnly]
+    permission_classes = [permissions.IsAuthenticated, IsTripDriver]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('created_at', 'id')
 
     def get_queryset(self):
-        trip_id = self.kwargs['trip_id']
-        return Reservation.objects.filter(
-            trip__id=trip_id
-        ).select_related('passenger')
+        queryset = Reservation.objects.filter(trip_id=self.kwargs['trip_id']).order_by(*self.keyset_ordering)
+        statut = self.request.query_params.get('statut')
+        if statut:
+            queryset = queryset.filter(statut=statut)
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        fmt = request.query_params.get('manifest')
+        if fmt is None:
+            return super().list(request, *args, **kwargs)
+        if fmt not in MANIFEST_FORMATS:
+            raise ValidationError({'manifest': "Format attendu : csv ou json."})
+        response = StreamingHttpResponse(
+            stream_manifest(self.get_queryset(), fmt), content_type=MANIFEST_FORMATS[fmt],
+        )
+        response['Content-Disposition'] = f'attachment; filename="trajet-{self.kwargs["trip_id"]}-passagers.{fmt}"'
+        return response
+
+
+class PlaceAutocompleteView(generics.GenericAPIView):
+    """
+    GET ?q=<texte>&limit=<n>: places whose name or alias has a word starting
+    with q, served from the in-process index, completed by a trigram search
+    on PostgreSQL when there are not enough prefix matches.
+    """
+    permission_classes = [permissions.AllowAny]
+    pagination_class = None
+    max_limit = 20
+
+    def get(self, request):
+        query = request.query_params.get('q', '')
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), self.max_limit)
+        except ValueError:
+            limit = 10
+        results = [
+            {'id': place['id'], 'name': place['name'], 'slug': place['slug']}
+            for place in place_index.search(query, limit)
+        ]
+        if len(results) < limit:
+            results += trigram_search(query, exclude=[p['id'] for p in results], limit=limit - len(results))
+        return Response({'results': results})
+
+
+class JourneyPlannerView(generics.GenericAPIView):
+    """
+    GET ?from=<lieu>&to=<lieu>&depart_after=<ISO>&seats=<n>&max_legs=<1-3>:
+    journeys chaining up to three scheduled trips with free seats, each
+    connection leaving at least min_transfer minutes after the previous arrival.
+    """
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = None
+    min_transfer_minutes = 15
+    horizon_hours = 24
+
+    def get(self, request):
+        params = request.query_params
+        origin, destination = self._stop(params, 'from'), self._stop(params, 'to')
+        depart_after = timezone.now()
+        if params.get('depart_after'):
+            depart_after = TripListView._parse_moment(params['depart_after'], 'depart_after')
+        seats = TripListView._parse_number(params.get('seats', 1), 'seats', int)
+        max_legs = TripListView._parse_number(params.get('max_legs', 3), 'max_legs', int)
+        min_transfer = TripListView._parse_number(
+            params.get('min_transfer', self.min_transfer_minutes), 'min_transfer', int
+        )
+        if not 1 <= max_legs <= 3:
+            raise ValidationError({'max_legs': "Entre 1 et 3 trajets"})
+        if seats < 1:
+            raise ValidationError({'seats': "Au moins une place"})
+
+        journeys = timetable.plan(
+            origin, destination, depart_after, seats=seats, max_legs=max_legs,
+            min_transfer=timedelta(minutes=max(min_transfer, self.min_transfer_minutes)),
+            horizon=timedelta(hours=self.horizon_hours),
+        )
+        trip_ids = {trip_id for journey in journeys for trip_id in journey}
+        trips = with_reservation_count(Trip.objects.select_related('conducteur')).in_bulk(trip_ids)
+        results = []
+        for journey in journeys:
+            legs = [trips[trip_id] for trip_id in journey if trip_id in trips]
+            if len(legs) != len(journey):
+                continue
+            results.append({
+                'departure': legs[0].temps_depart,
+                'arrival': legs[-1].temps_arrive,
+                'transfers': len(legs) - 1,
+                'total_price': sum(leg.prix for leg in legs) * seats,
+                'legs': TripListSerializer(legs, many=True).data,
+            })
+        return Response({'results': results})
 
+    @staticmethod
+    def _stop(params, name):
+        text = params.get(name)
+        if not normalize_place(text):
+            raise ValidationError({name: "Paramètre obligatoire"})
+        return stop_key(place_index.resolve(text), normalize_place(text))
@@ -49,10 +49,11 @@ export const reservationService = {
     }
   },
 
-  // Update a reservation
-  updateReservation: async (reservationId, reservationData) => {
+  // Update a reservation: `version` is the one of the loaded reservation (details), required by the API
+  // so that a concurrent change is refused (409) instead of overwritten
+  updateReservation: async (reservationId, reservationData, version = reservationData.version) => {
     try {
-      const response = await axios.patch(`${API_BASE}/reservations/${reservationId}/`, reservationData, {
+      const response = await axios.patch(`${API_BASE}/reservations/${reservationId}/`, { ...reservationData, version }, {
         headers: {
           'Authorization': `Bearer ${localStorage.getItem('access_token')}`
         }
@@ -49,10 +49,11 @@ export const tripService = {
     }
   },
 
-  // Update a trip
-  updateTrip: async (tripId, tripData) => {
+  // Update a trip: `version` is the one of the loaded trip (details), required by the API
+  // so that a concurrent change is refused (409) instead of overwritten
+  updateTrip: async (tripId, tripData, version = tripData.version) => {
     try {
-      const response = await axios.patch(`${API_BASE}/trips/${tripId}/`, tripData, {
+      const response = await axios.patch(`${API_BASE}/trips/${tripId}/`, { ...tripData, version }, {
         headers: {
           'Authorization': `Bearer ${localStorage.getItem('access_token')}`
         }